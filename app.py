@@ -1,12 +1,22 @@
 import sys
 import os
-import json
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, jsonify, render_template, request
 from flask_cors import CORS
-from core.utils.monitor_system import start_monitor
+from core.utils.monitor_system import start_monitor, notify_new_messages, get_poll_stats
+from core.utils.secret_manager import get_setting
+from core.utils.log_manager.log_manager import log_error
+from core.utils.result_cache import get_email_result_json, result_cache
+from core.utils.work_queue import get_job_counts
+from core.ai.llm_cache import llm_cache_stats
+from core.ai.openai_client import openai_client_stats
+from core.ai.local_triage import triage_stats
+from core.ai.file_uploads import file_upload_stats
+from core.ai.extraction_validation import extraction_tier_stats
+from core.ai.model_router import model_router_stats
+from core.integrations.outlook.subscriptions import is_valid_client_state, mailbox_for_notification, start_subscription_manager
 from core.integrations.epicor.invoice_creator import create_invoice_in_epicor
 
 app = Flask(__name__)
@@ -15,33 +25,59 @@ CORS(app)
 
 @app.route('/health')
 def health():
-    return jsonify({"status": "ok"})
+    return jsonify({
+        "status": "ok",
+        "result_cache": result_cache.stats(),
+        "jobs": get_job_counts(),
+        "polling": get_poll_stats(),
+        "llm_cache": llm_cache_stats(),
+        "openai": openai_client_stats(),
+        "local_triage": triage_stats(),
+        "file_uploads": file_upload_stats(),
+        "extraction_tiers": extraction_tier_stats(),
+        "model_router": model_router_stats()
+    })
 
 
 @app.route('/api/email/<path:email_id>')
 def get_email_data(email_id):
-    file_path = os.path.join('emails_data', f"{email_id}.json")
+    # Hot results are served from memory; misses fall through to indexed store lookups
+    data = get_email_result_json(email_id)
     
-    if not os.path.exists(file_path):
-        id_mapping_path = os.path.join('emails_data', 'id_mapping.json')
-        if os.path.exists(id_mapping_path):
-            with open(id_mapping_path, 'r', encoding='utf-8') as f:
-                id_mapping = json.load(f)
-                
-                actual_id = id_mapping.get(email_id)
-                if not actual_id:
-                    actual_id = id_mapping.get(f"<{email_id}>")
-                
-                if actual_id:
-                    file_path = os.path.join('emails_data', f"{actual_id}.json")
-    
-    if not os.path.exists(file_path):
+    if data is None:
         return jsonify({"error": "Email not processed yet"}), 404
     
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    return Response(data, mimetype='application/json')
+
+
+@app.route('/api/graph/notifications', methods=['POST'])
+def graph_notifications():
+    # Subscription validation handshake: echo the token back as plain text within 10 seconds
+    validation_token = request.args.get('validationToken')
+    if validation_token:
+        return validation_token, 200, {'Content-Type': 'text/plain'}
+    
+    payload = request.get_json(silent=True) or {}
     
-    return jsonify(data)
+    messages = []
+    rejected = 0
+    for notification in payload.get('value', []):
+        if not is_valid_client_state(notification.get('clientState')):
+            rejected += 1
+            continue
+        message_id = (notification.get('resourceData') or {}).get('id')
+        if message_id:
+            messages.append((mailbox_for_notification(notification), message_id))
+    
+    if rejected:
+        # A forged post, or a subscription created under another secret that will never deliver again
+        log_error(f"Rejected {rejected} Graph notification(s) with an unexpected clientState",
+                 Exception("Graph notification clientState mismatch"))
+    
+    notify_new_messages(messages)
+    
+    # Graph retries anything slower than a few seconds, so only enqueue here and process in the monitor
+    return '', 202
 
 
 @app.route('/taskpane')
@@ -104,6 +140,10 @@ def import_invoice():
 if __name__ == '__main__':
     start_monitor()
     
+    notification_url = get_setting("Graph-Notification-URL")
+    if notification_url:
+        start_subscription_manager(notification_url)
+    
     cert_file = os.path.join(os.path.dirname(__file__), 'localhost.crt')
     key_file = os.path.join(os.path.dirname(__file__), 'localhost.key')
     
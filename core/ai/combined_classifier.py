@@ -0,0 +1,157 @@
+import sys
+import os
+import time
+import re
+from typing import Optional, List, Dict, Any, Tuple
+from pydantic import BaseModel
+from openai import AsyncOpenAI
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils.secret_manager import get_setting
+from core.ai.email_input import build_email_input
+from core.ai.classifier import (
+    EmailCategorization,
+    SYSTEM_PROMPT as CLASSIFICATION_PROMPT,
+    _report_categorization,
+    fallback_categorization
+)
+from core.ai.invoice_extractor import (
+    InvoiceData,
+    SYSTEM_PROMPT as EXTRACTION_PROMPT,
+    _report_invoice_data,
+    invoice_signature
+)
+from core.ai.extraction_validation import EXTRACTION_TIERS, validate_invoice_data, record_tier, note_validation
+from core.ai.llm_call import call_llm, call_llm_async
+
+
+MODEL = "gpt-5"
+
+
+class CombinedResult(BaseModel):
+    categorization: EmailCategorization
+    invoice_data: Optional[InvoiceData]
+
+
+SYSTEM_PROMPT = f"""
+
+    You classify an email and, when it is an invoice, extract its invoice data in the same response.
+    
+    **Step 1 - Classification** (fill `categorization`):
+    {CLASSIFICATION_PROMPT}
+    
+    **Step 2 - Extraction** (fill `invoice_data`):
+    Only when `categorization.email_type` is "new_invoice", extract the invoice as described below.
+    For every other category set `invoice_data` to null.
+    {EXTRACTION_PROMPT}
+    
+    """
+
+# Cheap hints that an email is probably an invoice; anything else keeps the two-call path
+INVOICE_HINT_PATTERN = re.compile(
+    r"\b(invoice|inv\s*[#:.-]?\s*\d|amount\s+due|balance\s+due|payment\s+due|remit(tance)?|bill\s+(no|number|#))",
+    re.IGNORECASE
+)
+
+
+def combined_mode_enabled() -> bool:
+    return get_setting("AI-Combined-Mode", "auto").lower() != "off"
+
+
+def looks_like_invoice(subject: str, body: str, attachments: Optional[List[Dict[str, Any]]] = None) -> bool:
+    filenames = " ".join(attachment.get('filename', '') for attachment in attachments or [])
+    return bool(INVOICE_HINT_PATTERN.search(f"{subject}\n{filenames}\n{body[:3000]}"))
+
+
+def build_combined_input(
+    sender_email: str,
+    sender_name: str,
+    subject: str,
+    body: str,
+    attachments: Optional[List[Dict[str, Any]]] = None,
+    inline_pdfs: bool = False
+) -> List[Dict[str, Any]]:
+    # Each PDF is sent once and serves both the classification and the extraction
+    return build_email_input(SYSTEM_PROMPT, "Please categorize this email and extract its invoice data if it is a new invoice:",
+                             "classify_extract", sender_email, sender_name, subject, body, attachments, inline_pdfs=inline_pdfs)
+
+
+def _report_combined(result: CombinedResult) -> Tuple[EmailCategorization, Optional[InvoiceData]]:
+    categorization = _report_categorization(result.categorization)
+    invoice_data = result.invoice_data if categorization.email_type == 'new_invoice' else None
+    if invoice_data:
+        _report_invoice_data(invoice_data)
+    return categorization, invoice_data
+
+
+def _check_invoice(effort: str, started: float, result: CombinedResult, last: bool) -> List[str]:
+    # The invoice goes through the same tiers and checks as a standalone extraction; a non-invoice is accepted as is
+    if result.invoice_data is None:
+        return []
+    problems = validate_invoice_data(result.invoice_data)
+    record_tier(effort, time.perf_counter() - started, problems)
+    if problems and not last:
+        print(f"   ⚠️ {effort} combined extraction failed validation ({'; '.join(problems)}), escalating")
+    return problems
+
+
+def _note_validation(result: CombinedResult, problems: List[str]) -> CombinedResult:
+    if result.invoice_data is not None:
+        note_validation(result.invoice_data, problems)
+    return result
+
+
+def _combined_signature(result: CombinedResult):
+    return result.categorization.email_type, invoice_signature(result.invoice_data)
+
+
+def classify_and_extract(
+    sender_email: str,
+    sender_name: str,
+    subject: str,
+    body: str,
+    attachments: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[EmailCategorization, Optional[InvoiceData]]:
+
+    try:
+        result = call_llm(
+            "classify_extract", MODEL, SYSTEM_PROMPT, CombinedResult,
+            lambda: build_combined_input(sender_email, sender_name, subject, body, attachments),
+            sender_email, subject, body, attachments,
+            efforts=EXTRACTION_TIERS,
+            check=_check_invoice,
+            finish=_note_validation,
+            signature=_combined_signature,
+            announce=f"\n📄 Classifying and extracting invoice data in one call..."
+        )
+        return _report_combined(result)
+    
+    except Exception as e:
+        return fallback_categorization(e), None
+
+
+async def classify_and_extract_async(
+    sender_email: str,
+    sender_name: str,
+    subject: str,
+    body: str,
+    attachments: Optional[List[Dict[str, Any]]] = None,
+    client: Optional[AsyncOpenAI] = None
+) -> Tuple[EmailCategorization, Optional[InvoiceData]]:
+
+    try:
+        result = await call_llm_async(
+            client, "classify_extract", MODEL, SYSTEM_PROMPT, CombinedResult,
+            lambda: build_combined_input(sender_email, sender_name, subject, body, attachments),
+            sender_email, subject, body, attachments,
+            efforts=EXTRACTION_TIERS,
+            check=_check_invoice,
+            finish=_note_validation,
+            signature=_combined_signature,
+            announce=f"\n📄 Classifying and extracting invoice data in one call..."
+        )
+        return _report_combined(result)
+    
+    except Exception as e:
+        return fallback_categorization(e), None
@@ -0,0 +1,90 @@
+import sys
+import os
+from typing import Optional, List, Dict, Any, Callable, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.integrations.outlook.attachments import pdf_content_block
+from core.ai.file_uploads import uploaded_file_id
+from core.ai.prompt_builder import fit_prompt
+
+
+def attachment_counts_note(pdf_count: int, image_count: int) -> str:
+    if pdf_count == 0 and image_count == 0:
+        return ""
+    return f"\n\n**Attachments:** {pdf_count} PDF(s), {image_count} image(s)"
+
+
+def attachment_content(
+    attachments: Optional[List[Dict[str, Any]]],
+    attachment_texts: List[Optional[str]],
+    inline_pdfs: bool = False
+) -> Tuple[List[Dict[str, Any]], int, int]:
+    # Returns the PDF content blocks plus the PDF and image counts; images are counted but not sent.
+    # inline_pdfs skips the Files API for requests that may run after an upload has expired, such as batch requests
+    blocks = []
+    pdf_count = 0
+    image_count = 0
+    
+    for index, attachment in enumerate(attachments or []):
+        filename = attachment.get('filename', 'unknown')
+        
+        if attachment.get('type') == 'image':
+            image_count += 1
+        
+        elif filename.lower().endswith('.pdf') and attachment.get('base64_data'):
+            pdf_count += 1
+            as_file = attachment_texts[index] is None
+            file_id = None if inline_pdfs else uploaded_file_id(attachment, as_file)
+            blocks.append(pdf_content_block(attachment, file_id, attachment_texts[index], as_file))
+    
+    return blocks, pdf_count, image_count
+
+
+def build_email_input(
+    system_prompt: str,
+    request: str,
+    task: str,
+    sender_email: str,
+    sender_name: str,
+    subject: str,
+    body: str,
+    attachments: Optional[List[Dict[str, Any]]] = None,
+    describe_attachments: Callable[[int, int], str] = attachment_counts_note,
+    inline_pdfs: bool = False
+) -> List[Dict[str, Any]]:
+
+    body_text, body_truncated, attachment_texts = fit_prompt(body, attachments, task)
+    
+    user_text = f"""
+    
+    {request}
+    
+    **From:** {sender_name} <{sender_email}>
+    **Subject:** {subject}
+    
+    **Body:**
+    
+    {body_text}
+    
+    """
+    
+    if body_truncated:
+        user_text += "\n\n[Body truncated for length]"
+    
+    user_content, pdf_count, image_count = attachment_content(attachments, attachment_texts, inline_pdfs)
+    user_content.append({
+        "type": "input_text",
+        "text": user_text + describe_attachments(pdf_count, image_count)
+    })
+    
+    return [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user",
+            "content": user_content
+        }
+    ]
@@ -0,0 +1,113 @@
+import sys
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils.secret_manager import get_setting
+
+
+# Reasoning efforts tried in order; the next tier only runs when the previous result fails validation
+EXTRACTION_TIERS = [
+    effort.strip() for effort in get_setting("Extraction-Tiers", "minimal,medium").split(",") if effort.strip()
+] or ["medium"]
+MIN_FIELD_CONFIDENCE = int(get_setting("Extraction-Min-Field-Confidence", 80))
+MIN_LINE_CONFIDENCE = int(get_setting("Extraction-Min-Line-Confidence", 70))
+TOTAL_TOLERANCE = float(get_setting("Extraction-Total-Tolerance", 0.01))
+# Tax, freight and fees are often not itemized; the lines may fall short of the total by this share if the notes say so
+UNITEMIZED_SHARE = float(get_setting("Extraction-Unitemized-Share", 0.25))
+UNITEMIZED_PATTERN = re.compile(r"\b(tax|vat|gst|hst|freight|shipping|delivery|fee|surcharge|discount)", re.IGNORECASE)
+DATE_FORMATS = ["%m/%d/%Y", "%Y-%m-%d", "%m-%d-%Y", "%m/%d/%y"]
+MAX_INVOICE_NUMBER_LENGTH = 50
+
+_stats_lock = threading.Lock()
+_tier_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def _close(a: float, b: float) -> bool:
+    return abs(a - b) <= max(0.02, abs(b) * TOTAL_TOLERANCE)
+
+
+def _parses_as_date(value: str) -> bool:
+    for date_format in DATE_FORMATS:
+        try:
+            parsed = datetime.strptime((value or "").strip(), date_format)
+        except ValueError:
+            continue
+        return 2000 <= parsed.year <= datetime.now().year + 1
+    return False
+
+
+def validate_invoice_data(invoice_data) -> List[str]:
+    problems = []
+    
+    if not invoice_data.invoice_number or len(invoice_data.invoice_number) > MAX_INVOICE_NUMBER_LENGTH:
+        problems.append("invoice_number: missing or too long")
+    if not _parses_as_date(invoice_data.invoice_date):
+        problems.append(f"invoice_date: '{invoice_data.invoice_date}' does not parse")
+    if invoice_data.invoice_total <= 0:
+        problems.append("invoice_total: not positive")
+    
+    for field in ("vendor_name", "invoice_number", "invoice_date", "invoice_total"):
+        confidence = getattr(invoice_data, f"{field}_confidence")
+        if confidence < MIN_FIELD_CONFIDENCE:
+            problems.append(f"confidence: {field} {confidence} below {MIN_FIELD_CONFIDENCE}")
+    
+    lines_total = 0.0
+    for number, item in enumerate(invoice_data.line_items, 1):
+        computed = item.quantity * item.unit_price
+        if item.line_total is not None and not _close(computed, item.line_total):
+            problems.append(f"line_math: line {number} {item.quantity} x {item.unit_price} != {item.line_total}")
+        if item.confidence < MIN_LINE_CONFIDENCE:
+            problems.append(f"line_confidence: line {number} {item.confidence} below {MIN_LINE_CONFIDENCE}")
+        lines_total += item.line_total if item.line_total is not None else computed
+    
+    if not invoice_data.line_items:
+        problems.append("line_items: none")
+    elif not _close(lines_total, invoice_data.invoice_total):
+        shortfall = invoice_data.invoice_total - lines_total
+        explained = (0 < shortfall <= invoice_data.invoice_total * UNITEMIZED_SHARE
+                     and UNITEMIZED_PATTERN.search(invoice_data.extraction_notes or ""))
+        if not explained:
+            problems.append(f"reconciliation: lines sum to {lines_total:.2f}, total is {invoice_data.invoice_total:.2f}")
+    
+    return problems
+
+
+def record_tier(effort: str, seconds: float, problems: List[str]):
+    with _stats_lock:
+        stats = _tier_stats.setdefault(effort, {"calls": 0, "accepted": 0, "seconds": 0.0, "failed_checks": {}})
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        if not problems:
+            stats["accepted"] += 1
+        for problem in problems:
+            # Problems read "<check>: <detail>"; the stats count checks, not individual values
+            check = problem.split(":", 1)[0]
+            stats["failed_checks"][check] = stats["failed_checks"].get(check, 0) + 1
+
+
+def note_validation(invoice_data, problems: List[str]):
+    # The last tier's result is kept even when it fails, so reviewers can see why it needs attention
+    if problems:
+        invoice_data.extraction_notes = f"{invoice_data.extraction_notes} [Validation failed: {'; '.join(problems)}]".strip()
+    return invoice_data
+
+
+def extraction_tier_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        tiers = {}
+        for effort, stats in _tier_stats.items():
+            tiers[effort] = {
+                "calls": stats["calls"],
+                "accepted": stats["accepted"],
+                "hit_rate": round(stats["accepted"] / stats["calls"], 3) if stats["calls"] else None,
+                "avg_latency_seconds": round(stats["seconds"] / stats["calls"], 2) if stats["calls"] else None,
+                "failed_checks": dict(stats["failed_checks"])
+            }
+    # Extractions settled before the last tier are the expensive calls that were avoided
+    avoided = sum(stats["accepted"] for effort, stats in tiers.items() if effort != EXTRACTION_TIERS[-1])
+    return {"tiers": EXTRACTION_TIERS, "avoided_last_tier": avoided, "stats": tiers}
@@ -0,0 +1,175 @@
+import sys
+import os
+import time
+import base64
+import threading
+from typing import Optional, Dict, Any, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils.secret_manager import get_setting
+from core.utils.email_store import get_connection
+from core.utils.log_manager.log_manager import log_error
+from core.ai.openai_client import get_openai_client
+from core.ai.llm_cache import attachment_digest
+
+
+FILE_UPLOADS_ENABLED = get_setting("OpenAI-File-Uploads", "true").lower() == "true"
+UPLOAD_TTL_SECONDS = float(get_setting("OpenAI-File-TTL-Hours", 24)) * 3600
+# A file this close to expiry is uploaded again rather than risk it vanishing mid-request
+EXPIRY_MARGIN_SECONDS = 600
+CLEANUP_EVERY_SECONDS = 600
+UPLOAD_PURPOSE = "user_data"
+
+_hash_locks: Dict[str, threading.Lock] = {}
+_hash_locks_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"uploads": 0, "reused": 0, "failures": 0, "deleted": 0}
+_last_cleanup = 0.0
+
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def _lock_for(content_hash: str) -> threading.Lock:
+    with _hash_locks_lock:
+        return _hash_locks.setdefault(content_hash, threading.Lock())
+
+
+def _is_uploadable(attachment: Dict[str, Any], as_file: bool = False) -> bool:
+    # PDFs with a usable text layer are sent as text and only need the file when that text cannot fit
+    filename = attachment.get('filename', '')
+    return filename.lower().endswith('.pdf') and bool(attachment.get('base64_data')) and (as_file or not attachment.get('text_layer'))
+
+
+def _usable(expires_at: float) -> bool:
+    return expires_at > time.time() + EXPIRY_MARGIN_SECONDS
+
+
+def _lookup(content_hash: str) -> Optional[Tuple[str, float]]:
+    row = get_connection().execute(
+        "SELECT file_id, expires_at FROM uploaded_files WHERE content_hash = ? AND expires_at > ?",
+        (content_hash, time.time() + EXPIRY_MARGIN_SECONDS)
+    ).fetchone()
+    return (row['file_id'], row['expires_at']) if row else None
+
+
+def _upload(content_hash: str, attachment: Dict[str, Any]) -> Tuple[str, float]:
+    content = base64.b64decode(attachment['base64_data'])
+    filename = attachment.get('filename') or 'attachment.pdf'
+    uploaded = get_openai_client().files.create(file=(filename, content, "application/pdf"), purpose=UPLOAD_PURPOSE)
+    
+    now = time.time()
+    connection = get_connection()
+    with connection:
+        existing = connection.execute(
+            "SELECT file_id, expires_at FROM uploaded_files WHERE content_hash = ?",
+            (content_hash,)
+        ).fetchone()
+        if existing and _usable(existing['expires_at']):
+            # Another node uploaded the same bytes meanwhile; keep theirs and drop ours
+            winner = existing['file_id']
+        else:
+            winner = uploaded.id
+            connection.execute(
+                """
+                INSERT INTO uploaded_files (content_hash, file_id, filename, size, uploaded_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(content_hash) DO UPDATE SET
+                    file_id = excluded.file_id,
+                    filename = excluded.filename,
+                    size = excluded.size,
+                    uploaded_at = excluded.uploaded_at,
+                    expires_at = excluded.expires_at
+                """,
+                (content_hash, uploaded.id, filename, len(content), now, now + UPLOAD_TTL_SECONDS)
+            )
+    if winner != uploaded.id:
+        _delete_remote(uploaded.id)
+        return winner, existing['expires_at']
+    if existing:
+        _delete_remote(existing['file_id'])
+    _count("uploads")
+    print(f"📤 Uploaded {filename} ({len(content) // 1024} KB) as {uploaded.id}")
+    return uploaded.id, now + UPLOAD_TTL_SECONDS
+
+
+def uploaded_file_id(attachment: Dict[str, Any], as_file: bool = False) -> Optional[str]:
+    # Returns the Files API id for the attachment, uploading it the first time its bytes are seen
+    if not FILE_UPLOADS_ENABLED or not _is_uploadable(attachment, as_file):
+        return None
+    # An attachment can outlive its upload, e.g. while a backfill waits on a batch, so the remembered id is re-checked
+    if attachment.get('file_id') and _usable(attachment.get('file_expires_at', 0)):
+        return attachment['file_id']
+    
+    content_hash = attachment_digest(attachment)
+    try:
+        with _lock_for(content_hash):
+            found = _lookup(content_hash)
+            if found:
+                _count("reused")
+            else:
+                found = _upload(content_hash, attachment)
+    except Exception as e:
+        # Without an id the caller falls back to sending the PDF inline
+        log_error(f"Failed to upload attachment {attachment.get('filename')}", e)
+        _count("failures")
+        return None
+    
+    attachment['file_id'], attachment['file_expires_at'] = found
+    _maybe_cleanup()
+    return attachment['file_id']
+
+
+def _delete_remote(file_id: str) -> bool:
+    try:
+        get_openai_client().files.delete(file_id)
+        _count("deleted")
+        return True
+    except Exception as e:
+        # Already gone is as good as deleted; anything else is retried on the next cleanup
+        if getattr(e, 'status_code', None) == 404:
+            return True
+        log_error(f"Failed to delete uploaded file {file_id}", e)
+        return False
+
+
+def cleanup_expired_uploads() -> int:
+    connection = get_connection()
+    rows = connection.execute("SELECT content_hash, file_id FROM uploaded_files WHERE expires_at <= ?", (time.time(),)).fetchall()
+    
+    removed = 0
+    for row in rows:
+        if _delete_remote(row['file_id']):
+            with connection:
+                connection.execute(
+                    "DELETE FROM uploaded_files WHERE content_hash = ? AND file_id = ?",
+                    (row['content_hash'], row['file_id'])
+                )
+            removed += 1
+    return removed
+
+
+def _maybe_cleanup():
+    global _last_cleanup
+    with _stats_lock:
+        if time.time() - _last_cleanup < CLEANUP_EVERY_SECONDS:
+            return
+        _last_cleanup = time.time()
+    # Remote deletes are slow; keep them off the request path
+    threading.Thread(target=cleanup_expired_uploads, name="file-upload-cleanup", daemon=True).start()
+
+
+def file_upload_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    row = get_connection().execute(
+        "SELECT COUNT(*) AS files, COALESCE(SUM(size), 0) AS size FROM uploaded_files WHERE expires_at > ?",
+        (time.time(),)
+    ).fetchone()
+    stats["enabled"] = FILE_UPLOADS_ENABLED
+    stats["active_files"] = row['files']
+    stats["active_bytes"] = row['size']
+    return stats
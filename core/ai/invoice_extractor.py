@@ -1,12 +1,18 @@
 import sys
 import os
+import time
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.utils.secret_manager import get_openai_secrets
+from core.ai.email_input import build_email_input
+from core.ai.extraction_validation import EXTRACTION_TIERS, validate_invoice_data, record_tier, note_validation
+from core.ai.llm_call import call_llm, call_llm_async
+
+
+MODEL = "gpt-5"
 
 
 class InvoiceLineItem(BaseModel):
@@ -31,19 +37,8 @@ class InvoiceData(BaseModel):
     extraction_notes: str
 
 
-def extract_invoice_data(
-    sender_email: str,
-    sender_name: str,
-    subject: str,
-    body: str,
-    attachments: Optional[List[Dict[str, Any]]] = None
-) -> Optional[InvoiceData]:
-    
-    api_key = get_openai_secrets()
-    client = OpenAI(api_key=api_key)
-    
-    system_prompt = """
-    
+SYSTEM_PROMPT = """
+
     You are an invoice data extraction AI. Your job is to extract structured invoice data from emails and attachments.
     
     **Extract the following header fields:**
@@ -73,89 +68,109 @@ def extract_invoice_data(
     
     """
 
-    user_text = f"""
-    
-    Please extract invoice data from this email:
 
-    **From:** {sender_name} <{sender_email}>
-    **Subject:** {subject}
+def _extraction_attachment_note(pdf_count: int, image_count: int) -> str:
+    if pdf_count == 0:
+        return ""
+    return f"\n\n**Attachments:** {pdf_count} PDF(s) attached - please analyze them for invoice data"
 
-    **Body:**
 
-    {body[:3000]}
-    
-    """
+def build_extraction_input(
+    sender_email: str,
+    sender_name: str,
+    subject: str,
+    body: str,
+    attachments: Optional[List[Dict[str, Any]]] = None,
+    inline_pdfs: bool = False
+) -> List[Dict[str, Any]]:
+    return build_email_input(SYSTEM_PROMPT, "Please extract invoice data from this email:", "extract",
+                             sender_email, sender_name, subject, body, attachments, _extraction_attachment_note,
+                             inline_pdfs=inline_pdfs)
 
-    if len(body) > 3000:
-        user_text += "\n\n[Body truncated for length]"
-    
-    user_content = []
+
+def _report_invoice_data(invoice_data: InvoiceData) -> InvoiceData:
+    print(f"\n✅ Invoice Data Extracted:")
+    print(f"   Vendor: {invoice_data.vendor_name} (confidence: {invoice_data.vendor_name_confidence}%)")
+    print(f"   Invoice #: {invoice_data.invoice_number} (confidence: {invoice_data.invoice_number_confidence}%)")
+    print(f"   Date: {invoice_data.invoice_date} (confidence: {invoice_data.invoice_date_confidence}%)")
+    print(f"   Total: ${invoice_data.invoice_total} (confidence: {invoice_data.invoice_total_confidence}%)")
+    print(f"   Line Items: {len(invoice_data.line_items)}")
     
-    attachment_note = ""
-    if attachments:
-        pdf_count = 0
-        
-        for attachment in attachments:
-            attachment_type = attachment.get('type')
-            filename = attachment.get('filename', 'unknown')
-            base64_data = attachment.get('base64_data', '')
-            
-            if filename.lower().endswith('.pdf') and base64_data:
-                pdf_count += 1
-                user_content.append({
-                    "type": "input_file",
-                    "filename": filename,
-                    "file_data": f"data:application/pdf;base64,{base64_data}"
-                })
-        
-        if pdf_count > 0:
-            attachment_note = f"\n\n**Attachments:** {pdf_count} PDF(s) attached - please analyze them for invoice data"
+    for i, item in enumerate(invoice_data.line_items, 1):
+        part_info = f"Part: {item.part_number} | " if item.part_number else ""
+        print(f"      {i}. {part_info}{item.line_description}")
+        print(f"         Qty: {item.quantity}, Price: ${item.unit_price}, Total: ${item.line_total or (item.quantity * item.unit_price)}")
+        print(f"         Confidence: {item.confidence}%")
     
-    user_content.append({
-        "type": "input_text",
-        "text": user_text + attachment_note
-    })
+    if invoice_data.extraction_notes:
+        print(f"   Notes: {invoice_data.extraction_notes}")
     
+    return invoice_data
+
+
+def _check_tier(effort: str, started: float, invoice_data: InvoiceData, last: bool) -> List[str]:
+    # Cheap tiers are accepted only when the numbers add up and every confidence clears its threshold
+    problems = validate_invoice_data(invoice_data)
+    record_tier(effort, time.perf_counter() - started, problems)
+    if problems and not last:
+        print(f"   ⚠️ {effort} extraction failed validation ({'; '.join(problems)}), escalating")
+    return problems
+
+
+def invoice_signature(invoice_data: Optional[InvoiceData]):
+    if invoice_data is None:
+        return None
+    return (invoice_data.invoice_number.strip().lower(), round(invoice_data.invoice_total, 2))
+
+
+def extract_invoice_data(
+    sender_email: str,
+    sender_name: str,
+    subject: str,
+    body: str,
+    attachments: Optional[List[Dict[str, Any]]] = None
+) -> Optional[InvoiceData]:
+
     try:
-        print(f"\n📄 Extracting invoice data from email...")
-        
-        response = client.responses.parse(
-            model="gpt-5",
-            input=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": user_content
-                }
-            ],
-            text_format=InvoiceData,
-            reasoning={"effort": "medium"}
+        invoice_data = call_llm(
+            "extract", MODEL, SYSTEM_PROMPT, InvoiceData,
+            lambda: build_extraction_input(sender_email, sender_name, subject, body, attachments),
+            sender_email, subject, body, attachments,
+            efforts=EXTRACTION_TIERS,
+            check=_check_tier,
+            finish=note_validation,
+            signature=invoice_signature,
+            announce=f"\n📄 Extracting invoice data from email..."
         )
-        
-        invoice_data = response.output_parsed
-        
-        print(f"\n✅ Invoice Data Extracted:")
-        print(f"   Vendor: {invoice_data.vendor_name} (confidence: {invoice_data.vendor_name_confidence}%)")
-        print(f"   Invoice #: {invoice_data.invoice_number} (confidence: {invoice_data.invoice_number_confidence}%)")
-        print(f"   Date: {invoice_data.invoice_date} (confidence: {invoice_data.invoice_date_confidence}%)")
-        print(f"   Total: ${invoice_data.invoice_total} (confidence: {invoice_data.invoice_total_confidence}%)")
-        print(f"   Line Items: {len(invoice_data.line_items)}")
-        
-        for i, item in enumerate(invoice_data.line_items, 1):
-            part_info = f"Part: {item.part_number} | " if item.part_number else ""
-            print(f"      {i}. {part_info}{item.line_description}")
-            print(f"         Qty: {item.quantity}, Price: ${item.unit_price}, Total: ${item.line_total or (item.quantity * item.unit_price)}")
-            print(f"         Confidence: {item.confidence}%")
-        
-        if invoice_data.extraction_notes:
-            print(f"   Notes: {invoice_data.extraction_notes}")
-        
-        return invoice_data
+        return _report_invoice_data(invoice_data)
     
     except Exception as e:
         print(f"\n❌ Error extracting invoice data: {e}")
         return None
 
+
+async def extract_invoice_data_async(
+    sender_email: str,
+    sender_name: str,
+    subject: str,
+    body: str,
+    attachments: Optional[List[Dict[str, Any]]] = None,
+    client: Optional[AsyncOpenAI] = None
+) -> Optional[InvoiceData]:
+
+    try:
+        invoice_data = await call_llm_async(
+            client, "extract", MODEL, SYSTEM_PROMPT, InvoiceData,
+            lambda: build_extraction_input(sender_email, sender_name, subject, body, attachments),
+            sender_email, subject, body, attachments,
+            efforts=EXTRACTION_TIERS,
+            check=_check_tier,
+            finish=note_validation,
+            signature=invoice_signature,
+            announce=f"\n📄 Extracting invoice data from email..."
+        )
+        return _report_invoice_data(invoice_data)
+    
+    except Exception as e:
+        print(f"\n❌ Error extracting invoice data: {e}")
+        return None
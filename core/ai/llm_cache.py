@@ -0,0 +1,167 @@
+import sys
+import os
+import re
+import json
+import time
+import base64
+import hashlib
+import threading
+from typing import Optional, List, Dict, Any, Type, TypeVar
+from pydantic import BaseModel
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils.secret_manager import get_setting
+from core.utils.email_store import get_connection
+from core.utils.log_manager.log_manager import log_error
+
+
+CACHE_ENABLED = get_setting("LLM-Cache", "true").lower() == "true"
+MAX_AGE_SECONDS = float(get_setting("LLM-Cache-Max-Age-Days", 30)) * 86400
+MAX_BYTES = float(get_setting("LLM-Cache-Max-MB", 256)) * 1024 * 1024
+# Eviction scans the table, so only run it every so many writes
+EVICT_EVERY_WRITES = 100
+
+SUBJECT_PREFIX_PATTERN = re.compile(r"^\s*((re|fw|fwd)\s*:\s*)+", re.IGNORECASE)
+
+T = TypeVar("T", bound=BaseModel)
+
+_stats_lock = threading.Lock()
+_hits: Dict[str, int] = {}
+_misses: Dict[str, int] = {}
+_writes = 0
+
+
+def prompt_version(system_prompt: str, response_model: Type[BaseModel]) -> str:
+    # Editing the prompt or the output schema changes the version, which retires every older entry
+    schema = json.dumps(response_model.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(f"{system_prompt}\0{schema}".encode('utf-8')).hexdigest()[:16]
+
+
+def normalize_subject(subject: str) -> str:
+    return " ".join(SUBJECT_PREFIX_PATTERN.sub("", subject or "").split())
+
+
+def normalize_body(body: str) -> str:
+    return " ".join((body or "").split())
+
+
+def attachment_digest(attachment: Dict[str, Any]) -> str:
+    base64_data = attachment.get('base64_data') or ''
+    try:
+        content = base64.b64decode(base64_data)
+    except Exception:
+        content = base64_data.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+def cache_key(
+    task: str,
+    model: str,
+    system_prompt: str,
+    response_model: Type[BaseModel],
+    sender_email: str,
+    subject: str,
+    body: str,
+    attachments: Optional[List[Dict[str, Any]]] = None
+) -> str:
+    # Attachments are hashed by content, so a resent or forwarded PDF hits regardless of its filename
+    parts = [
+        task,
+        model,
+        prompt_version(system_prompt, response_model),
+        (sender_email or "").strip().lower(),
+        normalize_subject(subject),
+        normalize_body(body),
+        *sorted(attachment_digest(attachment) for attachment in attachments or [])
+    ]
+    return hashlib.sha256("\0".join(parts).encode('utf-8')).hexdigest()
+
+
+def _count(counter: Dict[str, int], task: str):
+    with _stats_lock:
+        counter[task] = counter.get(task, 0) + 1
+
+
+def get_cached(key: str, task: str, response_model: Type[T]) -> Optional[T]:
+    if not CACHE_ENABLED:
+        return None
+    try:
+        connection = get_connection()
+        row = connection.execute("SELECT value, created_at FROM llm_cache WHERE cache_key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or now - row['created_at'] > MAX_AGE_SECONDS:
+            _count(_misses, task)
+            return None
+        with connection:
+            connection.execute("UPDATE llm_cache SET last_used_at = ? WHERE cache_key = ?", (now, key))
+        _count(_hits, task)
+        return response_model.model_validate_json(row['value'])
+    except Exception as e:
+        log_error(f"LLM cache lookup failed for {task}", e)
+        _count(_misses, task)
+        return None
+
+
+def put_cached(key: str, task: str, model: str, value: BaseModel):
+    global _writes
+    if not CACHE_ENABLED:
+        return
+    try:
+        data = value.model_dump_json()
+        now = time.time()
+        connection = get_connection()
+        with connection:
+            connection.execute(
+                """
+                INSERT INTO llm_cache (cache_key, task, model, value, size, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    value = excluded.value,
+                    size = excluded.size,
+                    created_at = excluded.created_at,
+                    last_used_at = excluded.last_used_at
+                """,
+                (key, task, model, data, len(data.encode('utf-8')), now, now)
+            )
+        with _stats_lock:
+            _writes += 1
+            evict_due = _writes % EVICT_EVERY_WRITES == 0
+        if evict_due:
+            evict_cache()
+    except Exception as e:
+        log_error(f"LLM cache write failed for {task}", e)
+
+
+def evict_cache() -> int:
+    connection = get_connection()
+    with connection:
+        removed = connection.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - MAX_AGE_SECONDS,)).rowcount
+        
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) AS total FROM llm_cache").fetchone()['total']
+        if total > MAX_BYTES:
+            # Least recently used entries go first until the cache fits again
+            to_free = total - MAX_BYTES
+            doomed = []
+            for row in connection.execute("SELECT cache_key, size FROM llm_cache ORDER BY last_used_at"):
+                if to_free <= 0:
+                    break
+                doomed.append((row['cache_key'],))
+                to_free -= row['size']
+            connection.executemany("DELETE FROM llm_cache WHERE cache_key = ?", doomed)
+            removed += len(doomed)
+    return removed
+
+
+def llm_cache_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        hits = dict(_hits)
+        misses = dict(_misses)
+    row = get_connection().execute("SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS size FROM llm_cache").fetchone()
+    return {
+        "enabled": CACHE_ENABLED,
+        "entries": row['entries'],
+        "size_bytes": row['size'],
+        "hits": hits,
+        "misses": misses
+    }
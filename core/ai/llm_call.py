@@ -0,0 +1,160 @@
+import sys
+import os
+import time
+import asyncio
+from typing import Optional, List, Dict, Any, Callable, Sequence, Tuple
+from openai import AsyncOpenAI
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.ai.openai_client import parse_response, parse_response_async, create_async_openai_client
+from core.ai.llm_cache import cache_key, get_cached, put_cached
+from core.ai.model_router import route_model, record_outcome, shadow_check
+
+
+def call_attempts(decision: Dict[str, Any], efforts: Sequence[str], checked: bool) -> List[Tuple[str, str]]:
+    attempts = [(decision["model"], effort) for effort in efforts]
+    if checked and decision["model"] != decision["default_model"]:
+        # A routed model whose result fails every check hands the email to the default model once
+        attempts.append((decision["default_model"], efforts[-1]))
+    return attempts
+
+
+def call_outcome(decision: Dict[str, Any], attempt: int, model: str, problems: List[str]) -> str:
+    if problems:
+        return "failed_validation"
+    if attempt == 0:
+        return "ok"
+    return "escalated" if model == decision["model"] else "escalated_model"
+
+
+def call_llm(
+    task: str,
+    default_model: str,
+    system_prompt: str,
+    text_format: Any,
+    build_input: Callable[[], List[Dict[str, Any]]],
+    sender_email: str,
+    subject: str,
+    body: str,
+    attachments: Optional[List[Dict[str, Any]]] = None,
+    efforts: Sequence[str] = ("minimal",),
+    check: Optional[Callable[[str, float, Any, bool], List[str]]] = None,
+    finish: Optional[Callable[[Any, List[str]], Any]] = None,
+    signature: Optional[Callable[[Any], Any]] = None,
+    announce: Optional[str] = None
+) -> Any:
+
+    decision = route_model(task, default_model, sender_email, body, attachments)
+    key = cache_key(task, decision["model"], system_prompt, text_format, sender_email, subject, body, attachments)
+    cached = get_cached(key, task, text_format)
+    if cached:
+        return cached
+    
+    first_started = time.perf_counter()
+    try:
+        if announce:
+            print(announce)
+        
+        messages = build_input()
+        attempts = call_attempts(decision, efforts, check is not None)
+        responses = []
+        problems = []
+        for attempt, (model, effort) in enumerate(attempts):
+            started = time.perf_counter()
+            responses.append(parse_response(model=model, input=messages, text_format=text_format, reasoning={"effort": effort}))
+            if check is None:
+                break
+            problems = check(effort, started, responses[-1].output_parsed, attempt == len(attempts) - 1)
+            if not problems:
+                break
+        
+        calls = list(zip([attempt_model for attempt_model, _ in attempts], responses))
+        record_outcome(decision, call_outcome(decision, attempt, model, problems), time.perf_counter() - first_started, calls)
+        if signature:
+            shadow_check(
+                decision,
+                lambda: parse_response(model=default_model, input=messages, text_format=text_format, reasoning={"effort": efforts[-1]}),
+                responses[-1].output_parsed,
+                signature
+            )
+        result = finish(responses[-1].output_parsed, problems) if finish else responses[-1].output_parsed
+        put_cached(key, task, decision["model"], result)
+        return result
+    
+    except Exception:
+        # Each caller keeps its own fallback, so the error is only recorded here
+        record_outcome(decision, "error", time.perf_counter() - first_started)
+        raise
+
+
+async def call_llm_async(
+    client: Optional[AsyncOpenAI],
+    task: str,
+    default_model: str,
+    system_prompt: str,
+    text_format: Any,
+    build_input: Callable[[], List[Dict[str, Any]]],
+    sender_email: str,
+    subject: str,
+    body: str,
+    attachments: Optional[List[Dict[str, Any]]] = None,
+    efforts: Sequence[str] = ("minimal",),
+    check: Optional[Callable[[str, float, Any, bool], List[str]]] = None,
+    finish: Optional[Callable[[Any, List[str]], Any]] = None,
+    signature: Optional[Callable[[Any], Any]] = None,
+    announce: Optional[str] = None
+) -> Any:
+
+    # Routing and the cache read and write the SQLite store, so they stay off the event loop like the uploads
+    decision = await asyncio.to_thread(route_model, task, default_model, sender_email, body, attachments)
+    key = cache_key(task, decision["model"], system_prompt, text_format, sender_email, subject, body, attachments)
+    cached = await asyncio.to_thread(get_cached, key, task, text_format)
+    if cached:
+        return cached
+    
+    # Callers normally pass the engine's pooled client; one made here is closed with the call
+    owns_client = client is None
+    if owns_client:
+        client = create_async_openai_client()
+    
+    first_started = time.perf_counter()
+    try:
+        if announce:
+            print(announce)
+        
+        # Fitting the prompt counts tokens and may upload PDFs, so the input is built off the event loop
+        messages = await asyncio.to_thread(build_input)
+        attempts = call_attempts(decision, efforts, check is not None)
+        responses = []
+        problems = []
+        for attempt, (model, effort) in enumerate(attempts):
+            started = time.perf_counter()
+            responses.append(await parse_response_async(client, model=model, input=messages, text_format=text_format, reasoning={"effort": effort}))
+            if check is None:
+                break
+            problems = check(effort, started, responses[-1].output_parsed, attempt == len(attempts) - 1)
+            if not problems:
+                break
+        
+        calls = list(zip([attempt_model for attempt_model, _ in attempts], responses))
+        outcome = call_outcome(decision, attempt, model, problems)
+        await asyncio.to_thread(record_outcome, decision, outcome, time.perf_counter() - first_started, calls)
+        if signature:
+            shadow_check(
+                decision,
+                lambda: parse_response(model=default_model, input=messages, text_format=text_format, reasoning={"effort": efforts[-1]}),
+                responses[-1].output_parsed,
+                signature
+            )
+        result = finish(responses[-1].output_parsed, problems) if finish else responses[-1].output_parsed
+        await asyncio.to_thread(put_cached, key, task, decision["model"], result)
+        return result
+    
+    except Exception:
+        await asyncio.to_thread(record_outcome, decision, "error", time.perf_counter() - first_started)
+        raise
+    
+    finally:
+        if owns_client:
+            await client.close()
@@ -0,0 +1,268 @@
+import os
+import sys
+import re
+import json
+import time
+import zlib
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.utils.secret_manager import get_setting
+from core.utils.email_store import DATA_DIR, get_connection
+from core.utils.log_manager.log_manager import log_error
+from core.ai.classifier import EmailCategorization, CLASSIFICATION_ERROR_PREFIX
+from core.ai.llm_cache import normalize_subject
+
+
+MODEL_PATH = get_setting("Local-Triage-Model-Path", os.path.join(DATA_DIR, 'triage_model.npz'))
+TRIAGE_ENABLED = get_setting("Local-Triage", "true").lower() == "true"
+THRESHOLD = float(get_setting("Local-Triage-Threshold", 0.97))
+# Only categories where a wrong guess is cheap skip the LLM; invoices always get the full pipeline
+FAST_PATH_CATEGORIES = {
+    category.strip() for category in get_setting("Local-Triage-Categories", "misc_spam,supplier_statement").split(",")
+    if category.strip()
+}
+TRIAGE_REASON_PREFIX = "Local triage"
+
+FEATURE_DIM = 2 ** 16
+SMOOTHING = 0.1
+MIN_TRAINING_SAMPLES = 200
+HOLDOUT_EVERY = 5
+
+INVOICE_NUMBER_PATTERN = re.compile(r"\b(inv(oice)?|bill)\s*(no\.?|number|num|#)?\s*[:#-]?\s*[a-z]*\d[\w-]{2,}", re.IGNORECASE)
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+DIGITS_PATTERN = re.compile(r"\d+")
+
+_model_lock = threading.Lock()
+_model: Optional[Dict[str, Any]] = None
+_model_mtime: Optional[float] = None
+_stats_lock = threading.Lock()
+_stats = {"fast_path": 0, "deferred": 0}
+
+
+def _hash(feature: str) -> int:
+    # crc32 is stable across processes, unlike hash(), so a saved model keeps its meaning
+    return zlib.crc32(feature.encode('utf-8')) % FEATURE_DIM
+
+
+def extract_features(sender_email: str, subject: str) -> List[int]:
+    sender = (sender_email or "").strip().lower()
+    domain = sender.rsplit('@', 1)[-1] if '@' in sender else ''
+    words = WORD_PATTERN.findall(DIGITS_PATTERN.sub('0', normalize_subject(subject).lower()))
+    
+    features = [f"e:{sender}", f"d:{domain}"]
+    features += [f"w:{word}" for word in words]
+    features += [f"b:{first}_{second}" for first, second in zip(words, words[1:])]
+    if INVOICE_NUMBER_PATTERN.search(subject or ""):
+        features.append("flag:invoice_number")
+    if not words:
+        features.append("flag:empty_subject")
+    return [_hash(feature) for feature in features]
+
+
+def _sparse_rows(samples: List[Tuple[str, str]]):
+    rows, cols = [], []
+    for row, (sender_email, subject) in enumerate(samples):
+        indices = extract_features(sender_email, subject)
+        rows.extend([row] * len(indices))
+        cols.extend(indices)
+    return np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+
+
+def _is_training_label(result: Dict[str, Any]) -> bool:
+    # Fallback labels from failed OpenAI calls and the model's own guesses would teach it its mistakes
+    reason = result.get('reason') or ''
+    return bool(result.get('category')) and not reason.startswith((CLASSIFICATION_ERROR_PREFIX, TRIAGE_REASON_PREFIX))
+
+
+def load_training_data() -> Tuple[List[Tuple[str, str]], List[str]]:
+    samples, labels = [], []
+    for row in get_connection().execute("SELECT data FROM processed_emails ORDER BY processed_at"):
+        result = json.loads(row['data'])
+        if _is_training_label(result):
+            samples.append((result.get('sender_email', ''), result.get('subject', '')))
+            labels.append(result['category'])
+    return samples, labels
+
+
+def fit(samples: List[Tuple[str, str]], labels: List[str]) -> Dict[str, Any]:
+    # Multinomial naive Bayes over hashed features: counting only, so retraining on the whole store takes seconds
+    classes = sorted(set(labels))
+    class_index = {label: index for index, label in enumerate(classes)}
+    y = np.asarray([class_index[label] for label in labels], dtype=np.int64)
+    
+    rows, cols = _sparse_rows(samples)
+    counts = np.zeros((len(classes), FEATURE_DIM), dtype=np.float64)
+    np.add.at(counts, (y[rows], cols), 1.0)
+    
+    smoothed = counts + SMOOTHING
+    return {
+        "classes": np.asarray(classes),
+        "log_prior": np.log(np.bincount(y, minlength=len(classes)) / len(y)),
+        "feature_log_prob": np.log(smoothed / smoothed.sum(axis=1, keepdims=True))
+    }
+
+
+def predict_proba(model: Dict[str, Any], samples: List[Tuple[str, str]]):
+    rows, cols = _sparse_rows(samples)
+    scores = np.tile(model["log_prior"], (len(samples), 1))
+    np.add.at(scores, rows, model["feature_log_prob"][:, cols].T)
+    scores -= scores.max(axis=1, keepdims=True)
+    probabilities = np.exp(scores)
+    return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+
+def evaluate(model: Dict[str, Any], samples: List[Tuple[str, str]], labels: List[str], threshold: float = THRESHOLD) -> Dict[str, Any]:
+    started = time.perf_counter()
+    probabilities = predict_proba(model, samples)
+    elapsed = time.perf_counter() - started
+    
+    predicted = model["classes"][probabilities.argmax(axis=1)]
+    confidence = probabilities.max(axis=1)
+    actual = np.asarray(labels)
+    fast = (confidence >= threshold) & np.isin(predicted, list(FAST_PATH_CATEGORIES))
+    
+    per_category = {}
+    for category in sorted(FAST_PATH_CATEGORIES):
+        chosen = fast & (predicted == category)
+        per_category[category] = {
+            "fast_path": int(chosen.sum()),
+            "precision": round(float((actual[chosen] == category).mean()), 4) if chosen.any() else None,
+            "recall": round(float(chosen[actual == category].mean()), 4) if (actual == category).any() else None
+        }
+    
+    return {
+        "samples": len(labels),
+        "threshold": threshold,
+        "accuracy": round(float((predicted == actual).mean()), 4),
+        "fast_path_share": round(float(fast.mean()), 4),
+        "fast_path_accuracy": round(float((predicted[fast] == actual[fast]).mean()), 4) if fast.any() else None,
+        "latency_us_per_email": round(elapsed / max(1, len(labels)) * 1e6, 1),
+        "categories": per_category
+    }
+
+
+def train(model_path: str = MODEL_PATH) -> Optional[Dict[str, Any]]:
+    if np is None:
+        print("❌ NumPy is not installed; local triage is unavailable")
+        return None
+    
+    samples, labels = load_training_data()
+    if len(samples) < MIN_TRAINING_SAMPLES:
+        print(f"❌ Only {len(samples)} labelled emails in the store; need at least {MIN_TRAINING_SAMPLES}")
+        return None
+    
+    # Every n-th email is held out so the report measures the model on mail it has not seen
+    holdout = [index % HOLDOUT_EVERY == 0 for index in range(len(samples))]
+    train_samples = [sample for sample, held in zip(samples, holdout) if not held]
+    train_labels = [label for label, held in zip(labels, holdout) if not held]
+    test_samples = [sample for sample, held in zip(samples, holdout) if held]
+    test_labels = [label for label, held in zip(labels, holdout) if held]
+    report = evaluate(fit(train_samples, train_labels), test_samples, test_labels)
+    
+    model = fit(samples, labels)
+    report["trained_on"] = len(samples)
+    report["trained_at"] = datetime.now(timezone.utc).isoformat()
+    
+    os.makedirs(os.path.dirname(model_path) or '.', exist_ok=True)
+    temp_path = f"{model_path}.tmp.npz"
+    np.savez_compressed(temp_path, report=json.dumps(report), **model)
+    os.replace(temp_path, model_path)
+    return report
+
+
+def _load_model() -> Optional[Dict[str, Any]]:
+    global _model, _model_mtime
+    try:
+        mtime = os.path.getmtime(MODEL_PATH)
+    except OSError:
+        return None
+    
+    with _model_lock:
+        # Reloads after the retrain command replaces the file, without restarting the app
+        if _model is None or mtime != _model_mtime:
+            try:
+                with np.load(MODEL_PATH) as data:
+                    _model = {
+                        "classes": data["classes"],
+                        "log_prior": data["log_prior"],
+                        "feature_log_prob": data["feature_log_prob"],
+                        "report": json.loads(str(data["report"]))
+                    }
+                _model_mtime = mtime
+            except Exception as e:
+                log_error(f"Failed to load local triage model from {MODEL_PATH}", e)
+                return None
+        return _model
+
+
+def triage_email(sender_email: str, subject: str) -> Optional[EmailCategorization]:
+    if not TRIAGE_ENABLED or np is None:
+        return None
+    model = _load_model()
+    if model is None:
+        return None
+    
+    probabilities = predict_proba(model, [(sender_email, subject)])[0]
+    best = int(probabilities.argmax())
+    category = str(model["classes"][best])
+    confidence = float(probabilities[best])
+    
+    if category not in FAST_PATH_CATEGORIES or confidence < THRESHOLD:
+        with _stats_lock:
+            _stats["deferred"] += 1
+        return None
+    
+    with _stats_lock:
+        _stats["fast_path"] += 1
+    return EmailCategorization(
+        email_type=category,
+        reason=f"{TRIAGE_REASON_PREFIX} ({confidence:.3f}) from sender and subject",
+        has_invoice=False,
+        invoice_numbers=[]
+    )
+
+
+def triage_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    model = _load_model() if TRIAGE_ENABLED and np is not None else None
+    stats["enabled"] = model is not None
+    stats["threshold"] = THRESHOLD
+    stats["categories"] = sorted(FAST_PATH_CATEGORIES)
+    stats["model"] = model["report"] if model else None
+    return stats
+
+
+def _print_report(report: Dict[str, Any]):
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "train":
+        report = train()
+        if report:
+            print(f"✓ Saved local triage model to {MODEL_PATH}")
+            _print_report(report)
+    elif np is None:
+        print("❌ NumPy is not installed; local triage is unavailable")
+    else:
+        model = _load_model()
+        if model is None:
+            print(f"No local triage model at {MODEL_PATH}; run: python core/ai/local_triage.py train")
+        else:
+            # Re-scores the whole store with the saved model; the held-out numbers are in the saved report
+            samples, labels = load_training_data()
+            print("Saved report (held-out emails):")
+            _print_report(model["report"])
+            if samples:
+                print("Current store:")
+                _print_report(evaluate(model, samples, labels))
@@ -0,0 +1,329 @@
+import os
+import sys
+import json
+import time
+import random
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.utils.secret_manager import get_setting
+from core.utils.email_store import DATA_DIR, get_connection
+from core.utils.log_manager.log_manager import log_error
+from core.ai.prompt_builder import count_tokens
+
+
+ROUTER_ENABLED = get_setting("Model-Router", "true").lower() == "true"
+POLICY_PATH = get_setting("Model-Routing-Policy", os.path.join(DATA_DIR, 'model_routing.json'))
+# Share of emails on a cheaper route that are also sent to the default model to measure agreement
+SHADOW_RATE = float(get_setting("Model-Router-Shadow-Rate", 0.05))
+KNOWN_SENDER_MIN_EMAILS = int(get_setting("Model-Router-Known-Sender-Emails", 3))
+# A vendor's difficulty is only trusted once this many extractions have been logged for the sender
+MIN_VENDOR_HISTORY = int(get_setting("Model-Router-Min-Vendor-History", 3))
+VENDOR_HISTORY_WINDOW = 50
+SENDER_CACHE_SECONDS = 600
+
+# Outcomes that mean the first attempt was not good enough
+HARD_OUTCOMES = {"escalated", "escalated_model", "failed_validation", "error"}
+
+# Used when no policy file exists; the first matching route wins, anything unmatched keeps the caller's model
+DEFAULT_POLICY = {
+    "routes": [
+        {
+            "name": "short-known-sender",
+            "tasks": ["classify"],
+            "model": "gpt-5-mini",
+            "when": {"known_sender": True, "max_body_tokens": 1500, "max_attachments": 2, "max_scanned_pdfs": 0}
+        },
+        {
+            "name": "easy-vendor",
+            "tasks": ["extract", "classify_extract"],
+            "model": "gpt-5-mini",
+            "when": {"known_sender": True, "max_vendor_difficulty": 0.1, "max_scanned_pdfs": 0, "max_attachment_mb": 5}
+        }
+    ],
+    # USD per million input and output tokens, used only for the cost report
+    "prices": {
+        "gpt-5": [1.25, 10.0],
+        "gpt-5-mini": [0.25, 2.0],
+        "gpt-5-nano": [0.05, 0.4]
+    }
+}
+
+_policy_lock = threading.Lock()
+_policy: Optional[Dict[str, Any]] = None
+_policy_mtime: Optional[float] = None
+_sender_lock = threading.Lock()
+_sender_cache: Dict[str, tuple] = {}
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def load_policy() -> Dict[str, Any]:
+    global _policy, _policy_mtime
+    try:
+        mtime = os.path.getmtime(POLICY_PATH)
+    except OSError:
+        return DEFAULT_POLICY
+    
+    with _policy_lock:
+        # Edits to the policy file apply to the next email, without restarting the app
+        if _policy is None or mtime != _policy_mtime:
+            try:
+                with open(POLICY_PATH, 'r', encoding='utf-8') as f:
+                    _policy = json.load(f)
+                _policy_mtime = mtime
+            except Exception as e:
+                log_error(f"Failed to load model routing policy from {POLICY_PATH}", e)
+                return _policy or DEFAULT_POLICY
+        return _policy
+
+
+def _count_sender_emails(sender: str) -> int:
+    row = get_connection().execute(
+        "SELECT COUNT(*) AS emails FROM processed_emails WHERE sender_email = ?",
+        (sender,)
+    ).fetchone()
+    return row['emails']
+
+
+def _vendor_history(sender: str) -> List[str]:
+    rows = get_connection().execute(
+        """
+        SELECT outcome FROM routing_decisions
+        WHERE sender_email = ? AND task IN ('extract', 'classify_extract') AND outcome IS NOT NULL
+        ORDER BY id DESC LIMIT ?
+        """,
+        (sender, VENDOR_HISTORY_WINDOW)
+    ).fetchall()
+    return [row['outcome'] for row in rows]
+
+
+def _sender_features(sender: str) -> Dict[str, Any]:
+    now = time.time()
+    with _sender_lock:
+        cached = _sender_cache.get(sender)
+        if cached and now - cached[0] < SENDER_CACHE_SECONDS:
+            return cached[1]
+    
+    try:
+        emails = _count_sender_emails(sender) if sender else 0
+        history = _vendor_history(sender) if sender else []
+    except Exception as e:
+        # An unreadable history routes like an unknown sender, which is the safe direction
+        log_error(f"Failed to read routing history for {sender}", e)
+        emails, history = 0, []
+    
+    features = {
+        "known_sender": emails >= KNOWN_SENDER_MIN_EMAILS,
+        "vendor_extractions": len(history),
+        "vendor_difficulty": round(sum(outcome in HARD_OUTCOMES for outcome in history) / len(history), 3) if history else None
+    }
+    with _sender_lock:
+        _sender_cache[sender] = (now, features)
+    return features
+
+
+def email_features(sender_email: str, body: str, attachments: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    attachments = attachments or []
+    features = {
+        "body_tokens": count_tokens(body or ""),
+        "attachments": len(attachments),
+        "attachment_bytes": sum(len(attachment.get('base64_data') or '') * 3 // 4 for attachment in attachments),
+        # PDFs without a usable text layer go to the model as files, which the small models read worst
+        "scanned_pdfs": sum(
+            1 for attachment in attachments
+            if (attachment.get('filename') or '').lower().endswith('.pdf') and not attachment.get('text_layer')
+        )
+    }
+    features.update(_sender_features((sender_email or "").strip().lower()))
+    return features
+
+
+def _matches(when: Dict[str, Any], features: Dict[str, Any]) -> bool:
+    if "known_sender" in when and features["known_sender"] != when["known_sender"]:
+        return False
+    if "max_body_tokens" in when and features["body_tokens"] > when["max_body_tokens"]:
+        return False
+    if "min_body_tokens" in when and features["body_tokens"] < when["min_body_tokens"]:
+        return False
+    if "max_attachments" in when and features["attachments"] > when["max_attachments"]:
+        return False
+    if "max_attachment_mb" in when and features["attachment_bytes"] > when["max_attachment_mb"] * 1024 * 1024:
+        return False
+    if "max_scanned_pdfs" in when and features["scanned_pdfs"] > when["max_scanned_pdfs"]:
+        return False
+    if "max_vendor_difficulty" in when:
+        # Vendors without enough history never qualify for a difficulty-based route
+        if features["vendor_extractions"] < MIN_VENDOR_HISTORY or features["vendor_difficulty"] > when["max_vendor_difficulty"]:
+            return False
+    return True
+
+
+def route_model(task: str, default_model: str, sender_email: str, body: str,
+                attachments: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    decision = {
+        "task": task,
+        "model": default_model,
+        "default_model": default_model,
+        "route": "default",
+        "sender_email": (sender_email or "").strip().lower(),
+        "features": {}
+    }
+    if not ROUTER_ENABLED:
+        return decision
+    
+    try:
+        features = email_features(sender_email, body, attachments)
+        decision["features"] = features
+        for route in load_policy().get("routes", []):
+            if task in route.get("tasks", [task]) and _matches(route.get("when", {}), features):
+                decision["model"] = route.get("model", default_model)
+                decision["route"] = route.get("name", decision["model"])
+                break
+    except Exception as e:
+        log_error(f"Model routing failed for {task}, using {default_model}", e)
+    
+    if decision["model"] != default_model:
+        print(f"   🔀 {task} routed to {decision['model']} ({decision['route']})")
+    return decision
+
+
+def _usage(calls: List[tuple]) -> tuple:
+    # calls pairs each response with the model it was requested from, since one email may use two models
+    prices = load_policy().get("prices", DEFAULT_POLICY["prices"])
+    input_tokens = output_tokens = 0
+    cost = 0.0
+    for model, response in calls:
+        usage = getattr(response, 'usage', None)
+        call_input = getattr(usage, 'input_tokens', 0) or 0
+        call_output = getattr(usage, 'output_tokens', 0) or 0
+        input_price, output_price = prices.get(model, [0.0, 0.0])
+        cost += (call_input * input_price + call_output * output_price) / 1e6
+        input_tokens += call_input
+        output_tokens += call_output
+    return input_tokens, output_tokens, cost
+
+
+def record_outcome(decision: Dict[str, Any], outcome: str, seconds: float, calls: Optional[List[tuple]] = None):
+    input_tokens, output_tokens, cost = _usage(calls or [])
+    
+    with _stats_lock:
+        stats = _stats.setdefault(f"{decision['task']}:{decision['model']}", {"calls": 0, "outcomes": {}, "seconds": []})
+        stats["calls"] += 1
+        stats["outcomes"][outcome] = stats["outcomes"].get(outcome, 0) + 1
+        # Only recent latencies are kept for the p50 in /health; the table holds the full history
+        stats["seconds"] = (stats["seconds"] + [seconds])[-500:]
+    
+    try:
+        connection = get_connection()
+        with connection:
+            cursor = connection.execute(
+                """
+                INSERT INTO routing_decisions (
+                    task, model, default_model, route, sender_email, features,
+                    outcome, latency_ms, input_tokens, output_tokens, cost_usd, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    decision["task"], decision["model"], decision["default_model"], decision["route"], decision["sender_email"],
+                    json.dumps(decision["features"]), outcome, round(seconds * 1000, 1), input_tokens, output_tokens, cost, time.time()
+                )
+            )
+        decision["id"] = cursor.lastrowid
+    except Exception as e:
+        log_error(f"Failed to log routing decision for {decision['task']}", e)
+
+
+def _record_shadow(decision: Dict[str, Any], agreed: bool):
+    if not decision.get("id"):
+        return
+    connection = get_connection()
+    with connection:
+        connection.execute("UPDATE routing_decisions SET shadow_agreed = ? WHERE id = ?", (int(agreed), decision["id"]))
+    if not agreed:
+        print(f"   ⚠️ Shadow check: {decision['default_model']} disagrees with {decision['model']} on {decision['task']}")
+
+
+def _wants_shadow(decision: Dict[str, Any]) -> bool:
+    return decision["model"] != decision["default_model"] and random.random() < SHADOW_RATE
+
+
+def shadow_check(decision: Dict[str, Any], run_default: Callable[[], Any], result: Any, signature: Callable[[Any], Any]):
+    # run_default calls the default model; signature reduces a result to the fields that must agree
+    if not _wants_shadow(decision):
+        return
+    
+    def _run():
+        try:
+            _record_shadow(decision, signature(run_default().output_parsed) == signature(result))
+        except Exception as e:
+            log_error(f"Shadow check for {decision['task']} failed", e)
+    
+    # The comparison call is off the request path, so sampled emails are not slowed down. Async callers use it too:
+    # a thread with its own client outlives the email's event loop and async client, which close when the email is done
+    threading.Thread(target=_run, name="model-router-shadow", daemon=True).start()
+
+
+def _percentile(values: List[float], share: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def model_router_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        routes = {
+            name: {
+                "calls": stats["calls"],
+                "outcomes": dict(stats["outcomes"]),
+                "p50_latency_seconds": round(_percentile(stats["seconds"], 0.5), 2) if stats["seconds"] else None
+            }
+            for name, stats in _stats.items()
+        }
+    return {"enabled": ROUTER_ENABLED, "policy": POLICY_PATH if os.path.exists(POLICY_PATH) else "default", "routes": routes}
+
+
+def routing_report(days: float = 7) -> Dict[str, Any]:
+    # Per task and model: outcome mix, latency percentiles, token cost and agreement with the default model
+    rows = get_connection().execute(
+        """
+        SELECT task, model, route, outcome, latency_ms, cost_usd, shadow_agreed
+        FROM routing_decisions WHERE created_at >= ?
+        """,
+        (time.time() - days * 86400,)
+    ).fetchall()
+    
+    groups: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        group = groups.setdefault(f"{row['task']}:{row['model']}", {"latencies": [], "outcomes": {}, "routes": {}, "cost": 0.0, "shadow": []})
+        group["latencies"].append(row['latency_ms'])
+        group["outcomes"][row['outcome']] = group["outcomes"].get(row['outcome'], 0) + 1
+        group["routes"][row['route']] = group["routes"].get(row['route'], 0) + 1
+        group["cost"] += row['cost_usd']
+        if row['shadow_agreed'] is not None:
+            group["shadow"].append(row['shadow_agreed'])
+    
+    report = {}
+    for name, group in sorted(groups.items()):
+        calls = len(group["latencies"])
+        report[name] = {
+            "calls": calls,
+            "routes": group["routes"],
+            "outcomes": group["outcomes"],
+            "first_pass_rate": round(sum(count for outcome, count in group["outcomes"].items() if outcome == "ok") / calls, 4),
+            "p50_latency_ms": _percentile(group["latencies"], 0.5),
+            "p90_latency_ms": _percentile(group["latencies"], 0.9),
+            "cost_usd": round(group["cost"], 4),
+            "cost_per_call_usd": round(group["cost"] / calls, 6),
+            "shadow_checks": len(group["shadow"]),
+            "shadow_agreement": round(sum(group["shadow"]) / len(group["shadow"]), 4) if group["shadow"] else None
+        }
+    return {"days": days, "groups": report}
+
+
+if __name__ == "__main__":
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else 7
+    print(json.dumps(routing_report(days), indent=2))
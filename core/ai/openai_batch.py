@@ -0,0 +1,172 @@
+import sys
+import os
+import json
+import time
+import uuid
+from typing import Optional, List, Dict, Any, Type
+from pydantic import BaseModel
+from openai import OpenAI
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils.secret_manager import get_setting
+from core.ai.openai_client import openai_api_key
+from core.utils.email_store import DATA_DIR, set_meta, get_connection
+from core.utils.log_manager.log_manager import log_error
+
+
+BATCH_DIR = os.path.join(DATA_DIR, 'batches')
+BATCH_ENDPOINT = "/v1/responses"
+POLL_SECONDS = float(get_setting("OpenAI-Batch-Poll-Seconds", 30))
+# Past the 24h completion window a batch has expired anyway; a status stuck beyond that is given up on
+WAIT_TIMEOUT_SECONDS = float(get_setting("OpenAI-Batch-Timeout-Hours", 25)) * 3600
+# The Batch API takes at most 50,000 requests and a 200 MB input file per batch
+MAX_BATCH_REQUESTS = int(get_setting("OpenAI-Batch-Max-Requests", 50000))
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+PENDING_META_PREFIX = "openai_batch:"
+
+
+def get_batch_client() -> OpenAI:
+    # OPENAI_BATCH_BASE_URL points only the batch traffic at a stand-in such as dev/openai_batch_stub.py
+    return OpenAI(api_key=openai_api_key(), base_url=get_setting("OpenAI-Batch-Base-URL"))
+
+
+def strict_json_schema(response_model: Type[BaseModel]) -> Dict[str, Any]:
+    # Structured outputs in strict mode need every property required and no extra properties
+    def tighten(node):
+        if isinstance(node, dict):
+            node.pop('default', None)
+            if node.get('type') == 'object' and 'properties' in node:
+                node['additionalProperties'] = False
+                node['required'] = list(node['properties'].keys())
+            for value in node.values():
+                tighten(value)
+        elif isinstance(node, list):
+            for value in node:
+                tighten(value)
+        return node
+    
+    return tighten(response_model.model_json_schema())
+
+
+def build_request(custom_id: str, model: str, messages: List[Dict[str, Any]], response_model: Type[BaseModel], effort: str) -> Dict[str, Any]:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": model,
+            "input": messages,
+            "text": {
+                "format": {
+                    "type": "json_schema",
+                    "name": response_model.__name__,
+                    "schema": strict_json_schema(response_model),
+                    "strict": True
+                }
+            },
+            "reasoning": {"effort": effort}
+        }
+    }
+
+
+def split_requests(requests: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    # Inline PDFs make requests large, so a batch can fill up on size long before the request limit
+    chunks: List[List[Dict[str, Any]]] = [[]]
+    size = 0
+    for request in requests:
+        request_size = len(json.dumps(request)) + 1
+        if chunks[-1] and (len(chunks[-1]) >= MAX_BATCH_REQUESTS or size + request_size > MAX_BATCH_BYTES):
+            chunks.append([])
+            size = 0
+        chunks[-1].append(request)
+        size += request_size
+    return [chunk for chunk in chunks if chunk]
+
+
+def submit_batch(client: OpenAI, requests: List[Dict[str, Any]], pending: Dict[str, Dict[str, str]]) -> Optional[str]:
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    path = os.path.join(BATCH_DIR, f"{uuid.uuid4().hex}.jsonl")
+    with open(path, 'w', encoding='utf-8') as f:
+        for request in requests:
+            f.write(json.dumps(request) + "\n")
+    
+    try:
+        with open(path, 'rb') as f:
+            input_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window="24h")
+    except Exception as e:
+        log_error("Failed to submit OpenAI batch", e)
+        return None
+    finally:
+        os.remove(path)
+    
+    # Remember what each request was for, so a restart can still collect a batch that is already paid for
+    set_meta(f"{PENDING_META_PREFIX}{batch.id}", json.dumps(pending))
+    print(f"📦 Submitted OpenAI batch {batch.id} with {len(requests)} request(s)")
+    return batch.id
+
+
+def wait_for_batch(client: OpenAI, batch_id: str, poll_seconds: float = POLL_SECONDS,
+                   timeout_seconds: float = WAIT_TIMEOUT_SECONDS):
+    # Returns None when the deadline passes first; the batch stays pending and is collected on a later run
+    deadline = time.time() + timeout_seconds
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if time.time() >= deadline:
+            print(f"⚠️ Batch {batch_id} still {batch.status} after {timeout_seconds / 3600:.1f}h, leaving it for a later run")
+            return None
+        counts = batch.request_counts
+        if counts:
+            print(f"   Batch {batch_id}: {batch.status}, {counts.completed}/{counts.total} done")
+        time.sleep(min(poll_seconds, max(deadline - time.time(), 0)))
+
+
+def _output_text(body: Dict[str, Any]) -> Optional[str]:
+    for item in body.get('output', []):
+        if item.get('type') != 'message':
+            continue
+        for content in item.get('content', []):
+            if content.get('type') == 'output_text':
+                return content.get('text')
+    return None
+
+
+def collect_batch(client: OpenAI, batch) -> Dict[str, str]:
+    # Returns the raw JSON text of every successful response, keyed by custom_id
+    outputs = {}
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get('response') or {}
+            if response.get('status_code') != 200:
+                continue
+            text = _output_text(response.get('body') or {})
+            if text:
+                outputs[record['custom_id']] = text
+    
+    if batch.error_file_id:
+        errors = client.files.content(batch.error_file_id).text.splitlines()
+        if errors:
+            print(f"   Batch {batch.id}: {len(errors)} request(s) failed")
+    return outputs
+
+
+def forget_batch(batch_id: str):
+    connection = get_connection()
+    with connection:
+        connection.execute("DELETE FROM store_meta WHERE key = ?", (f"{PENDING_META_PREFIX}{batch_id}",))
+
+
+def pending_batches() -> Dict[str, Dict[str, Dict[str, str]]]:
+    rows = get_connection().execute(
+        "SELECT key, value FROM store_meta WHERE key LIKE ?",
+        (f"{PENDING_META_PREFIX}%",)
+    ).fetchall()
+    return {row['key'][len(PENDING_META_PREFIX):]: json.loads(row['value']) for row in rows}
+
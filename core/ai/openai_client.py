@@ -0,0 +1,198 @@
+import sys
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Optional, List, Dict, Any
+
+import httpx
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils.secret_manager import get_openai_secrets, get_setting
+from core.utils.rate_limiter import get_rate_limiter
+from core.utils.log_manager.log_manager import log_error
+from core.ai.prompt_builder import count_tokens
+
+
+MAX_CONNECTIONS = int(get_setting("OpenAI-Max-Connections", 20))
+MAX_RETRIES = int(get_setting("OpenAI-Max-Retries", 5))
+BACKOFF_BASE_SECONDS = float(get_setting("OpenAI-Backoff-Base-Seconds", 1))
+BACKOFF_MAX_SECONDS = float(get_setting("OpenAI-Backoff-Max-Seconds", 60))
+REQUEST_TIMEOUT_SECONDS = float(get_setting("OpenAI-Timeout-Seconds", 120))
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# Rough sizes used to reserve tokens-per-minute budget before the real usage is known
+FILE_TOKEN_ESTIMATE = 1500
+OUTPUT_TOKEN_ESTIMATE = 1000
+
+_client: Optional[OpenAI] = None
+_client_lock = threading.Lock()
+_api_key: Optional[str] = None
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0, "tokens": 0}
+# A 429 with Retry-After pauses every caller in the process, not just the one that hit it
+_paused_until = 0.0
+
+
+def openai_api_key() -> str:
+    global _api_key
+    if _api_key is None:
+        _api_key = get_openai_secrets()
+    return _api_key
+
+
+def get_openai_client() -> OpenAI:
+    global _client
+    with _client_lock:
+        if _client is None:
+            limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+            # Retries are handled here so they respect the shared budget; the SDK's own retries are off
+            _client = OpenAI(
+                api_key=openai_api_key(),
+                max_retries=0,
+                timeout=REQUEST_TIMEOUT_SECONDS,
+                http_client=httpx.Client(limits=limits, timeout=REQUEST_TIMEOUT_SECONDS)
+            )
+        return _client
+
+
+def create_async_openai_client(max_connections: int = MAX_CONNECTIONS) -> AsyncOpenAI:
+    # Async clients are bound to the event loop that uses them, so each engine creates its own
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return AsyncOpenAI(
+        api_key=openai_api_key(),
+        max_retries=0,
+        timeout=REQUEST_TIMEOUT_SECONDS,
+        http_client=httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT_SECONDS)
+    )
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    tokens = 0
+    files = 0
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, str):
+            tokens += count_tokens(content)
+            continue
+        for part in content or []:
+            if part.get('type') == 'input_text':
+                tokens += count_tokens(part.get('text', ''))
+            else:
+                files += 1
+    return tokens + files * FILE_TOKEN_ESTIMATE + OUTPUT_TOKEN_ESTIMATE
+
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (RateLimitError, APITimeoutError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code in RETRYABLE_STATUSES
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        return None
+    return None
+
+
+def _backoff_delay(error: Exception, attempt: int) -> float:
+    global _paused_until
+    delay = _retry_after(error)
+    if delay is None:
+        delay = BACKOFF_BASE_SECONDS * (2 ** attempt) * (0.5 + random.random())
+    delay = min(delay, BACKOFF_MAX_SECONDS)
+    if isinstance(error, RateLimitError):
+        _count("rate_limited")
+        with _stats_lock:
+            _paused_until = max(_paused_until, time.time() + delay)
+    return delay
+
+
+def _pause_remaining() -> float:
+    with _stats_lock:
+        return max(0.0, _paused_until - time.time())
+
+
+def _settle_tokens(response, estimate: int):
+    usage = getattr(response, 'usage', None)
+    total = getattr(usage, 'total_tokens', None) if usage else None
+    if total is None:
+        return
+    get_rate_limiter("OpenAI-Tokens").adjust(total - estimate)
+    _count("tokens", total)
+
+
+def parse_response(**kwargs):
+    client = get_openai_client()
+    estimate = estimate_tokens(kwargs.get('input', []))
+    
+    attempt = 0
+    while True:
+        time.sleep(_pause_remaining())
+        get_rate_limiter("OpenAI").acquire()
+        get_rate_limiter("OpenAI-Tokens").acquire(estimate)
+        _count("requests")
+        try:
+            response = client.responses.parse(**kwargs)
+            _settle_tokens(response, estimate)
+            return response
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= MAX_RETRIES:
+                _count("failures")
+                raise
+            delay = _backoff_delay(e, attempt)
+            attempt += 1
+            _count("retries")
+            log_error(f"OpenAI request failed, retry {attempt}/{MAX_RETRIES} in {delay:.1f}s", e)
+            time.sleep(delay)
+
+
+async def parse_response_async(client: AsyncOpenAI, **kwargs):
+    estimate = estimate_tokens(kwargs.get('input', []))
+    
+    attempt = 0
+    while True:
+        await asyncio.sleep(_pause_remaining())
+        await get_rate_limiter("OpenAI").acquire_async()
+        await get_rate_limiter("OpenAI-Tokens").acquire_async(estimate)
+        _count("requests")
+        try:
+            response = await client.responses.parse(**kwargs)
+            _settle_tokens(response, estimate)
+            return response
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= MAX_RETRIES:
+                _count("failures")
+                raise
+            delay = _backoff_delay(e, attempt)
+            attempt += 1
+            _count("retries")
+            log_error(f"OpenAI request failed, retry {attempt}/{MAX_RETRIES} in {delay:.1f}s", e)
+            await asyncio.sleep(delay)
+
+
+def openai_client_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["requests_per_minute_limit"] = get_rate_limiter("OpenAI").per_minute
+    stats["tokens_per_minute_limit"] = get_rate_limiter("OpenAI-Tokens").per_minute
+    stats["paused_seconds"] = round(_pause_remaining(), 1)
+    return stats
@@ -0,0 +1,203 @@
+import sys
+import os
+import re
+from typing import Optional, List, Dict, Any, Tuple
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils.secret_manager import get_setting
+
+
+# Input-token budget for the email body plus attachment text of one call, per task
+PROMPT_BUDGETS = {
+    "classify": int(get_setting("Prompt-Tokens-Classify", 1500)),
+    "extract": int(get_setting("Prompt-Tokens-Extract", 6000)),
+    "classify_extract": int(get_setting("Prompt-Tokens-Combined", 6000)),
+}
+# Share of the budget the body may use when attachment text competes for the rest
+BODY_SHARE_WITH_ATTACHMENTS = 0.35
+# Extraction needs every line item, so a PDF whose text layer cannot fit goes to these tasks as the file itself
+FILE_WHEN_TRUNCATED_TASKS = {"extract", "classify_extract"}
+# A partial segment shorter than this carries too little to be worth the space
+MIN_PARTIAL_TOKENS = 32
+CHARS_PER_TOKEN = 4
+
+REPLY_HEADER_PATTERN = re.compile(
+    r"^\s*(On .{0,200}wrote:\s*$"
+    r"|-{2,}\s*(Original Message|Forwarded message)\s*-{2,}"
+    r"|_{10,}\s*$"
+    r"|\**From:\**\s.+$)",
+    re.IGNORECASE
+)
+SENT_HEADER_PATTERN = re.compile(r"^\s*\**(Sent|Date):\**\s", re.IGNORECASE)
+SIGNOFF_PATTERN = re.compile(
+    r"^\s*(--\s*|(best|kind|warm|many)?\s*(regards|thanks|thank you|cheers|sincerely)[,.!]?\s*|sent from my \w+.*)$",
+    re.IGNORECASE
+)
+DISCLAIMER_PATTERN = re.compile(
+    r"(confidential|intended (solely )?for the (use of the )?(individual|addressee|recipient)"
+    r"|received this (e-?mail|message|communication) in error|disclaimer|privileged|virus)",
+    re.IGNORECASE
+)
+INVOICE_SIGNAL_PATTERN = re.compile(
+    r"(invoice|inv\s*#|amount\s+due|balance\s+due|sub-?total|total|qty|quantity|unit\s+price|remit"
+    r"|due\s+date|p\.?o\.?\s*(#|number)|purchase\s+order|\$\s?\d|\b\d+[.,]\d{2}\b)",
+    re.IGNORECASE
+)
+SIGNATURE_MAX_LINES = 12
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if not text:
+        return 0
+    if tiktoken is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("o200k_base")
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    if tokens <= 0:
+        return ""
+    if count_tokens(text) <= tokens:
+        return text
+    if tiktoken is None:
+        cut = text[:tokens * CHARS_PER_TOKEN]
+    else:
+        cut = _encoding.decode(_encoding.encode(text, disallowed_special=())[:tokens])
+    # Prefer ending on a whole line when that keeps most of the text
+    line_end = cut.rfind("\n")
+    return cut[:line_end] if line_end > len(cut) * 0.8 else cut
+
+
+def split_thread(body: str) -> List[str]:
+    # The newest message comes first; every reply or forward header starts an earlier message
+    lines = (body or "").splitlines()
+    messages: List[List[str]] = [[]]
+    quoted: List[str] = []
+    for index, line in enumerate(lines):
+        if line.lstrip().startswith(">"):
+            quoted.append(line.lstrip().lstrip("> "))
+            continue
+        header = REPLY_HEADER_PATTERN.match(line)
+        if header and line.lstrip().lstrip("*").lower().startswith("from:"):
+            # A bare "From:" line is only a header when a Sent/Date line follows
+            header = any(SENT_HEADER_PATTERN.match(following) for following in lines[index + 1:index + 4])
+        if header and messages[-1]:
+            messages.append([])
+        messages[-1].append(line)
+    if quoted:
+        messages.append(quoted)
+    return ["\n".join(message) for message in messages]
+
+
+def _strip_signature(lines: List[str]) -> List[str]:
+    for index, line in enumerate(lines):
+        if index > 0 and SIGNOFF_PATTERN.match(line) and len(lines) - index <= SIGNATURE_MAX_LINES:
+            return lines[:index]
+    return lines
+
+
+def clean_message(text: str) -> str:
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        # Legal footers are dropped unless they happen to mention invoice details
+        if DISCLAIMER_PATTERN.search(paragraph) and not INVOICE_SIGNAL_PATTERN.search(paragraph):
+            continue
+        paragraphs.append(paragraph.strip())
+    lines = _strip_signature("\n\n".join(p for p in paragraphs if p).splitlines())
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(line.rstrip() for line in lines)).strip()
+
+
+def _paragraphs(text: str) -> List[str]:
+    return [paragraph.strip() for paragraph in re.split(r"\n\s*\n", text or "") if paragraph.strip()]
+
+
+def fit_segments(segments: List[Tuple[str, float]], budget: int, separator: str = "\n\n") -> Tuple[str, bool]:
+    # The first segment is always kept; the rest go in by score, then by position, until the budget is spent.
+    # A segment that does not fit whole is cut to what is left, so the best-scoring one still contributes
+    if not segments:
+        return "", False
+    costs = [count_tokens(text) for text, _ in segments]
+    order = [0] + sorted(range(1, len(segments)), key=lambda index: (-segments[index][1], index))
+    
+    kept: Dict[int, str] = {}
+    remaining = budget
+    truncated = False
+    for index in order:
+        if costs[index] <= remaining:
+            kept[index] = segments[index][0]
+            remaining -= costs[index]
+            continue
+        truncated = True
+        if index == 0 or remaining >= MIN_PARTIAL_TOKENS:
+            kept[index] = truncate_to_tokens(segments[index][0], remaining)
+            remaining -= count_tokens(kept[index])
+    
+    parts = []
+    omitted = 0
+    for index in range(len(segments)):
+        if index in kept:
+            if omitted:
+                parts.append(f"[... {omitted} part(s) omitted ...]")
+                omitted = 0
+            parts.append(kept[index])
+        else:
+            omitted += 1
+    if omitted:
+        parts.append(f"[... {omitted} part(s) omitted ...]")
+    return separator.join(part for part in parts if part), truncated
+
+
+def _score(text: str, bonus: float = 0.0) -> float:
+    return min(len(INVOICE_SIGNAL_PATTERN.findall(text)), 10) + bonus
+
+
+def fit_body(body: str, budget: int) -> Tuple[str, bool]:
+    segments = []
+    for position, message in enumerate(split_thread(body)):
+        for paragraph in _paragraphs(clean_message(message)):
+            # The newest message outranks quoted history with the same invoice signals
+            segments.append((paragraph, _score(paragraph, 2.0 if position == 0 else 0.0)))
+    return fit_segments(segments, budget)
+
+
+def _lines(text: str) -> List[str]:
+    return [line.rstrip() for line in (text or "").splitlines() if line.strip()]
+
+
+def fit_attachment_text(text: str, budget: int) -> Tuple[str, bool]:
+    # Text layers come as layout blocks such as a whole line-item table, so each line is scored on its own
+    return fit_segments([(line, _score(line)) for line in _lines(text)], budget, "\n")
+
+
+def fit_prompt(body: str, attachments: Optional[List[Dict[str, Any]]], task: str) -> Tuple[str, bool, List[Optional[str]]]:
+    # Returns the body text, whether it was shortened, and the text to send for each attachment (None = the PDF itself)
+    budget = PROMPT_BUDGETS[task]
+    texts = [(attachment.get('text_layer') or {}).get('text') for attachment in attachments or []]
+    pending = [index for index, text in enumerate(texts) if text]
+    
+    body_budget = int(budget * BODY_SHARE_WITH_ATTACHMENTS) if pending else budget
+    body_text, body_truncated = fit_body(body, body_budget)
+    remaining = budget - count_tokens(body_text)
+    
+    fitted: List[Optional[str]] = [None] * len(texts)
+    for position, index in enumerate(pending):
+        # Split what is left evenly; an attachment that needs less hands the rest on
+        share = remaining // (len(pending) - position)
+        text, truncated = fit_attachment_text(texts[index], share)
+        if truncated and task in FILE_WHEN_TRUNCATED_TASKS:
+            # Its share is handed on like any unused budget
+            continue
+        fitted[index] = text
+        remaining -= count_tokens(text)
+    return body_text, body_truncated, fitted
@@ -7,6 +7,7 @@ import base64
 import uuid
 from datetime import datetime
 from dotenv import load_dotenv
+from core.utils.rate_limiter import get_rate_limiter
 
 load_dotenv()
 
@@ -16,8 +17,7 @@ api_key = os.getenv('EPICOR_API_KEY')
 username = os.getenv('EPICOR_USERNAME')
 password = os.getenv('EPICOR_PASSWORD')
 
-def epicor_api_request(endpoint, method, company='SAINC', payload=None, params=None, instance_override=None):
-    
+def _build_epicor_request(endpoint, company, instance_override=None):
     instance_to_use = instance_override if instance_override else instance
     
     # Use v1 for GetByID endpoint, v2 for others
@@ -33,15 +33,10 @@ def epicor_api_request(endpoint, method, company='SAINC', payload=None, params=N
         'Accept': 'application/json'
     }
     
-    response = requests.request(
-        method=method,
-        url=url,
-        headers=headers,
-        json=payload,
-        params=params,
-        auth=(username, password)
-    )
-    
+    return url, headers
+
+
+def _print_debug(url, method, company, params, payload, response):
     # Debug prints
     debug_mode = True
 
@@ -66,6 +61,45 @@ def epicor_api_request(endpoint, method, company='SAINC', payload=None, params=N
         print("")
         print('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
 
+
+def epicor_api_request(endpoint, method, company='SAINC', payload=None, params=None, instance_override=None):
+    
+    url, headers = _build_epicor_request(endpoint, company, instance_override)
+    
+    get_rate_limiter("Epicor").acquire()
+    
+    response = requests.request(
+        method=method,
+        url=url,
+        headers=headers,
+        json=payload,
+        params=params,
+        auth=(username, password)
+    )
+    
+    _print_debug(url, method, company, params, payload, response)
+
+    return response
+
+
+async def epicor_api_request_async(http_client, endpoint, method, company='SAINC', payload=None, params=None, instance_override=None):
+    
+    url, headers = _build_epicor_request(endpoint, company, instance_override)
+    
+    await get_rate_limiter("Epicor").acquire_async()
+    
+    # Basic auth is already in the headers; httpx responses expose the same fields the callers read
+    response = await http_client.request(
+        method,
+        url,
+        headers=headers,
+        json=payload,
+        params=params,
+        timeout=60
+    )
+    
+    _print_debug(url, method, company, params, payload, response)
+
     return response
     
 def format_date_for_epicor(date_obj=None):
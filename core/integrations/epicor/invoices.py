@@ -3,7 +3,7 @@ import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from core.integrations.epicor.client import epicor_api_request
+from core.integrations.epicor.client import epicor_api_request, epicor_api_request_async
 from core.utils.secret_manager import get_secret
 
 
@@ -27,15 +27,26 @@ def build_epicor_invoice_url(vendor_num, invoice_num):
     return url
 
 
-def get_invoice_from_epicor(invoice_number, company='SAINC'):
-    endpoint = 'BaqSvc/APInvDtl/Data'
-    
-    params = {
+INVOICE_ENDPOINT = 'BaqSvc/APInvDtl/Data'
+
+
+def _invoice_params(invoice_number):
+    return {
         '$filter': f"APInvHed_InvoiceNum eq '{invoice_number}'"
     }
-    
-    response = epicor_api_request(endpoint, 'GET', company, params=params, instance_override='KineticLive')
-    
+
+
+def get_invoice_from_epicor(invoice_number, company='SAINC'):
+    response = epicor_api_request(INVOICE_ENDPOINT, 'GET', company, params=_invoice_params(invoice_number), instance_override='KineticLive')
+    return _parse_invoice_response(invoice_number, response)
+
+
+async def get_invoice_from_epicor_async(http_client, invoice_number, company='SAINC'):
+    response = await epicor_api_request_async(http_client, INVOICE_ENDPOINT, 'GET', company, params=_invoice_params(invoice_number), instance_override='KineticLive')
+    return _parse_invoice_response(invoice_number, response)
+
+
+def _parse_invoice_response(invoice_number, response):
     if response and response.status_code == 200:
         try:
             data = response.json()
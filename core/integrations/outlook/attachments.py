@@ -1,5 +1,8 @@
+import io
+import re
 import base64
 from typing import Any, Dict, List, Optional
+from core.utils.secret_manager import get_setting
 from core.utils.log_manager.log_manager import (
     log_error,
     log_attachments_process_start,
@@ -10,6 +13,15 @@ from core.utils.log_manager.log_manager import (
 SUPPORTED_IMAGE_MIME_TYPES = {"image/png", "image/jpeg"}
 SUPPORTED_IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
 
+PDF_TEXT_LAYER = get_setting("PDF-Text-Layer", "true").lower() == "true"
+PDF_TEXT_MAX_PAGES = int(get_setting("PDF-Text-Max-Pages", 20))
+PDF_TEXT_MAX_CHARS = int(get_setting("PDF-Text-Max-Chars", 20000))
+# Below this much text per page the PDF is treated as scanned and sent as a file
+PDF_TEXT_MIN_CHARS_PER_PAGE = int(get_setting("PDF-Text-Min-Chars-Per-Page", 80))
+PDF_TEXT_MIN_WORD_RATIO = 0.6
+WIDE_GAP_PATTERN = re.compile(r" {3,}")
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+
 
 def _get_extension(filename: str) -> str:
     if not filename:
@@ -136,6 +148,83 @@ def handle_msg_attachment(filename: str, base64_data: str) -> Optional[Dict[str,
     }
 
 
+def _compact_layout_text(text: str) -> str:
+    # Layout mode pads columns with spaces; a wide gap keeps table columns apart at a fraction of the size
+    lines = [WIDE_GAP_PATTERN.sub("   ", line.rstrip()) for line in text.splitlines()]
+    return BLANK_LINES_PATTERN.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _is_usable_text(text: str, page_count: int) -> bool:
+    if len(text) < PDF_TEXT_MIN_CHARS_PER_PAGE * max(1, page_count):
+        return False
+    # Broken font encodings come out as runs of symbols rather than words
+    tokens = text.split()
+    wordlike = sum(1 for token in tokens if any(ch.isalnum() for ch in token))
+    return bool(tokens) and wordlike / len(tokens) >= PDF_TEXT_MIN_WORD_RATIO
+
+
+def _page_text(page) -> str:
+    try:
+        return page.extract_text(extraction_mode="layout") or ""
+    except Exception:
+        # pypdf before 3.17 has no layout mode, and layout mode fails on some odd pages
+        try:
+            return page.extract_text() or ""
+        except Exception:
+            return ""
+
+
+def extract_pdf_text(filename: str, base64_data: str) -> Optional[Dict[str, Any]]:
+    if not PDF_TEXT_LAYER or not base64_data:
+        return None
+    try:
+        from pypdf import PdfReader  # type: ignore
+    except Exception:
+        return None
+
+    try:
+        reader = PdfReader(io.BytesIO(base64.b64decode(base64_data)))
+        page_count = len(reader.pages)
+        pages = []
+        for number, page in enumerate(reader.pages[:PDF_TEXT_MAX_PAGES], start=1):
+            pages.append(f"--- Page {number} ---\n{_compact_layout_text(_page_text(page))}")
+    except Exception as e:
+        log_error(f"ATTACHMENTS: Failed to read PDF text layer of {filename}", e)
+        return None
+
+    text = "\n\n".join(pages)
+    if not _is_usable_text(text, min(page_count, PDF_TEXT_MAX_PAGES)):
+        return None
+
+    truncated = len(text) > PDF_TEXT_MAX_CHARS or page_count > PDF_TEXT_MAX_PAGES
+    return {
+        "text": text[:PDF_TEXT_MAX_CHARS],
+        "pages": page_count,
+        "truncated": truncated
+    }
+
+
+def pdf_content_block(attachment: Dict[str, Any], file_id: Optional[str] = None, text: Optional[str] = None,
+                      as_file: bool = False) -> Dict[str, Any]:
+    # Born-digital PDFs go to the model as their text layer unless as_file is set; scanned ones still go as the file
+    filename = attachment.get('filename', 'unknown')
+    text_layer = attachment.get('text_layer')
+    if text_layer and not as_file:
+        note = ", truncated" if text_layer['truncated'] else ""
+        return {
+            "type": "input_text",
+            "text": f"**Attachment {filename}** (PDF text layer, {text_layer['pages']} page(s){note}):\n\n{text_layer['text'] if text is None else text}"
+        }
+    if file_id:
+        # Uploaded once to the Files API and referenced by every call that needs it
+        return {"type": "input_file", "file_id": file_id}
+    return {
+        "type": "input_file",
+        "filename": filename,
+        "file_data": f"data:application/pdf;base64,{attachment.get('base64_data', '')}"
+    }
+
+
 def handle_item_attachment(filename: str, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     if not item:
         return None
@@ -243,6 +332,7 @@ def process_attachments(graph_attachments: List[Dict[str, Any]]) -> Dict[str, An
             
             # Track PDFs separately for logging
             if name.lower().endswith('.pdf') or mime == 'application/pdf':
+                other_file["text_layer"] = extract_pdf_text(name, base64_data)
                 pdfs.append(other_file)
             
             other_files.append(other_file)
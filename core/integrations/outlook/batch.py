@@ -0,0 +1,212 @@
+import os
+import sys
+import time
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+# Add project root to path for direct execution
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from core.integrations.outlook.client import graph_api_request, format_email, EMAIL_SELECT_FIELDS
+from core.utils.secret_manager import get_outlook_secrets, get_setting
+from core.utils.log_manager.log_manager import log_error
+
+
+# Graph rejects $batch payloads with more than 20 requests
+MAX_BATCH_SIZE = 20
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER_SECONDS = 30
+# The batcher re-queues a throttled call this many times before giving up on it
+MAX_BATCH_RETRIES = 3
+MIN_RETRY_DELAY_SECONDS = 1
+
+
+def _relative_url(endpoint, params=None):
+    url = endpoint if endpoint.startswith('/') else f"/{endpoint}"
+    if params:
+        url = f"{url}?{urlencode(params)}"
+    return url
+
+
+def _sub_request(request_id, operation):
+    sub_request = {
+        "id": request_id,
+        "method": operation['method'].upper(),
+        "url": _relative_url(operation['endpoint'], operation.get('params'))
+    }
+    if operation.get('data') is not None:
+        sub_request["body"] = operation['data']
+        sub_request["headers"] = {"Content-Type": "application/json"}
+    return sub_request
+
+
+def _sub_response_result(sub_response):
+    status = sub_response.get('status', 0)
+    if status == 204:
+        return {"success": True}
+    body = sub_response.get('body')
+    return body if isinstance(body, dict) else {"success": True}
+
+
+def _retry_after_seconds(sub_response) -> float:
+    retry_after = (sub_response.get('headers') or {}).get('Retry-After')
+    try:
+        return min(float(retry_after), MAX_RETRY_AFTER_SECONDS) if retry_after else 0.0
+    except ValueError:
+        return 0.0
+
+
+def _retry_individually(token_data, operation, sub_response):
+    delay = _retry_after_seconds(sub_response)
+    if delay:
+        time.sleep(delay)
+    return graph_api_request(token_data, operation['method'], operation['endpoint'],
+                             data=operation.get('data'), params=operation.get('params'))
+
+
+def execute_batch(token_data, operations: List[Dict[str, Any]],
+                  on_retry: Optional[Callable[[int, float], None]] = None) -> List[Optional[Dict[str, Any]]]:
+    # With on_retry, throttled entries are handed back with their Retry-After instead of being retried in place
+    results: List[Optional[Dict[str, Any]]] = [None] * len(operations)
+
+    for start in range(0, len(operations), MAX_BATCH_SIZE):
+        chunk = operations[start:start + MAX_BATCH_SIZE]
+        payload = {"requests": [_sub_request(str(start + i), op) for i, op in enumerate(chunk)]}
+
+        response = graph_api_request(token_data, 'POST', '$batch', data=payload)
+        sub_responses = {r.get('id'): r for r in (response or {}).get('responses', [])}
+
+        for i, operation in enumerate(chunk):
+            index = start + i
+            sub_response = sub_responses.get(str(index))
+
+            # The whole batch failed or Graph dropped this entry; fall back to a plain request
+            if sub_response is None:
+                results[index] = _retry_individually(token_data, operation, {})
+                continue
+
+            status = sub_response.get('status', 0)
+            if 200 <= status < 300:
+                results[index] = _sub_response_result(sub_response)
+            elif status in RETRYABLE_STATUSES and on_retry is not None:
+                on_retry(index, _retry_after_seconds(sub_response))
+            elif status in RETRYABLE_STATUSES:
+                results[index] = _retry_individually(token_data, operation, sub_response)
+            else:
+                error = (sub_response.get('body') or {}).get('error', {})
+                log_error(f"Graph batch {operation['method']} {operation['endpoint']} failed: {status} - {error}",
+                         Exception("Graph API batch sub-request error"))
+
+    return results
+
+
+class GraphBatcher:
+    def __init__(self, max_batch_size: int = MAX_BATCH_SIZE, max_wait: float = 0.05):
+        self.max_batch_size = min(max_batch_size, MAX_BATCH_SIZE)
+        self.max_wait = max_wait
+        self._pending: List[Dict[str, Any]] = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, token_data, method, endpoint, data=None, params=None) -> Future:
+        future: Future = Future()
+        with self._condition:
+            self._pending.append({
+                "token_data": token_data,
+                "method": method,
+                "endpoint": endpoint,
+                "data": data,
+                "params": params,
+                "future": future
+            })
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="graph-batcher", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def _take_batch(self):
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            # Give concurrent workers a short window to add their calls to the same round trip
+            deadline = time.time() + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            return batch
+
+    def _requeue(self, item):
+        with self._condition:
+            self._pending.append(item)
+            self._condition.notify()
+
+    def _retry_later(self, item, delay: float) -> bool:
+        item["attempts"] = item.get("attempts", 0) + 1
+        if item["attempts"] > MAX_BATCH_RETRIES:
+            log_error(f"Graph batch {item['method']} {item['endpoint']} still throttled after {MAX_BATCH_RETRIES} retries",
+                     Exception("Graph API batch sub-request throttled"))
+            return False
+        # Sleeping here would stall every queued caller; a timer puts the call back into a later round instead
+        timer = threading.Timer(max(delay, MIN_RETRY_DELAY_SECONDS), self._requeue, args=(item,))
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            # Every caller uses the same app-only token, so the newest one covers the whole batch
+            token_data = batch[-1]["token_data"]
+            deferred = set()
+
+            def defer(index, delay):
+                if self._retry_later(batch[index], delay):
+                    deferred.add(index)
+
+            try:
+                results = execute_batch(token_data, batch, on_retry=defer)
+                for index, (item, result) in enumerate(zip(batch, results)):
+                    if index not in deferred:
+                        item["future"].set_result(result)
+            except Exception as e:
+                log_error("Graph batcher failed to execute batch", e)
+                for index, item in enumerate(batch):
+                    if index not in deferred and not item["future"].done():
+                        item["future"].set_result(None)
+
+
+_batcher = GraphBatcher()
+
+
+def batched_graph_request(token_data, method, endpoint, data=None, params=None):
+    if get_setting("Graph-Batching", "true").lower() != "true":
+        return graph_api_request(token_data, method, endpoint, data=data, params=params)
+    return _batcher.submit(token_data, method, endpoint, data=data, params=params).result()
+
+
+def get_emails_by_id(token_data, message_ids: List[str], mailbox_id: Optional[str] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+    # Returns the fetched emails and the ids whose fetch failed, so callers can retry instead of losing them
+    if not message_ids:
+        return [], []
+    if not mailbox_id:
+        mailbox_id = get_outlook_secrets()['mailbox_id']
+
+    operations = [
+        {
+            "method": "GET",
+            "endpoint": f"users/{mailbox_id}/messages/{message_id}",
+            "params": {"$select": EMAIL_SELECT_FIELDS}
+        }
+        for message_id in message_ids
+    ]
+    results = execute_batch(token_data, operations)
+    emails = [format_email(result, mailbox_id) for result in results if result and result.get('id')]
+    missing = [message_id for message_id, result in zip(message_ids, results) if not (result and result.get('id'))]
+    return emails, missing
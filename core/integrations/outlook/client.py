@@ -3,6 +3,7 @@ import json
 import os
 import sys
 import re
+import threading
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 import html2text
@@ -10,10 +11,19 @@ import html2text
 # Add project root to path for direct execution
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from core.utils.secret_manager import get_outlook_secrets
+from core.utils.secret_manager import get_outlook_secrets, get_setting
 from core.utils.log_manager.log_manager import log_error
+from core.utils.rate_limiter import get_rate_limiter
 
-BASE_URL = "https://graph.microsoft.com/v1.0"
+# Overridable so the monitor can run against dev/graph_stub.py instead of Microsoft
+BASE_URL = get_setting("Graph-Base-URL", "https://graph.microsoft.com/v1.0").rstrip('/')
+LOGIN_URL = get_setting("Graph-Login-URL", "https://login.microsoftonline.com").rstrip('/')
+
+# Refresh this long before expiry so a token never lapses mid-request
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+_token_cache = None
+_token_lock = threading.Lock()
 
 
 def clean_html_body(html_content: str) -> str:
@@ -46,7 +56,7 @@ def authenticate_graph_api():
         client_id = secrets['client_id']
         client_secret = secrets['client_secret']
         
-        token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
+        token_url = f"{LOGIN_URL}/{tenant_id}/oauth2/v2.0/token"
         
         headers = {
             'Content-Type': 'application/x-www-form-urlencoded'
@@ -84,20 +94,80 @@ def authenticate_graph_api():
         return None
 
 
-def graph_api_request(token_data, method, endpoint, data=None, params=None):
+def _is_token_fresh(token_data):
+    if not token_data or not token_data.get('access_token'):
+        return False
+    expires_at = token_data.get('expires_at')
+    if not expires_at:
+        return False
+    return datetime.now() + timedelta(seconds=TOKEN_REFRESH_MARGIN_SECONDS) < expires_at
+
+
+def get_graph_token():
+    token_data = _token_cache
+    if _is_token_fresh(token_data):
+        return token_data
+    
+    with _token_lock:
+        # Another thread may have refreshed while we waited; only one refresh request goes out
+        if _is_token_fresh(_token_cache):
+            return _token_cache
+        return _refresh_graph_token()
+
+
+def _refresh_graph_token():
+    global _token_cache
+    token_data = authenticate_graph_api()
+    if token_data:
+        _token_cache = token_data
+        return token_data
+    # Keep serving the old token while it is still technically valid
+    if _token_cache and _token_cache.get('expires_at') and _token_cache['expires_at'] > datetime.now():
+        return _token_cache
+    return None
+
+
+def invalidate_graph_token(token_data=None):
+    global _token_cache
+    with _token_lock:
+        # Only drop the cached token if it is the one that was rejected, not one refreshed since
+        if token_data is None or (_token_cache and _token_cache.get('access_token') == token_data.get('access_token')):
+            _token_cache = None
+
+
+def _graph_headers(token_data, extra_headers=None):
+    headers = {
+        'Authorization': f"Bearer {token_data['access_token']}",
+        'Content-Type': 'application/json',
+        'Accept': 'application/json'
+    }
+    if extra_headers:
+        headers.update(extra_headers)
+    return headers
+
+
+def _graph_url(endpoint):
+    # nextLink/deltaLink values returned by Graph are already absolute URLs
+    if endpoint.startswith('http://') or endpoint.startswith('https://'):
+        return endpoint
+    return f"{BASE_URL}/{endpoint}"
+
+
+def graph_api_request(token_data, method, endpoint, data=None, params=None, headers=None, allow_status=()):
+    # Long-running work can outlive the token it was handed; swap in the shared cached one
+    if not _is_token_fresh(token_data):
+        token_data = get_graph_token() or token_data
+    
     if not token_data or not token_data.get('access_token'):
         log_error("Graph API request failed - no valid access token available",
                  Exception("Missing or invalid access token"))
         return None
+    
+    get_rate_limiter("Graph").acquire()
         
     try:
-        url = f"{BASE_URL}/{endpoint}"
-        
-        headers = {
-            'Authorization': f"Bearer {token_data['access_token']}",
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
+        url = _graph_url(endpoint)
+        headers = _graph_headers(token_data, headers)
         
         # Make the request
         if method.upper() == 'GET':
@@ -121,7 +191,12 @@ def graph_api_request(token_data, method, endpoint, data=None, params=None):
                 return response.json()
             except json.JSONDecodeError:
                 return {"success": True}  # Success but no JSON content
+        elif response.status_code in allow_status:
+            # Callers that act on a specific error status (e.g. 410 on delta) get it back instead of None
+            return {"status_code": response.status_code, "error": response.text}
         else:
+            if response.status_code == 401:
+                invalidate_graph_token(token_data)
             log_error(f"Graph API {method} {endpoint} failed: {response.status_code} - {response.text}",
                      Exception("Graph API request error"))
             return None
@@ -130,11 +205,93 @@ def graph_api_request(token_data, method, endpoint, data=None, params=None):
         log_error(f"Graph API {method} {endpoint} failed", e)
         return None
 
+async def graph_api_request_async(http_client, token_data, method, endpoint, data=None, params=None, headers=None):
+    if not _is_token_fresh(token_data):
+        token_data = get_graph_token() or token_data
+    
+    if not token_data or not token_data.get('access_token'):
+        log_error("Graph API request failed - no valid access token available",
+                 Exception("Missing or invalid access token"))
+        return None
+    
+    await get_rate_limiter("Graph").acquire_async()
+    
+    try:
+        response = await http_client.request(
+            method.upper(),
+            _graph_url(endpoint),
+            headers=_graph_headers(token_data, headers),
+            json=data,
+            params=params,
+            timeout=30
+        )
+        
+        if response.status_code in [200, 201, 202, 204]:
+            if response.status_code == 204:
+                return {"success": True}
+            try:
+                return response.json()
+            except json.JSONDecodeError:
+                return {"success": True}
+        else:
+            if response.status_code == 401:
+                invalidate_graph_token(token_data)
+            log_error(f"Graph API {method} {endpoint} failed: {response.status_code} - {response.text}",
+                     Exception("Graph API request error"))
+            return None
+    
+    except Exception as e:
+        log_error(f"Graph API {method} {endpoint} failed", e)
+        return None
+
 # =============================================================================
 # EMAIL OPERATIONS
 # =============================================================================
 
-def get_emails(token_data, mailbox_id=None, folder="inbox", limit=100, include_read=True):
+EMAIL_SELECT_FIELDS = 'id,subject,sender,from,toRecipients,receivedDateTime,createdDateTime,body,bodyPreview,isRead,importance,hasAttachments,internetMessageId,conversationId'
+
+# Delta rounds only need enough to decide whether a message is new; bodies are fetched per new message
+DELTA_SELECT_FIELDS = 'id,subject,receivedDateTime,isRead,hasAttachments,internetMessageId'
+
+
+def format_email(email, mailbox_id=None):
+    raw_body = email.get('body', {}).get('content', '')
+    body_type = email.get('body', {}).get('contentType', 'text')
+    
+    if body_type.lower() == 'html':
+        cleaned_body = clean_html_body(raw_body)
+    else:
+        cleaned_body = raw_body
+    
+    return {
+        'id': email.get('id'),
+        'mailbox_id': mailbox_id,
+        'subject': email.get('subject', 'No Subject'),
+        'sender_email': email.get('sender', {}).get('emailAddress', {}).get('address', ''),
+        'sender_name': email.get('sender', {}).get('emailAddress', {}).get('name', ''),
+        'from_email': email.get('from', {}).get('emailAddress', {}).get('address', ''),
+        'from_name': email.get('from', {}).get('emailAddress', {}).get('name', ''),
+        'received_datetime': email.get('receivedDateTime'),
+        'created_datetime': email.get('createdDateTime'),
+        'body_content': cleaned_body,
+        'body_content_type': body_type,
+        'body_preview': email.get('bodyPreview', ''),
+        'is_read': email.get('isRead', True),
+        'importance': email.get('importance', 'normal'),
+        'has_attachments': email.get('hasAttachments', False),
+        'internet_message_id': email.get('internetMessageId'),
+        'conversation_id': email.get('conversationId'),
+        'to_recipients': [
+            {
+                'email': recipient.get('emailAddress', {}).get('address', ''),
+                'name': recipient.get('emailAddress', {}).get('name', '')
+            }
+            for recipient in email.get('toRecipients', [])
+        ]
+    }
+
+
+def iter_email_pages(token_data, mailbox_id=None, folder="inbox", include_read=True, page_size=100):
     try:
         # Use configured mailbox if none provided
         if not mailbox_id:
@@ -149,66 +306,148 @@ def get_emails(token_data, mailbox_id=None, folder="inbox", limit=100, include_r
         
         # Parameters for the request
         params = {
-            '$select': 'id,subject,sender,from,toRecipients,receivedDateTime,createdDateTime,body,bodyPreview,isRead,importance,hasAttachments,internetMessageId,conversationId',
+            '$select': EMAIL_SELECT_FIELDS,
             '$orderby': 'receivedDateTime desc',
-            '$top': limit
+            '$top': page_size
         }
         
         # Add filter for unread only if specified
         if not include_read:
             params['$filter'] = 'isRead eq false'
         
-        # Make the API request
+        yield from _iter_pages(token_data, endpoint, params, mailbox_id)
+            
+    except Exception as e:
+        log_error("Failed to fetch emails from Outlook", e)
+
+
+def _iter_pages(token_data, endpoint, params, mailbox_id):
+    while endpoint:
         result = graph_api_request(token_data, 'GET', endpoint, params=params)
         
-        if result and 'value' in result:
-            emails = result['value']
+        if not result or 'value' not in result:
+            return
+        
+        yield [format_email(email, mailbox_id) for email in result['value']]
+        
+        # nextLink already carries the query string, so params only apply to the first page
+        endpoint = result.get('@odata.nextLink')
+        params = None
+
+
+def iter_email_pages_between(token_data, start, end, mailbox_id=None, folder=None, page_size=50):
+    # Oldest first, so a caller can checkpoint on the last receivedDateTime it finished
+    try:
+        if not mailbox_id:
+            secrets = get_outlook_secrets()
+            mailbox_id = secrets['mailbox_id']
+        
+        if folder:
+            endpoint = f"users/{mailbox_id}/mailFolders/{folder}/messages"
+        else:
+            endpoint = f"users/{mailbox_id}/messages"
+        
+        params = {
+            '$select': EMAIL_SELECT_FIELDS,
+            '$filter': f"receivedDateTime ge {start} and receivedDateTime lt {end}",
+            '$orderby': 'receivedDateTime asc',
+            '$top': page_size
+        }
+        
+        yield from _iter_pages(token_data, endpoint, params, mailbox_id)
+    
+    except Exception as e:
+        log_error(f"Failed to fetch emails received between {start} and {end}", e)
+
+
+def iter_emails(token_data, mailbox_id=None, folder="inbox", limit=None, include_read=True, page_size=100):
+    if limit is not None:
+        page_size = min(page_size, limit)
+    
+    count = 0
+    for page in iter_email_pages(token_data, mailbox_id, folder, include_read, page_size):
+        for email in page:
+            count += 1
+            yield email
+            # Stop as soon as the limit is reached, before the next page is requested from Graph
+            if limit is not None and count >= limit:
+                return
+
+
+def get_emails(token_data, mailbox_id=None, folder="inbox", limit=100, include_read=True, paginate=False):
+    emails = iter_emails(token_data, mailbox_id, folder, limit=limit, include_read=include_read)
+    if paginate:
+        return emails
+    return list(emails)
+
+
+def get_email(token_data, message_id: str, mailbox_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    try:
+        if not mailbox_id:
+            secrets = get_outlook_secrets()
+            mailbox_id = secrets['mailbox_id']
+        
+        endpoint = f"users/{mailbox_id}/messages/{message_id}"
+        result = graph_api_request(token_data, 'GET', endpoint, params={'$select': EMAIL_SELECT_FIELDS})
+        if result and result.get('id'):
+            return format_email(result, mailbox_id)
+        return None
+    except Exception as e:
+        log_error(f"Failed to fetch message {message_id}", e)
+        return None
+
+
+def get_email_delta(token_data, mailbox_id=None, folder="inbox", delta_link=None, lookback_days=1, page_size=50):
+    try:
+        if not mailbox_id:
+            secrets = get_outlook_secrets()
+            mailbox_id = secrets['mailbox_id']
+        
+        headers = {'Prefer': f'odata.maxpagesize={page_size}'}
+        
+        if delta_link:
+            url = delta_link
+            params = None
+        else:
+            # First round: only walk recent mail instead of the whole folder history
+            since = (datetime.utcnow() - timedelta(days=lookback_days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+            url = _graph_url(f"users/{mailbox_id}/mailFolders/{folder}/messages/delta")
+            params = {
+                '$select': DELTA_SELECT_FIELDS,
+                '$filter': f'receivedDateTime ge {since}'
+            }
+        
+        changed = []
+        removed = []
+        
+        while url:
+            result = graph_api_request(token_data, 'GET', url, params=params, headers=headers, allow_status=(410,))
+            params = None
             
-            # Process and format the emails (same formatting as get_unread_emails)
-            formatted_emails = []
-            for email in emails:
-                raw_body = email.get('body', {}).get('content', '')
-                body_type = email.get('body', {}).get('contentType', 'text')
-                
-                if body_type.lower() == 'html':
-                    cleaned_body = clean_html_body(raw_body)
-                else:
-                    cleaned_body = raw_body
-                
-                formatted_email = {
-                    'id': email.get('id'),
-                    'subject': email.get('subject', 'No Subject'),
-                    'sender_email': email.get('sender', {}).get('emailAddress', {}).get('address', ''),
-                    'sender_name': email.get('sender', {}).get('emailAddress', {}).get('name', ''),
-                    'from_email': email.get('from', {}).get('emailAddress', {}).get('address', ''),
-                    'from_name': email.get('from', {}).get('emailAddress', {}).get('name', ''),
-                    'received_datetime': email.get('receivedDateTime'),
-                    'created_datetime': email.get('createdDateTime'),
-                    'body_content': cleaned_body,
-                    'body_content_type': body_type,
-                    'body_preview': email.get('bodyPreview', ''),
-                    'is_read': email.get('isRead', True),
-                    'importance': email.get('importance', 'normal'),
-                    'has_attachments': email.get('hasAttachments', False),
-                    'internet_message_id': email.get('internetMessageId'),
-                    'conversation_id': email.get('conversationId'),
-                    'to_recipients': [
-                        {
-                            'email': recipient.get('emailAddress', {}).get('address', ''),
-                            'name': recipient.get('emailAddress', {}).get('name', '')
-                        }
-                        for recipient in email.get('toRecipients', [])
-                    ]
-                }
-                formatted_emails.append(formatted_email)
+            if result is None:
+                return None
             
-            return formatted_emails
-        else:
-            return []
+            if result.get('status_code') == 410:
+                # Sync state expired or was invalidated; caller restarts from a fresh round
+                log_error(f"Graph delta token expired for {mailbox_id}/{folder}: {result['error']}",
+                         Exception("Graph delta sync state not found"))
+                return {'emails': [], 'removed': [], 'delta_link': None, 'reset': True}
             
+            for message in result.get('value', []):
+                if '@removed' in message:
+                    removed.append(message.get('id'))
+                else:
+                    changed.append(message)
+            
+            if '@odata.deltaLink' in result:
+                return {'emails': changed, 'removed': removed, 'delta_link': result['@odata.deltaLink'], 'reset': False}
+            url = result.get('@odata.nextLink')
+        
+        return None
+    
     except Exception as e:
-        log_error("Failed to fetch emails from Outlook", e)
-        return []
+        log_error(f"Failed to run delta sync for {mailbox_id}/{folder}", e)
+        return None
 
 
 def get_email_attachments(token_data, message_id: str, mailbox_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
@@ -222,7 +461,27 @@ def get_email_attachments(token_data, message_id: str, mailbox_id: Optional[str]
         params = {
             "$expand": "microsoft.graph.itemattachment/item"
         }
-        result = graph_api_request(token_data, 'GET', endpoint, params=params)
+        from core.integrations.outlook.batch import batched_graph_request
+        result = batched_graph_request(token_data, 'GET', endpoint, params=params)
+        if result and 'value' in result:
+            return result['value']
+        return []
+    except Exception as e:
+        log_error(f"Failed to fetch attachments for message {message_id}", e)
+        return None
+
+
+async def get_email_attachments_async(http_client, token_data, message_id: str, mailbox_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    try:
+        if not mailbox_id:
+            secrets = get_outlook_secrets()
+            mailbox_id = secrets['mailbox_id']
+        
+        endpoint = f"users/{mailbox_id}/messages/{message_id}/attachments"
+        params = {
+            "$expand": "microsoft.graph.itemattachment/item"
+        }
+        result = await graph_api_request_async(http_client, token_data, 'GET', endpoint, params=params)
         if result and 'value' in result:
             return result['value']
         return []
@@ -290,7 +549,8 @@ def mark_email_as_read(token_data, message_id, mailbox_id=None, is_read=True):
         }
         
         # Update the message
-        result = graph_api_request(token_data, 'PATCH', endpoint, data=update_data)
+        from core.integrations.outlook.batch import batched_graph_request
+        result = batched_graph_request(token_data, 'PATCH', endpoint, data=update_data)
         
         if result:
             return True
@@ -0,0 +1,178 @@
+import os
+import sys
+import re
+import secrets
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+# Add project root to path for direct execution
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from core.integrations.outlook.client import get_graph_token, graph_api_request
+from core.utils.secret_manager import get_outlook_secrets, get_setting
+from core.utils.log_manager.log_manager import log_error
+
+
+# Graph caps mail subscriptions at just under 3 days; stay well inside it
+SUBSCRIPTION_LIFETIME_MINUTES = 4200
+RENEW_BEFORE_MINUTES = 120
+CHECK_INTERVAL_SECONDS = 1800
+RETRY_INTERVAL_SECONDS = 60
+NOTIFICATION_RESOURCE_PATTERN = re.compile(r"^/?users/([^/]+)/messages/", re.IGNORECASE)
+
+_stop_event = threading.Event()
+_manager_thread = None
+# Managed subscriptions keyed by mailbox id
+_subscriptions: Dict[str, Dict[str, Any]] = {}
+
+
+def get_client_state() -> Optional[str]:
+    # Every node and every restart must share the secret, since subscriptions outlive the process that created them
+    return get_setting("Graph-Webhook-Client-State") or None
+
+
+def is_valid_client_state(client_state: Optional[str]) -> bool:
+    expected = get_client_state()
+    return bool(client_state) and bool(expected) and secrets.compare_digest(client_state, expected)
+
+
+def _expiration(minutes: int) -> str:
+    return (datetime.now(timezone.utc) + timedelta(minutes=minutes)).strftime('%Y-%m-%dT%H:%M:%S.0000000Z')
+
+
+def _parse_expiration(value: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        # Graph returns 7 fractional digits, which fromisoformat cannot parse
+        return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def inbox_resource(mailbox_id: Optional[str] = None, folder: str = "inbox") -> str:
+    if not mailbox_id:
+        mailbox_id = get_outlook_secrets()['mailbox_id']
+    return f"users/{mailbox_id}/mailFolders('{folder}')/messages"
+
+
+def list_subscriptions(token_data) -> List[Dict[str, Any]]:
+    result = graph_api_request(token_data, 'GET', 'subscriptions')
+    if result and 'value' in result:
+        return result['value']
+    return []
+
+
+def create_subscription(token_data, notification_url: str, resource: str, lifetime_minutes: int = SUBSCRIPTION_LIFETIME_MINUTES) -> Optional[Dict[str, Any]]:
+    data = {
+        "changeType": "created",
+        "notificationUrl": notification_url,
+        "resource": resource,
+        "expirationDateTime": _expiration(lifetime_minutes),
+        "clientState": get_client_state()
+    }
+    # Graph performs the validation handshake against notification_url before this call returns
+    result = graph_api_request(token_data, 'POST', 'subscriptions', data=data)
+    if result and result.get('id'):
+        print(f"Graph subscription {result['id']} created for {resource}, expires {result.get('expirationDateTime')}")
+        return result
+    return None
+
+
+def renew_subscription(token_data, subscription_id: str, lifetime_minutes: int = SUBSCRIPTION_LIFETIME_MINUTES) -> Optional[Dict[str, Any]]:
+    data = {"expirationDateTime": _expiration(lifetime_minutes)}
+    result = graph_api_request(token_data, 'PATCH', f"subscriptions/{subscription_id}", data=data)
+    if result and result.get('id'):
+        print(f"Graph subscription {subscription_id} renewed until {result.get('expirationDateTime')}")
+        return result
+    return None
+
+
+def delete_subscription(token_data, subscription_id: str) -> bool:
+    return graph_api_request(token_data, 'DELETE', f"subscriptions/{subscription_id}") is not None
+
+
+def ensure_subscription(token_data, notification_url: str, mailbox_id: str) -> Optional[Dict[str, Any]]:
+    resource = inbox_resource(mailbox_id)
+    subscription = _subscriptions.get(mailbox_id)
+
+    if subscription is None:
+        # Reuse a subscription left over from a previous run instead of stacking duplicates
+        for existing in list_subscriptions(token_data):
+            if existing.get('notificationUrl') != notification_url or existing.get('resource', '').lower() != resource.lower():
+                continue
+            if existing.get('clientState') and existing['clientState'] != get_client_state():
+                # Created under an older secret; its notifications would all be rejected, so replace it
+                print(f"Graph subscription {existing['id']} uses a different clientState, recreating it")
+                delete_subscription(token_data, existing['id'])
+                continue
+            subscription = existing
+            break
+
+    if subscription is not None:
+        expires_at = _parse_expiration(subscription.get('expirationDateTime'))
+        if expires_at and expires_at - datetime.now(timezone.utc) > timedelta(minutes=RENEW_BEFORE_MINUTES):
+            _subscriptions[mailbox_id] = subscription
+            return subscription
+
+        # Renewal fails once the subscription has expired or was removed; fall through and recreate
+        subscription = renew_subscription(token_data, subscription['id'])
+
+    if subscription is None:
+        subscription = create_subscription(token_data, notification_url, resource)
+
+    if subscription is None:
+        _subscriptions.pop(mailbox_id, None)
+    else:
+        _subscriptions[mailbox_id] = subscription
+    return subscription
+
+
+def mailbox_for_notification(notification: Dict[str, Any]) -> Optional[str]:
+    # Prefer the configured mailbox id for subscriptions this process manages
+    for mailbox_id, subscription in list(_subscriptions.items()):
+        if subscription.get('id') == notification.get('subscriptionId'):
+            return mailbox_id
+    # After a restart, or on a node that did not create the subscription, the resource names the user by object id,
+    # which Graph accepts wherever a mailbox id is expected
+    match = NOTIFICATION_RESOURCE_PATTERN.match(notification.get('resource') or '')
+    return match.group(1) if match else None
+
+
+def _run_manager(notification_url: str, mailbox_ids: List[str], initial_delay: float):
+    # Creating a subscription triggers a validation call back into our own webhook, so let Flask come up first
+    _stop_event.wait(initial_delay)
+    while not _stop_event.is_set():
+        healthy = False
+        try:
+            token_data = get_graph_token()
+            if token_data:
+                subscriptions = [ensure_subscription(token_data, notification_url, mailbox_id) for mailbox_id in mailbox_ids]
+                healthy = all(subscriptions)
+        except Exception as e:
+            log_error("Graph subscription manager failed", e)
+        _stop_event.wait(CHECK_INTERVAL_SECONDS if healthy else RETRY_INTERVAL_SECONDS)
+
+
+def start_subscription_manager(notification_url: str, mailbox_ids: Optional[List[str]] = None, initial_delay: float = 5):
+    global _manager_thread
+    if _manager_thread and _manager_thread.is_alive():
+        return
+    if not get_client_state():
+        log_error("Graph change notifications are disabled: GRAPH_WEBHOOK_CLIENT_STATE is not set",
+                 Exception("Missing webhook client state"))
+        print("❌ Set GRAPH_WEBHOOK_CLIENT_STATE to use change notifications; falling back to polling")
+        return
+    _stop_event.clear()
+    _manager_thread = threading.Thread(
+        target=_run_manager,
+        args=(notification_url, mailbox_ids or get_outlook_secrets()['mailbox_ids'], initial_delay),
+        name="graph-subscription-manager",
+        daemon=True
+    )
+    _manager_thread.start()
+
+
+def stop_subscription_manager():
+    _stop_event.set()
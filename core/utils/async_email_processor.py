@@ -0,0 +1,219 @@
+import sys
+import os
+import asyncio
+import threading
+from concurrent.futures import wait as wait_futures
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.integrations.outlook.client import get_email_attachments_async
+from core.integrations.outlook.attachments import process_attachments
+from core.ai.classifier import categorize_email_async
+from core.ai.invoice_extractor import extract_invoice_data_async
+from core.ai.combined_classifier import classify_and_extract_async
+from core.ai.openai_client import create_async_openai_client
+from core.integrations.epicor.invoices import get_invoice_from_epicor_async
+from core.utils.vendor_finder import match_vendor_from_invoice_async
+from core.utils.email_processor import (
+    build_email_context,
+    build_result,
+    attachment_list_from,
+    build_epicor_entry,
+    format_extracted_invoice_data,
+    use_combined_call,
+    triage_stage
+)
+from core.utils.worker_pool import EmailOwnership, report_failure
+from core.utils.log_manager.log_manager import log_error
+
+
+async def _classify(context, openai_client):
+    if triage_stage(context):
+        return
+    
+    if use_combined_call(context):
+        context["categorization"], context["invoice_data"] = await classify_and_extract_async(
+            sender_email=context["sender_email"],
+            sender_name=context["sender_name"],
+            subject=context["subject"],
+            body=context["body"],
+            attachments=context["attachment_list"],
+            client=openai_client
+        )
+    else:
+        context["categorization"] = await categorize_email_async(
+            sender_email=context["sender_email"],
+            sender_name=context["sender_name"],
+            subject=context["subject"],
+            body=context["body"],
+            attachments=context["attachment_list"],
+            client=openai_client
+        )
+
+
+async def _extract_invoice(context, http_client, openai_client):
+    if context["categorization"].email_type != 'new_invoice':
+        return
+    
+    invoice_data = context["invoice_data"]
+    if invoice_data is None:
+        print(f"\n🔍 Email categorized as new_invoice - extracting invoice data...")
+        invoice_data = await extract_invoice_data_async(
+            sender_email=context["sender_email"],
+            sender_name=context["sender_name"],
+            subject=context["subject"],
+            body=context["body"],
+            attachments=context["attachment_list"],
+            client=openai_client
+        )
+        context["invoice_data"] = invoice_data
+    
+    if invoice_data:
+        vendor_matches = await match_vendor_from_invoice_async(http_client, invoice_data.vendor_name)
+        context["extracted_invoice_data"] = format_extracted_invoice_data(invoice_data, vendor_matches)
+        print(f"✅ Invoice data extraction complete")
+
+
+async def _lookup_invoices(context, http_client):
+    categorization = context["categorization"]
+    if not (categorization.has_invoice and categorization.invoice_numbers):
+        return
+    
+    results = await asyncio.gather(*(
+        get_invoice_from_epicor_async(http_client, invoice_num)
+        for invoice_num in categorization.invoice_numbers
+    ))
+    context["epicor_results"] = [
+        build_epicor_entry(invoice_num, result)
+        for invoice_num, result in zip(categorization.invoice_numbers, results)
+    ]
+
+
+async def process_email_async(token_data, email_data, http_client: Optional[httpx.AsyncClient] = None, openai_client: Optional[AsyncOpenAI] = None):
+    owns_http_client = http_client is None
+    owns_openai_client = openai_client is None
+    if owns_http_client:
+        http_client = httpx.AsyncClient()
+    if owns_openai_client:
+        openai_client = create_async_openai_client()
+    
+    try:
+        context = build_email_context(token_data, email_data)
+        
+        if email_data.get('has_attachments', False):
+            raw_attachments = await get_email_attachments_async(http_client, token_data, context["email_id"], context["mailbox_id"])
+            if raw_attachments:
+                # PDF text extraction and image resizing are CPU-bound and would stall every other email on the loop
+                processed_attachments = await asyncio.to_thread(process_attachments, raw_attachments)
+                context["processed_attachments"] = processed_attachments
+                context["attachment_list"] = attachment_list_from(processed_attachments)
+        
+        await _classify(context, openai_client)
+        
+        # Epicor lookups only need the classification, so they overlap with the extraction call
+        await asyncio.gather(
+            _extract_invoice(context, http_client, openai_client),
+            _lookup_invoices(context, http_client)
+        )
+        
+        return build_result(context)
+    
+    finally:
+        if owns_http_client:
+            await http_client.aclose()
+        if owns_openai_client:
+            await openai_client.close()
+
+
+class AsyncEmailEngine:
+    def __init__(self, on_result: Callable[[Any, Dict[str, Any], str], Any], max_in_flight: int = 20, name: str = "async-email-engine",
+                 on_error: Optional[Callable[[str, Exception], Any]] = None):
+        self.on_result = on_result
+        self.on_error = on_error
+        self.workers = max(1, int(max_in_flight))
+        self.name = name
+        self._ownership = EmailOwnership()
+        # Submitting blocks once this many emails are in flight, which is the engine's backpressure
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._futures = set()
+        self._futures_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._openai_client: Optional[AsyncOpenAI] = None
+        self._accepting = False
+    
+    def start(self):
+        if self._accepting:
+            return self
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._open_clients(), self._loop).result()
+        self._accepting = True
+        return self
+    
+    async def _open_clients(self):
+        limits = httpx.Limits(max_connections=self.workers * 2, max_keepalive_connections=self.workers)
+        self._http_client = httpx.AsyncClient(limits=limits)
+        self._openai_client = create_async_openai_client(self.workers)
+    
+    async def _close_clients(self):
+        await self._http_client.aclose()
+        await self._openai_client.close()
+    
+    def submit(self, email_id: str, token_data, email, timeout: Optional[float] = None) -> bool:
+        if not self._accepting:
+            return False
+        if not self._ownership.claim(email_id):
+            return False
+        # A negative timeout does not block; without one the caller waits for a free slot as backpressure
+        acquired = self._slots.acquire() if timeout is None else self._slots.acquire(timeout=timeout)
+        if not acquired:
+            self._ownership.release(email_id)
+            return False
+        
+        future = asyncio.run_coroutine_threadsafe(self._handle(email_id, token_data, email), self._loop)
+        with self._futures_lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard_future)
+        return True
+    
+    def _discard_future(self, future):
+        with self._futures_lock:
+            self._futures.discard(future)
+    
+    async def _handle(self, email_id, token_data, email):
+        try:
+            print(f"Processing: {email.get('subject', 'No Subject')}")
+            result = await process_email_async(token_data, email, self._http_client, self._openai_client)
+            # Persistence uses the synchronous store and Graph batcher, so keep it off the event loop
+            await asyncio.to_thread(self.on_result, token_data, result, email_id)
+        except Exception as e:
+            log_error(f"{self.name}: failed to process email {email_id}", e)
+            await asyncio.to_thread(report_failure, self.on_error, email_id, e)
+        finally:
+            self._ownership.release(email_id)
+            self._slots.release()
+    
+    def is_owned(self, email_id: str) -> bool:
+        return self._ownership.is_owned(email_id)
+    
+    def in_flight(self) -> int:
+        return self._ownership.count()
+    
+    def shutdown(self, wait: bool = True):
+        if not self._accepting:
+            return
+        self._accepting = False
+        if wait:
+            with self._futures_lock:
+                pending = list(self._futures)
+            wait_futures(pending)
+        asyncio.run_coroutine_threadsafe(self._close_clients(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
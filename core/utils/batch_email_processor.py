@@ -0,0 +1,181 @@
+import sys
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.ai import classifier, invoice_extractor, combined_classifier
+from core.ai.llm_cache import CACHE_ENABLED, cache_key, get_cached, put_cached
+from core.ai.extraction_validation import EXTRACTION_TIERS
+from core.ai.model_router import route_model
+from core.ai.openai_batch import (
+    get_batch_client,
+    build_request,
+    split_requests,
+    submit_batch,
+    wait_for_batch,
+    collect_batch,
+    forget_batch,
+    pending_batches
+)
+from core.utils.email_processor import (
+    build_email_context,
+    build_result,
+    fetch_attachments_stage,
+    normalize_attachments_stage,
+    classify_stage,
+    extract_stage,
+    enrich_epicor_stage,
+    use_combined_call,
+    triage_stage
+)
+from core.utils.log_manager.log_manager import log_error
+
+
+# task -> (default model, response model, system prompt, input builder, reasoning effort)
+# A batch gets one pass per email, so the tiered tasks run at their last tier
+BATCH_TASKS = {
+    "classify": (
+        classifier.MODEL, classifier.EmailCategorization, classifier.SYSTEM_PROMPT,
+        classifier.build_categorization_input, "minimal"
+    ),
+    "extract": (
+        invoice_extractor.MODEL, invoice_extractor.InvoiceData, invoice_extractor.SYSTEM_PROMPT,
+        invoice_extractor.build_extraction_input, EXTRACTION_TIERS[-1]
+    ),
+    "classify_extract": (
+        combined_classifier.MODEL, combined_classifier.CombinedResult, combined_classifier.SYSTEM_PROMPT,
+        combined_classifier.build_combined_input, EXTRACTION_TIERS[-1]
+    ),
+}
+
+
+def _task_model(task, context):
+    # The live stages key their cache by the routed model, so the batch must route the same way to be found
+    default_model = BATCH_TASKS[task][0]
+    return route_model(task, default_model, context["sender_email"], context["body"], context["attachment_list"])["model"]
+
+
+def _task_cache_key(task, model, context):
+    _, response_model, system_prompt, _, _ = BATCH_TASKS[task]
+    return cache_key(task, model, system_prompt, response_model, context["sender_email"],
+                     context["subject"], context["body"], context["attachment_list"])
+
+
+def _task_request(task, model, context, custom_id):
+    _, response_model, _, build_input, effort = BATCH_TASKS[task]
+    # A batch can take up to a day, longer than an uploaded file is kept, so its PDFs travel inline
+    messages = build_input(context["sender_email"], context["sender_name"], context["subject"],
+                           context["body"], context["attachment_list"], inline_pdfs=True)
+    return build_request(custom_id, model, messages, response_model, effort)
+
+
+def collect_into_cache(client, batch_id: str, pending: Dict[str, Dict[str, str]]) -> int:
+    batch = wait_for_batch(client, batch_id)
+    if batch is None:
+        # Anything it would have answered runs live; a later run still collects the batch into the cache
+        return 0
+    outputs = collect_batch(client, batch)
+    
+    stored = 0
+    for custom_id, text in outputs.items():
+        entry = pending.get(custom_id)
+        if not entry:
+            continue
+        default_model, response_model, _, _, _ = BATCH_TASKS[entry["task"]]
+        try:
+            put_cached(entry["cache_key"], entry["task"], entry.get("model", default_model),
+                       response_model.model_validate_json(text))
+            stored += 1
+        except Exception as e:
+            log_error(f"Unparseable batch output for {custom_id}", e)
+    
+    forget_batch(batch_id)
+    print(f"✓ Batch {batch_id} {batch.status}: {stored}/{len(pending)} result(s) stored")
+    return stored
+
+
+def resume_pending_batches(client=None) -> int:
+    # Batches submitted before a crash are still billed; collect them before submitting new work
+    pending = pending_batches()
+    if not pending:
+        return 0
+    client = client or get_batch_client()
+    return sum(collect_into_cache(client, batch_id, entries) for batch_id, entries in pending.items())
+
+
+def run_llm_batch(client, work: List[Tuple[str, Dict[str, Any]]]) -> int:
+    requests = []
+    pending = {}
+    for index, (task, context) in enumerate(work):
+        model = _task_model(task, context)
+        key = _task_cache_key(task, model, context)
+        _, response_model, _, _, _ = BATCH_TASKS[task]
+        if get_cached(key, task, response_model) is not None:
+            continue
+        custom_id = f"{task}-{index}-{context['email_id']}"[:64]
+        requests.append(_task_request(task, model, context, custom_id))
+        pending[custom_id] = {"task": task, "cache_key": key, "model": model}
+    
+    if not requests:
+        return 0
+    # Every chunk is submitted before any is waited on, so they run side by side
+    submitted = {}
+    for chunk in split_requests(requests):
+        chunk_pending = {request["custom_id"]: pending[request["custom_id"]] for request in chunk}
+        batch_id = submit_batch(client, chunk, chunk_pending)
+        if batch_id:
+            submitted[batch_id] = chunk_pending
+    return sum(collect_into_cache(client, batch_id, chunk_pending) for batch_id, chunk_pending in submitted.items())
+
+
+def process_emails_in_batch(
+    token_data,
+    emails: List[Dict[str, Any]],
+    on_result: Callable[[Any, Dict[str, Any]], Any],
+    on_error: Optional[Callable[[Dict[str, Any], Exception], Any]] = None
+) -> int:
+    if not CACHE_ENABLED:
+        # Batch results are handed over through the LLM cache, so without it every call would be repeated live
+        print("⚠️ LLM_CACHE is disabled; batch mode needs it, processing interactively instead")
+    
+    client = get_batch_client()
+    contexts = []
+    for email in emails:
+        try:
+            context = build_email_context(token_data, email)
+            contexts.append(normalize_attachments_stage(fetch_attachments_stage(context)))
+        except Exception as e:
+            log_error(f"Batch: failed to prepare email {email.get('id')}", e)
+            if on_error:
+                on_error(email, e)
+    
+    if CACHE_ENABLED:
+        resume_pending_batches(client)
+        run_llm_batch(client, [
+            ("classify_extract" if use_combined_call(context) else "classify", context)
+            for context in contexts if not triage_stage(context)
+        ])
+    
+    # The normal stages now read the batch results from the cache; anything the batch missed runs live
+    for context in contexts:
+        classify_stage(context)
+    
+    if CACHE_ENABLED:
+        run_llm_batch(client, [
+            ("extract", context) for context in contexts
+            if context["categorization"].email_type == 'new_invoice' and context["invoice_data"] is None
+        ])
+    
+    processed = 0
+    for context in contexts:
+        try:
+            extract_stage(context)
+            enrich_epicor_stage(context)
+            on_result(token_data, build_result(context))
+            processed += 1
+        except Exception as e:
+            log_error(f"Batch: failed to finish email {context['email_id']}", e)
+            if on_error:
+                on_error(context["email"], e)
+    return processed
@@ -7,104 +7,199 @@ from core.integrations.outlook.client import get_email_attachments
 from core.integrations.outlook.attachments import process_attachments
 from core.ai.classifier import categorize_email
 from core.ai.invoice_extractor import extract_invoice_data
+from core.ai.combined_classifier import classify_and_extract, combined_mode_enabled, looks_like_invoice
+from core.ai.local_triage import triage_email
 from core.integrations.epicor.invoices import get_invoice_from_epicor
 from core.utils.vendor_finder import match_vendor_from_invoice
 
 
-def process_email(token_data, email_data):
-    email_id = email_data.get('id')
-    sender_email = email_data.get('sender_email', '')
-    sender_name = email_data.get('sender_name', '')
-    subject = email_data.get('subject', 'No Subject')
-    body = email_data.get('body_content', '')
-    has_attachments = email_data.get('has_attachments', False)
-    
-    processed_attachments = None
-    attachment_list = None
+def build_email_context(token_data, email_data):
+    return {
+        "token_data": token_data,
+        "email": email_data,
+        "email_id": email_data.get('id'),
+        "mailbox_id": email_data.get('mailbox_id'),
+        "sender_email": email_data.get('sender_email', ''),
+        "sender_name": email_data.get('sender_name', ''),
+        "subject": email_data.get('subject', 'No Subject'),
+        "body": email_data.get('body_content', ''),
+        "raw_attachments": None,
+        "processed_attachments": None,
+        "attachment_list": None,
+        "triaged": False,
+        "categorization": None,
+        "invoice_data": None,
+        "epicor_results": [],
+        "extracted_invoice_data": None
+    }
+
+
+def attachment_list_from(processed_attachments):
+    images = processed_attachments.get('images', [])
+    other_files = processed_attachments.get('other_files', [])
+    return images + other_files if (images or other_files) else None
+
+
+def build_epicor_entry(invoice_num, result):
+    return {
+        "invoice_number": invoice_num,
+        "found_in_epicor": result["found"],
+        "epicor_url": result.get("epicor_url"),
+        "invoice_data": result.get("invoice_details")
+    }
+
+
+def format_extracted_invoice_data(invoice_data, vendor_matches):
+    return {
+        "vendor_name": invoice_data.vendor_name,
+        "vendor_name_confidence": invoice_data.vendor_name_confidence,
+        "invoice_number": invoice_data.invoice_number,
+        "invoice_number_confidence": invoice_data.invoice_number_confidence,
+        "invoice_date": invoice_data.invoice_date,
+        "invoice_date_confidence": invoice_data.invoice_date_confidence,
+        "invoice_total": invoice_data.invoice_total,
+        "invoice_total_confidence": invoice_data.invoice_total_confidence,
+        "line_items": [
+            {
+                "part_number": item.part_number,
+                "description": item.line_description,
+                "quantity": item.quantity,
+                "unit_price": item.unit_price,
+                "line_total": item.line_total or (item.quantity * item.unit_price),
+                "confidence": item.confidence
+            }
+            for item in invoice_data.line_items
+        ],
+        "extraction_notes": invoice_data.extraction_notes,
+        "vendor_matches": vendor_matches
+    }
+
+
+def fetch_attachments_stage(context):
+    if context["email"].get('has_attachments', False):
+        context["raw_attachments"] = get_email_attachments(context["token_data"], context["email_id"], context["mailbox_id"])
+    return context
+
+
+def normalize_attachments_stage(context):
+    raw_attachments = context["raw_attachments"]
+    if raw_attachments:
+        processed_attachments = process_attachments(raw_attachments)
+        context["processed_attachments"] = processed_attachments
+        context["attachment_list"] = attachment_list_from(processed_attachments)
+    # Raw Graph payloads hold the same base64 data again; drop them once normalized
+    context["raw_attachments"] = None
+    return context
+
+
+def use_combined_call(context):
+    return combined_mode_enabled() and looks_like_invoice(context["subject"], context["body"], context["attachment_list"])
+
+
+def triage_stage(context):
+    # Confident local predictions for low-stakes categories skip the LLM entirely.
+    # The batch path triages before classify_stage does, so the prediction (and its stats) is made only once
+    if context["triaged"]:
+        return context["categorization"] is not None
+    context["triaged"] = True
+    categorization = triage_email(context["sender_email"], context["subject"])
+    if categorization:
+        print(f"\n⚡ Local triage: {categorization.email_type} ({categorization.reason})")
+    context["categorization"] = categorization
+    return categorization is not None
+
+
+def classify_stage(context):
+    if context["categorization"] is not None or triage_stage(context):
+        return context
     
-    if has_attachments:
-        raw_attachments = get_email_attachments(token_data, email_id)
-        if raw_attachments:
-            processed_attachments = process_attachments(raw_attachments)
-            images = processed_attachments.get('images', [])
-            other_files = processed_attachments.get('other_files', [])
-            attachment_list = images + other_files if (images or other_files) else None
+    # Invoice-looking emails get classification and extraction from one call, sending the PDFs once
+    if use_combined_call(context):
+        context["categorization"], context["invoice_data"] = classify_and_extract(
+            sender_email=context["sender_email"],
+            sender_name=context["sender_name"],
+            subject=context["subject"],
+            body=context["body"],
+            attachments=context["attachment_list"]
+        )
+        return context
     
-    categorization = categorize_email(
-        sender_email=sender_email,
-        sender_name=sender_name,
-        subject=subject,
-        body=body,
-        attachments=attachment_list
+    context["categorization"] = categorize_email(
+        sender_email=context["sender_email"],
+        sender_name=context["sender_name"],
+        subject=context["subject"],
+        body=context["body"],
+        attachments=context["attachment_list"]
     )
+    return context
+
+
+def extract_stage(context):
+    # Skipped when the combined call already returned the invoice data
+    if context["categorization"].email_type == 'new_invoice' and context["invoice_data"] is None:
+        print(f"\n🔍 Email categorized as new_invoice - extracting invoice data...")
+        
+        context["invoice_data"] = extract_invoice_data(
+            sender_email=context["sender_email"],
+            sender_name=context["sender_name"],
+            subject=context["subject"],
+            body=context["body"],
+            attachments=context["attachment_list"]
+        )
+    return context
+
+
+def enrich_epicor_stage(context):
+    categorization = context["categorization"]
     
     epicor_results = []
     if categorization.has_invoice and categorization.invoice_numbers:
         for invoice_num in categorization.invoice_numbers:
             result = get_invoice_from_epicor(invoice_num)
-            
-            invoice_entry = {
-                "invoice_number": invoice_num,
-                "found_in_epicor": result["found"],
-                "epicor_url": result.get("epicor_url"),
-                "invoice_data": result.get("invoice_details")
-            }
-            epicor_results.append(invoice_entry)
+            epicor_results.append(build_epicor_entry(invoice_num, result))
+    context["epicor_results"] = epicor_results
     
-    extracted_invoice_data = None
-    vendor_matches = []
-    
-    if categorization.email_type == 'new_invoice':
-        print(f"\n🔍 Email categorized as new_invoice - extracting invoice data...")
+    invoice_data = context["invoice_data"]
+    if invoice_data:
+        vendor_matches = match_vendor_from_invoice(invoice_data.vendor_name)
         
-        invoice_data = extract_invoice_data(
-            sender_email=sender_email,
-            sender_name=sender_name,
-            subject=subject,
-            body=body,
-            attachments=attachment_list
-        )
+        context["extracted_invoice_data"] = format_extracted_invoice_data(invoice_data, vendor_matches)
         
-        if invoice_data:
-            vendor_matches = match_vendor_from_invoice(invoice_data.vendor_name)
-            
-            extracted_invoice_data = {
-                "vendor_name": invoice_data.vendor_name,
-                "vendor_name_confidence": invoice_data.vendor_name_confidence,
-                "invoice_number": invoice_data.invoice_number,
-                "invoice_number_confidence": invoice_data.invoice_number_confidence,
-                "invoice_date": invoice_data.invoice_date,
-                "invoice_date_confidence": invoice_data.invoice_date_confidence,
-                "invoice_total": invoice_data.invoice_total,
-                "invoice_total_confidence": invoice_data.invoice_total_confidence,
-                "line_items": [
-                    {
-                        "part_number": item.part_number,
-                        "description": item.line_description,
-                        "quantity": item.quantity,
-                        "unit_price": item.unit_price,
-                        "line_total": item.line_total or (item.quantity * item.unit_price),
-                        "confidence": item.confidence
-                    }
-                    for item in invoice_data.line_items
-                ],
-                "extraction_notes": invoice_data.extraction_notes,
-                "vendor_matches": vendor_matches
-            }
-            
-            print(f"✅ Invoice data extraction complete")
-    
+        print(f"✅ Invoice data extraction complete")
+    return context
+
+
+def build_result(context):
+    categorization = context["categorization"]
     return {
-        "email_id": email_id,
-        "subject": subject,
-        "sender_name": sender_name,
-        "sender_email": sender_email,
+        "email_id": context["email_id"],
+        "subject": context["subject"],
+        "sender_name": context["sender_name"],
+        "sender_email": context["sender_email"],
         "category": categorization.email_type,
         "reason": categorization.reason,
         "has_invoice": categorization.has_invoice,
         "invoice_numbers": categorization.invoice_numbers,
-        "epicor_results": epicor_results,
-        "extracted_invoice_data": extracted_invoice_data,
-        "internet_message_id": email_data.get('internet_message_id')
+        "epicor_results": context["epicor_results"],
+        "extracted_invoice_data": context["extracted_invoice_data"],
+        "internet_message_id": context["email"].get('internet_message_id')
     }
 
+
+# Ordered processing stages for the monitor's queued pipeline engine
+PROCESSING_STAGES = [
+    ("fetch", fetch_attachments_stage),
+    ("normalize", normalize_attachments_stage),
+    ("classify", classify_stage),
+    ("extract", extract_stage),
+    ("enrich", enrich_epicor_stage),
+]
+
+
+def process_email(token_data, email_data):
+    # Runs the pipeline stages in the calling thread, so pool workers and backfill share the pooled
+    # OpenAI client and the Graph batcher, and callers may already be inside an event loop
+    context = build_email_context(token_data, email_data)
+    for _, stage in PROCESSING_STAGES:
+        context = stage(context)
+    return build_result(context)
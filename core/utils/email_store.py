@@ -0,0 +1,327 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.utils.secret_manager import get_setting
+from core.utils.log_manager.log_manager import log_error
+
+
+DATA_DIR = 'emails_data'
+STORE_PATH = get_setting("Email-Store-Path", os.path.join(DATA_DIR, 'emails.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_emails (
+    email_id TEXT PRIMARY KEY,
+    internet_message_id TEXT,
+    message_key TEXT,
+    category TEXT,
+    data TEXT NOT NULL,
+    processed_at TEXT NOT NULL,
+    sender_email TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_processed_emails_message_key ON processed_emails(message_key);
+
+CREATE TABLE IF NOT EXISTS email_jobs (
+    job_key TEXT PRIMARY KEY,
+    email_id TEXT NOT NULL,
+    payload TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_email_jobs_due ON email_jobs(status, next_attempt_at);
+
+CREATE TABLE IF NOT EXISTS email_copies (
+    email_id TEXT PRIMARY KEY,
+    mailbox_id TEXT NOT NULL,
+    message_key TEXT NOT NULL,
+    categorized_at TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_email_copies_message_key ON email_copies(message_key);
+
+CREATE TABLE IF NOT EXISTS llm_cache (
+    cache_key TEXT PRIMARY KEY,
+    task TEXT NOT NULL,
+    model TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used_at);
+
+CREATE TABLE IF NOT EXISTS uploaded_files (
+    content_hash TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    filename TEXT,
+    size INTEGER NOT NULL,
+    uploaded_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_uploaded_files_expires ON uploaded_files(expires_at);
+
+CREATE TABLE IF NOT EXISTS routing_decisions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task TEXT NOT NULL,
+    model TEXT NOT NULL,
+    default_model TEXT NOT NULL,
+    route TEXT NOT NULL,
+    sender_email TEXT,
+    features TEXT,
+    outcome TEXT,
+    latency_ms REAL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cost_usd REAL NOT NULL DEFAULT 0,
+    shadow_agreed INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_routing_decisions_sender ON routing_decisions(sender_email, task);
+CREATE INDEX IF NOT EXISTS idx_routing_decisions_created ON routing_decisions(created_at);
+
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Columns added to a table after it first shipped; CREATE TABLE IF NOT EXISTS leaves existing tables alone
+COLUMN_MIGRATIONS = [
+    ("email_jobs", "lease_owner", "TEXT"),
+    ("email_jobs", "lease_expires_at", "REAL"),
+    ("processed_emails", "sender_email", "TEXT"),
+]
+
+# Fills a migrated column for the rows that existed before it
+COLUMN_BACKFILLS = {
+    ("processed_emails", "sender_email"):
+        "UPDATE processed_emails SET sender_email = lower(trim(json_extract(data, '$.sender_email')))",
+}
+
+# Indexes on migrated columns can only be created once the migrations have run
+MIGRATED_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_processed_emails_sender ON processed_emails(sender_email);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def message_key(internet_message_id: Optional[str]) -> Optional[str]:
+    # The add-in sends the id without angle brackets while Graph includes them
+    if not internet_message_id:
+        return None
+    return internet_message_id.strip().strip('<>')
+
+
+def dedup_key(email_id: str, internet_message_id: Optional[str]) -> str:
+    # The same message delivered to several mailboxes shares one internetMessageId but gets a Graph id per mailbox
+    return message_key(internet_message_id) or email_id
+
+
+def get_connection() -> sqlite3.Connection:
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        directory = os.path.dirname(STORE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(STORE_PATH, timeout=30)
+        connection.row_factory = sqlite3.Row
+        # WAL lets the Flask readers and the monitor writers work at the same time
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=30000")
+        _local.connection = connection
+    _ensure_initialized(connection)
+    return connection
+
+
+def _ensure_initialized(connection):
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        connection.executescript(SCHEMA)
+        _apply_column_migrations(connection)
+        connection.executescript(MIGRATED_INDEXES)
+        _initialized = True
+    if get_meta('json_migrated') is None:
+        migrate_json_directory()
+
+
+def _apply_column_migrations(connection):
+    for table, column, column_type in COLUMN_MIGRATIONS:
+        existing = {row['name'] for row in connection.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            with connection:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                if (table, column) in COLUMN_BACKFILLS:
+                    connection.execute(COLUMN_BACKFILLS[(table, column)])
+
+
+def get_meta(key: str) -> Optional[str]:
+    row = get_connection().execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+    return row['value'] if row else None
+
+
+def set_meta(key: str, value: str):
+    connection = get_connection()
+    with connection:
+        connection.execute(
+            "INSERT INTO store_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+
+def delete_meta(key: str):
+    connection = get_connection()
+    with connection:
+        connection.execute("DELETE FROM store_meta WHERE key = ?", (key,))
+
+
+def _upsert_result(connection, email_result: Dict[str, Any], processed_at: str):
+    internet_message_id = email_result.get('internet_message_id')
+    connection.execute(
+        """
+        INSERT INTO processed_emails (email_id, internet_message_id, message_key, category, data, processed_at, sender_email)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(email_id) DO UPDATE SET
+            internet_message_id = excluded.internet_message_id,
+            message_key = excluded.message_key,
+            category = excluded.category,
+            data = excluded.data,
+            processed_at = excluded.processed_at,
+            sender_email = excluded.sender_email
+        """,
+        (
+            email_result['email_id'],
+            internet_message_id,
+            message_key(internet_message_id),
+            email_result.get('category'),
+            json.dumps(email_result),
+            processed_at,
+            # Lowercased like the model router's lookups, which count a sender's emails through this column's index
+            (email_result.get('sender_email') or '').strip().lower() or None
+        )
+    )
+
+
+def save_email_result(email_result: Dict[str, Any]):
+    connection = get_connection()
+    with connection:
+        _upsert_result(connection, email_result, _now())
+
+
+def is_email_processed(email_id: str) -> bool:
+    connection = get_connection()
+    row = connection.execute("SELECT 1 FROM processed_emails WHERE email_id = ?", (email_id,)).fetchone()
+    if row is None:
+        # A copy in another mailbox counts once the shared result has been linked to it
+        row = connection.execute(
+            "SELECT 1 FROM email_copies WHERE email_id = ? AND categorized_at IS NOT NULL",
+            (email_id,)
+        ).fetchone()
+    return row is not None
+
+
+def get_email_result(lookup_id: str) -> Optional[Dict[str, Any]]:
+    connection = get_connection()
+    row = connection.execute("SELECT data FROM processed_emails WHERE email_id = ?", (lookup_id,)).fetchone()
+    if row is None:
+        row = connection.execute(
+            "SELECT data FROM processed_emails WHERE message_key = ? ORDER BY processed_at DESC LIMIT 1",
+            (message_key(lookup_id),)
+        ).fetchone()
+    if row is None:
+        row = connection.execute(
+            """
+            SELECT p.data FROM email_copies c
+            JOIN processed_emails p ON p.message_key = c.message_key OR p.email_id = c.message_key
+            WHERE c.email_id = ?
+            ORDER BY p.processed_at DESC LIMIT 1
+            """,
+            (lookup_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    return json.loads(row['data'])
+
+
+def record_email_copy(email: Dict[str, Any]):
+    connection = get_connection()
+    with connection:
+        connection.execute(
+            "INSERT OR IGNORE INTO email_copies (email_id, mailbox_id, message_key, created_at) VALUES (?, ?, ?, ?)",
+            (email['id'], email.get('mailbox_id') or '', dedup_key(email['id'], email.get('internet_message_id')), _now())
+        )
+
+
+def get_email_copies(key: str) -> List[Dict[str, Any]]:
+    rows = get_connection().execute(
+        "SELECT email_id, mailbox_id, categorized_at FROM email_copies WHERE message_key = ? ORDER BY created_at",
+        (key,)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def mark_copy_categorized(email_id: str):
+    connection = get_connection()
+    with connection:
+        connection.execute("UPDATE email_copies SET categorized_at = ? WHERE email_id = ?", (_now(), email_id))
+
+
+def migrate_json_directory(directory: str = DATA_DIR) -> int:
+    connection = get_connection()
+    migrated = 0
+
+    if os.path.isdir(directory):
+        with connection:
+            for filename in sorted(os.listdir(directory)):
+                if not filename.endswith('.json') or filename in ('id_mapping.json', 'sync_state.json'):
+                    continue
+                file_path = os.path.join(directory, filename)
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        email_result = json.load(f)
+                    if not email_result.get('email_id'):
+                        continue
+                    processed_at = datetime.fromtimestamp(os.path.getmtime(file_path), timezone.utc).isoformat()
+                    _upsert_result(connection, email_result, processed_at)
+                    migrated += 1
+                except Exception as e:
+                    log_error(f"Failed to migrate {file_path} into the email store", e)
+
+    set_meta('json_migrated', _now())
+    if migrated:
+        print(f"Email store: migrated {migrated} processed email(s) from {directory}/")
+    return migrated
+
+
+if __name__ == "__main__":
+    count = migrate_json_directory(sys.argv[1] if len(sys.argv) > 1 else DATA_DIR)
+    print(f"Migrated {count} processed email(s) into {STORE_PATH}")
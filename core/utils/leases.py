@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import uuid
+import socket
+import threading
+from typing import Callable, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.utils.secret_manager import get_setting
+from core.utils.email_store import get_connection
+from core.utils.log_manager.log_manager import log_error
+
+
+# Every monitor process gets its own identity; set NODE_ID to keep it stable across restarts
+NODE_ID = get_setting("Node-Id") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+LEASE_SECONDS = float(get_setting("Lease-Seconds", 120))
+# Renew well inside the lease so one slow heartbeat never lets a lease lapse
+HEARTBEAT_SECONDS = LEASE_SECONDS / 3
+
+_heartbeat_callbacks: List[Callable[[], None]] = []
+_heartbeat_stop = threading.Event()
+_heartbeat_thread = None
+
+
+def acquire_lease(name: str, ttl: float = LEASE_SECONDS) -> bool:
+    connection = get_connection()
+    now = time.time()
+    with connection:
+        connection.execute("BEGIN IMMEDIATE")
+        row = connection.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        if row and row['owner'] != NODE_ID and row['expires_at'] > now:
+            return False
+        connection.execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+            (name, NODE_ID, now + ttl)
+        )
+    return True
+
+
+def renew_lease(name: str, ttl: float = LEASE_SECONDS) -> bool:
+    connection = get_connection()
+    with connection:
+        cursor = connection.execute(
+            "UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ?",
+            (time.time() + ttl, name, NODE_ID)
+        )
+    return cursor.rowcount > 0
+
+
+def release_lease(name: str):
+    connection = get_connection()
+    with connection:
+        connection.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, NODE_ID))
+
+
+def get_lease_owner(name: str) -> Optional[str]:
+    row = get_connection().execute(
+        "SELECT owner FROM leases WHERE name = ? AND expires_at > ?",
+        (name, time.time())
+    ).fetchone()
+    return row['owner'] if row else None
+
+
+def register_heartbeat(callback: Callable[[], None]):
+    if callback not in _heartbeat_callbacks:
+        _heartbeat_callbacks.append(callback)
+
+
+def _run_heartbeat():
+    while not _heartbeat_stop.wait(HEARTBEAT_SECONDS):
+        for callback in list(_heartbeat_callbacks):
+            try:
+                callback()
+            except Exception as e:
+                log_error(f"Lease heartbeat failed on {NODE_ID}", e)
+
+
+def start_heartbeat():
+    global _heartbeat_thread
+    if _heartbeat_thread and _heartbeat_thread.is_alive():
+        return
+    _heartbeat_stop.clear()
+    _heartbeat_thread = threading.Thread(target=_run_heartbeat, name="lease-heartbeat", daemon=True)
+    _heartbeat_thread.start()
+
+
+def stop_heartbeat():
+    _heartbeat_stop.set()
+    if _heartbeat_thread and _heartbeat_thread.is_alive():
+        _heartbeat_thread.join()
@@ -1,14 +1,52 @@
 import threading
 import time
-import json
 import os
 import sys
+import atexit
+import queue
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.integrations.outlook.client import get_emails, authenticate_graph_api, graph_api_request
-from core.utils.secret_manager import get_outlook_secrets
-from core.utils.email_processor import process_email
+from core.integrations.outlook.client import get_emails, get_email_delta, get_graph_token
+from core.integrations.outlook.batch import batched_graph_request, get_emails_by_id
+from core.utils.secret_manager import get_outlook_secrets, get_setting
+from core.utils.email_processor import process_email, build_email_context, build_result, PROCESSING_STAGES
+from core.utils.worker_pool import EmailWorkerPool
+from core.utils.pipeline import EmailPipeline, PipelineStage
+from core.utils.async_email_processor import AsyncEmailEngine
+from core.utils.sync_state import load_delta_link, save_delta_link
+from core.utils.email_store import (
+    save_email_result,
+    is_email_processed,
+    get_email_result,
+    dedup_key,
+    record_email_copy,
+    get_email_copies,
+    mark_copy_categorized
+)
+from core.utils.result_cache import cache_email_result
+from core.utils.work_queue import (
+    enqueue_email_job,
+    claim_due_jobs,
+    mark_job_succeeded,
+    mark_job_failed,
+    release_job,
+    recover_in_progress_jobs,
+    renew_job_leases,
+    next_due_time,
+    DEAD
+)
+from core.utils.leases import (
+    NODE_ID,
+    acquire_lease,
+    renew_lease,
+    release_lease,
+    register_heartbeat,
+    start_heartbeat,
+    stop_heartbeat
+)
+from core.ai.classifier import CLASSIFICATION_ERROR_PREFIX
+from core.utils.poll_scheduler import PollScheduler, seconds_since
 
 
 CATEGORY_MAPPING = {
@@ -20,84 +58,413 @@ CATEGORY_MAPPING = {
     "other": "Purple category"
 }
 
+POLL_INTERVAL_SECONDS = 60
+# How often the loop wakes to dispatch jobs whose retry backoff has elapsed
+JOB_CHECK_SECONDS = 15
+# Only the node holding this lease polls Graph; every node processes jobs
+POLLER_LEASE = "monitor-poller"
 
-def apply_category_to_email(token_data, email_id, category):
-    secrets = get_outlook_secrets()
-    mailbox_id = secrets['mailbox_id']
+_stop_event = threading.Event()
+_monitor_thread = None
+_notifications = queue.Queue()
+_poll_scheduler = None
+
+
+def apply_category_to_email(token_data, email_id, category, mailbox_id=None):
+    if not mailbox_id:
+        secrets = get_outlook_secrets()
+        mailbox_id = secrets['mailbox_id']
     
     category_name = CATEGORY_MAPPING.get(category, "Purple category")
     
     endpoint = f"users/{mailbox_id}/messages/{email_id}"
     data = {"categories": [category_name]}
     
-    result = graph_api_request(token_data, 'PATCH', endpoint, data=data)
+    # Concurrent workers' category writes are coalesced into shared $batch calls
+    result = batched_graph_request(token_data, 'PATCH', endpoint, data=data)
     return result is not None
 
 
 def save_processed_email(email_result):
-    os.makedirs('emails_data', exist_ok=True)
+    save_email_result(email_result)
+    # The monitor shares the Flask process, so refresh the API's in-memory copy right away
+    cache_email_result(email_result)
+
+
+# Default worker counts per pipeline stage; the LLM stages are the slow ones
+PIPELINE_STAGE_WORKERS = {
+    "fetch": 2,
+    "normalize": 1,
+    "classify": 4,
+    "extract": 4,
+    "enrich": 2,
+    "persist": 1
+}
+
+
+def categorize_copies(token_data, result):
+    key = dedup_key(result['email_id'], result.get('internet_message_id'))
+    copies = get_email_copies(key)
+    if not copies:
+        apply_category_to_email(token_data, result['email_id'], result['category'])
+        return key
     
-    email_id = email_result['email_id']
-    internet_message_id = email_result.get('internet_message_id', '')
+    # One classification covers every mailbox that received the message
+    for copy in copies:
+        if copy['categorized_at']:
+            continue
+        if apply_category_to_email(token_data, copy['email_id'], result['category'], copy['mailbox_id']):
+            mark_copy_categorized(copy['email_id'])
+    return key
+
+
+def persist_result(token_data, result, job_key=None):
+    # A fallback classification means the LLM call failed; fail the job so it is retried instead of stored
+    if result['reason'].startswith(CLASSIFICATION_ERROR_PREFIX):
+        raise RuntimeError(result['reason'])
     
-    file_path = os.path.join('emails_data', f"{email_id}.json")
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(email_result, f, indent=2)
+    save_processed_email(result)
+    categorize_copies(token_data, result)
+    # Only emails dispatched from a claimed job have one to settle; backfill saves emails without a job row
+    if job_key and not mark_job_succeeded(job_key):
+        print(f"  ⚠️ Lease on job {job_key} was lost; another node owns it now")
     
-    id_mapping_path = os.path.join('emails_data', 'id_mapping.json')
-    if os.path.exists(id_mapping_path):
-        with open(id_mapping_path, 'r', encoding='utf-8') as f:
-            id_mapping = json.load(f)
-    else:
-        id_mapping = {}
+    print(f"  ✓ Categorized as: {result['category']}")
+    if result['has_invoice']:
+        print(f"  ✓ Invoices: {', '.join(result['invoice_numbers'])}")
+
+
+def handle_email(email_id, token_data, email):
+    subject = email.get('subject', 'No Subject')
+    print(f"Processing: {subject}")
     
-    if internet_message_id:
-        id_mapping[internet_message_id] = email_id
-        with open(id_mapping_path, 'w', encoding='utf-8') as f:
-            json.dump(id_mapping, f, indent=2)
+    result = process_email(token_data, email)
+    persist_result(token_data, result, email_id)
 
 
-def monitor_emails():
-    print("Email monitor started, checking every 60 seconds...")
+def persist_stage(context):
+    persist_result(context["token_data"], build_result(context), context["job_key"])
+    return context
+
+
+def record_job_failure(job_key, error):
+    status = mark_job_failed(job_key, str(error))
+    if status == DEAD:
+        print(f"  ✗ Email {job_key} failed too many times, moved to dead-letter")
+
+
+def create_worker_pool():
+    workers = int(get_setting("Monitor-Workers", 4))
+    queue_size = int(get_setting("Monitor-Queue-Size", workers * 2))
+    return EmailWorkerPool(handle_email, workers=workers, queue_size=queue_size, name="email-worker",
+                           on_error=record_job_failure)
+
+
+def create_pipeline():
+    queue_size = int(get_setting("Pipeline-Queue-Size", 8))
+    stages = []
+    for name, handler in PROCESSING_STAGES + [("persist", persist_stage)]:
+        workers = int(get_setting(f"Pipeline-{name}-Workers", PIPELINE_STAGE_WORKERS.get(name, 1)))
+        stages.append(PipelineStage(name, handler, workers=workers, queue_size=queue_size))
+    
+    def build_context(job_key, token_data, email):
+        # Processors are handed the claimed job key as the email id; the persist stage settles that job
+        context = build_email_context(token_data, email)
+        context["job_key"] = job_key
+        return context
+    
+    return EmailPipeline(stages, build_context=build_context, on_error=record_job_failure)
+
+
+def create_async_engine():
+    max_in_flight = int(get_setting("Async-Max-In-Flight", 20))
+    return AsyncEmailEngine(persist_result, max_in_flight=max_in_flight, on_error=record_job_failure)
+
+
+def create_processor():
+    engine = get_setting("Monitor-Engine", "pipeline").lower()
+    if engine == "pool":
+        return create_worker_pool()
+    if engine == "async":
+        return create_async_engine()
+    return create_pipeline()
+
+
+def get_mailbox_ids():
+    return get_outlook_secrets()['mailbox_ids']
+
+
+def fetch_unread_emails(token_data, mailbox_id):
+    return get_emails(token_data, mailbox_id=mailbox_id, folder="inbox", limit=10, include_read=False)
+
+
+def fetch_delta_emails(token_data, mailbox_id, folder="inbox"):
+    lookback_days = int(get_setting("Delta-Sync-Lookback-Days", 1))
+    
+    changes = get_email_delta(token_data, mailbox_id, folder,
+                              delta_link=load_delta_link(mailbox_id, folder),
+                              lookback_days=lookback_days)
+    if changes is None:
+        return [], None
+    if changes['reset']:
+        save_delta_link(mailbox_id, None, folder)
+        return [], None
     
+    # Delta also reports edits (including our own category PATCH), so only pull full bodies for unseen ids
+    new_ids = [
+        message.get('id') for message in changes['emails']
+        if message.get('id') and not is_email_processed(message.get('id'))
+    ]
+    emails, missing = get_emails_by_id(token_data, new_ids, mailbox_id)
+    if missing:
+        # Delta never reports these ids again once the cursor moves, so keep it until every body is fetched
+        print(f"Could not fetch {len(missing)} new email(s) from {mailbox_id}, keeping the delta cursor for the next poll")
+        return emails, None
+    
+    return emails, lambda: save_delta_link(mailbox_id, changes['delta_link'], folder)
+
+
+def fetch_new_emails(token_data, mailbox_id):
+    if get_setting("Monitor-Sync-Mode", "delta").lower() == "poll":
+        return fetch_unread_emails(token_data, mailbox_id), None
+    return fetch_delta_emails(token_data, mailbox_id)
+
+
+def enqueue_emails(token_data, emails):
+    enqueued = 0
+    for email in emails:
+        email_id = email.get('id')
+        if not email_id or is_email_processed(email_id):
+            continue
+        
+        record_email_copy(email)
+        if enqueue_email_job(email):
+            enqueued += 1
+            continue
+        
+        # Another mailbox already queued this message; if its result is in, link this copy now
+        result = get_email_result(email_id)
+        if result:
+            categorize_copies(token_data, result)
+    return enqueued
+
+
+def dispatch_due_jobs(pool, token_data):
+    dispatched = 0
+    while not _stop_event.is_set():
+        jobs = claim_due_jobs(pool.workers)
+        if not jobs:
+            break
+        
+        for index, job in enumerate(jobs):
+            if is_email_processed(job['email_id']):
+                mark_job_succeeded(job['job_key'])
+                continue
+            
+            # Processors own emails by job key, so copies of one message can never be in flight together.
+            # Blocks while the processor's queues are full, so draining runs at pipeline speed
+            if _stop_event.is_set() or not pool.submit(job['job_key'], token_data, job['payload']):
+                for unsubmitted in jobs[index:]:
+                    release_job(unsubmitted['job_key'])
+                return dispatched
+            dispatched += 1
+    return dispatched
+
+
+def catch_up_backlog(token_data):
+    print("Catch-up: queueing unread backlog...")
+    started = time.time()
+    
+    enqueued = 0
+    for mailbox_id in get_mailbox_ids():
+        backlog = get_emails(token_data, mailbox_id=mailbox_id, folder="inbox", limit=None, include_read=False, paginate=True)
+        enqueued += enqueue_emails(token_data, backlog)
+    
+    print(f"Catch-up: queued {enqueued} backlog email(s) in {time.time() - started:.1f}s, returning to steady-state polling")
+    return enqueued
+
+
+def notify_new_messages(messages):
+    # Each notification is a (mailbox_id, message_id) pair; a None mailbox means the primary mailbox
+    for mailbox_id, message_id in messages:
+        if message_id:
+            _notifications.put((mailbox_id, message_id))
+
+
+def wait_for_notifications(timeout):
+    try:
+        first = _notifications.get(timeout=max(0, timeout))
+    except queue.Empty:
+        return []
+    
+    # Take everything that arrived together so one burst becomes one round
+    messages = [first] if first else []
     while True:
         try:
-            token_data = authenticate_graph_api()
+            message = _notifications.get_nowait()
+        except queue.Empty:
+            break
+        if message:
+            messages.append(message)
+    return list(dict.fromkeys(messages))
+
+
+def enqueue_notified_emails(token_data, messages):
+    by_mailbox = {}
+    for mailbox_id, message_id in messages:
+        if not is_email_processed(message_id):
+            by_mailbox.setdefault(mailbox_id, []).append(message_id)
+    
+    enqueued = 0
+    for mailbox_id, message_ids in by_mailbox.items():
+        emails, missing = get_emails_by_id(token_data, message_ids, mailbox_id)
+        if missing:
+            # The next delta poll still reports these, since the cursor only advances once they are fetched
+            print(f"Could not fetch {len(missing)} notified email(s), leaving them to the next poll")
+        enqueued += enqueue_emails(token_data, emails)
+    return enqueued
+
+
+def next_wake_time(next_poll):
+    wake_at = min(next_poll, time.time() + JOB_CHECK_SECONDS)
+    due = next_due_time()
+    return min(wake_at, due) if due is not None else wake_at
+
+
+def create_poll_scheduler():
+    # With change notifications wired up, polling is only a safety net for missed notifications
+    if get_setting("Graph-Notification-URL"):
+        default_ceiling = int(get_setting("Monitor-Fallback-Poll-Seconds", 300))
+    else:
+        default_ceiling = 600
+    return PollScheduler(
+        floor=float(get_setting("Monitor-Poll-Floor-Seconds", 15)),
+        ceiling=float(get_setting("Monitor-Poll-Ceiling-Seconds", default_ceiling)),
+        initial=POLL_INTERVAL_SECONDS,
+        backoff=float(get_setting("Monitor-Poll-Backoff", 1.5))
+    )
+
+
+def get_poll_stats():
+    return _poll_scheduler.stats() if _poll_scheduler else {}
+
+
+def renew_poller_lease():
+    renew_lease(POLLER_LEASE)
+
+
+def monitor_emails():
+    global _poll_scheduler
+    register_heartbeat(renew_job_leases)
+    register_heartbeat(renew_poller_lease)
+    start_heartbeat()
+    
+    recovered = recover_in_progress_jobs()
+    if recovered:
+        print(f"Recovered {recovered} job(s) interrupted by the last shutdown")
+    
+    pool = create_processor().start()
+    _poll_scheduler = create_poll_scheduler()
+    print(f"Email monitor started on node {NODE_ID} with {pool.workers} worker(s), "
+          f"polling every {_poll_scheduler.floor:.0f}-{_poll_scheduler.ceiling:.0f} seconds depending on mail volume...")
+    
+    catch_up_enabled = get_setting("Monitor-Catch-Up", "true").lower() == "true"
+    catch_up_after = int(get_setting("Monitor-Catch-Up-After-Seconds", 900))
+    # None forces a catch-up pass on the first successful round after startup
+    last_success = None
+    next_poll = time.time()
+    is_poller = None
+    
+    while not _stop_event.is_set():
+        messages = wait_for_notifications(next_wake_time(next_poll) - time.time())
+        if _stop_event.is_set():
+            break
+        
+        poll_due = time.time() >= next_poll
+        due = next_due_time()
+        jobs_due = due is not None and due <= time.time()
+        if not messages and not poll_due and not jobs_due:
+            continue
+        
+        try:
+            token_data = get_graph_token()
             if not token_data:
-                print("Authentication failed, retrying in 60 seconds...")
-                time.sleep(60)
+                next_poll = _poll_scheduler.defer()
+                print(f"Authentication failed, retrying in {_poll_scheduler.interval:.0f} seconds...")
                 continue
             
-            emails = get_emails(token_data, folder="inbox", limit=10, include_read=False)
+            if messages:
+                print(f"Notified of {len(messages)} new message(s), processing...")
+                enqueue_notified_emails(token_data, messages)
+            
+            if poll_due:
+                was_poller = is_poller
+                is_poller = acquire_lease(POLLER_LEASE)
+                if is_poller != was_poller:
+                    print("This node is now polling the mailbox" if is_poller else "Another node is polling the mailbox, processing shared jobs only")
+                if not is_poller:
+                    # Forces a catch-up pass if this node takes over polling later
+                    last_success = None
             
-            if emails:
-                print(f"Found {len(emails)} unread email(s), processing...")
+            if poll_due and is_poller:
+                _poll_scheduler.start_poll()
+                found = 0
+                arrival_lags = []
                 
-                for email in emails:
-                    email_id = email.get('id')
-                    subject = email.get('subject', 'No Subject')
-                    
-                    cache_path = os.path.join('emails_data', f"{email_id}.json")
-                    if os.path.exists(cache_path):
-                        continue
-                    
-                    print(f"Processing: {subject}")
+                backlog = 0
+                if catch_up_enabled and (last_success is None or time.time() - last_success > catch_up_after):
+                    backlog = catch_up_backlog(token_data)
+                
+                for mailbox_id in get_mailbox_ids():
+                    emails, commit_cursor = fetch_new_emails(token_data, mailbox_id)
                     
-                    result = process_email(token_data, email)
-                    save_processed_email(result)
-                    apply_category_to_email(token_data, email_id, result['category'])
+                    if emails:
+                        print(f"Found {len(emails)} new email(s) in {mailbox_id}, processing...")
+                        found += enqueue_emails(token_data, emails)
+                        arrival_lags.extend(
+                            lag for lag in (seconds_since(email.get('received_datetime')) for email in emails)
+                            if lag is not None
+                        )
                     
-                    print(f"  ✓ Categorized as: {result['category']}")
-                    if result['has_invoice']:
-                        print(f"  ✓ Invoices: {', '.join(result['invoice_numbers'])}")
+                    # Every new email is now a durable job, so the delta cursor can advance before processing
+                    if commit_cursor:
+                        commit_cursor()
+                
+                last_success = time.time()
+                due = next_due_time()
+                next_poll = _poll_scheduler.finish_poll(
+                    found,
+                    backlog=bool(backlog) or (due is not None and due <= time.time()),
+                    arrival_lags=arrival_lags
+                )
+            
+            dispatch_due_jobs(pool, token_data)
             
         except Exception as e:
             print(f"Error in monitor: {e}")
         
-        time.sleep(60)
+        if poll_due and next_poll <= time.time():
+            # The round failed, or this node is not the poller; try again after the current interval
+            next_poll = _poll_scheduler.defer()
+    
+    print("Email monitor stopping, waiting for in-flight emails to finish...")
+    pool.shutdown(wait=True)
+    release_lease(POLLER_LEASE)
+    stop_heartbeat()
+    print("Email monitor stopped")
 
 
 def start_monitor():
-    thread = threading.Thread(target=monitor_emails, daemon=True)
-    thread.start()
+    global _monitor_thread
+    _stop_event.clear()
+    _monitor_thread = threading.Thread(target=monitor_emails, daemon=True)
+    _monitor_thread.start()
+    atexit.register(stop_monitor)
+
 
+def stop_monitor(timeout=None):
+    _stop_event.set()
+    # Wake the loop if it is blocked waiting for notifications
+    _notifications.put(None)
+    if _monitor_thread and _monitor_thread.is_alive():
+        _monitor_thread.join(timeout)
@@ -0,0 +1,118 @@
+import threading
+import queue
+from typing import Any, Callable, Dict, List, Optional
+
+from core.utils.log_manager.log_manager import log_error
+from core.utils.worker_pool import EmailOwnership, report_failure
+
+
+_STOP = object()
+
+
+class PipelineStage:
+    def __init__(self, name: str, handler: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]], workers: int = 1, queue_size: int = 8):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        # Bounded queue in front of every stage; a full queue blocks the upstream stage (backpressure)
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.threads: List[threading.Thread] = []
+
+
+class EmailPipeline:
+    def __init__(self, stages: List[PipelineStage], build_context: Callable[..., Dict[str, Any]], name: str = "email-pipeline",
+                 on_error: Optional[Callable[[str, Exception], Any]] = None):
+        if not stages:
+            raise ValueError("EmailPipeline requires at least one stage")
+        self.stages = stages
+        self.build_context = build_context
+        self.on_error = on_error
+        self.name = name
+        self.workers = sum(stage.workers for stage in stages)
+        self._ownership = EmailOwnership()
+        self._accepting = False
+        self._state_lock = threading.Lock()
+
+    def start(self):
+        with self._state_lock:
+            if self._accepting:
+                return self
+            self._accepting = True
+            for index, stage in enumerate(self.stages):
+                for i in range(stage.workers):
+                    thread = threading.Thread(
+                        target=self._run_stage,
+                        args=(index,),
+                        name=f"{self.name}-{stage.name}-{i + 1}",
+                        daemon=True
+                    )
+                    thread.start()
+                    stage.threads.append(thread)
+        return self
+
+    def submit(self, email_id: str, *args, timeout: Optional[float] = None) -> bool:
+        if not self._accepting:
+            return False
+        if not self._ownership.claim(email_id):
+            return False
+        try:
+            context = self.build_context(email_id, *args)
+            self.stages[0].queue.put((email_id, context), timeout=timeout)
+        except queue.Full:
+            self._ownership.release(email_id)
+            return False
+        except Exception as e:
+            self._ownership.release(email_id)
+            log_error(f"{self.name}: failed to enqueue email {email_id}", e)
+            return False
+        return True
+
+    def is_owned(self, email_id: str) -> bool:
+        return self._ownership.is_owned(email_id)
+
+    def in_flight(self) -> int:
+        return self._ownership.count()
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {stage.name: stage.queue.qsize() for stage in self.stages}
+
+    def shutdown(self, wait: bool = True):
+        with self._state_lock:
+            if not self._accepting:
+                return
+            self._accepting = False
+        # Stop stages front to back so every email already admitted drains through the later stages
+        for stage in self.stages:
+            for _ in stage.threads:
+                stage.queue.put(_STOP)
+            if wait:
+                for thread in stage.threads:
+                    thread.join()
+            stage.threads = []
+
+    def _run_stage(self, index: int):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            item = stage.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                email_id, context = item
+                try:
+                    context = stage.handler(context)
+                except Exception as e:
+                    log_error(f"{self.name}: stage '{stage.name}' failed for email {email_id}", e)
+                    report_failure(self.on_error, email_id, e)
+                    self._ownership.release(email_id)
+                    continue
+
+                # A stage returns None to drop the email from the rest of the pipeline
+                if context is None or next_stage is None:
+                    self._ownership.release(email_id)
+                    continue
+
+                next_stage.queue.put((email_id, context))
+            finally:
+                stage.queue.task_done()
@@ -0,0 +1,83 @@
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+
+def seconds_since(iso_timestamp: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    if not iso_timestamp:
+        return None
+    try:
+        received = datetime.fromisoformat(iso_timestamp.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if received.tzinfo is None:
+        received = received.replace(tzinfo=timezone.utc)
+    return max(0.0, (now if now is not None else time.time()) - received.timestamp())
+
+
+class PollScheduler:
+    def __init__(self, floor: float = 15, ceiling: float = 600, initial: float = 60, backoff: float = 1.5, smoothing: float = 0.2):
+        self.floor = float(floor)
+        self.ceiling = max(float(ceiling), self.floor)
+        self.backoff = max(1.0, float(backoff))
+        self.smoothing = smoothing
+        self.interval = min(max(float(initial), self.floor), self.ceiling)
+        self._lock = threading.Lock()
+        self._scheduled_at: Optional[float] = None
+        self._polls = 0
+        self._idle_polls = 0
+        self._drift_avg = 0.0
+        self._drift_max = 0.0
+        self._lag_avg: Optional[float] = None
+        self._last_found = 0
+
+    def start_poll(self, now: Optional[float] = None) -> float:
+        # Drift is how late a poll started versus when it was scheduled, e.g. because dispatch blocked the loop
+        now = now if now is not None else time.time()
+        with self._lock:
+            drift = max(0.0, now - self._scheduled_at) if self._scheduled_at is not None else 0.0
+            self._drift_avg += self.smoothing * (drift - self._drift_avg)
+            self._drift_max = max(self._drift_max, drift)
+            return drift
+
+    def finish_poll(self, found: int, backlog: bool = False, arrival_lags: Iterable[float] = (), now: Optional[float] = None) -> float:
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._polls += 1
+            self._last_found = found
+            for lag in arrival_lags:
+                self._lag_avg = lag if self._lag_avg is None else self._lag_avg + self.smoothing * (lag - self._lag_avg)
+
+            if found or backlog:
+                # Mail tends to arrive in bursts, so poll again at the floor right away
+                self._idle_polls = 0
+                self.interval = self.floor
+            else:
+                # Idle: stretch the interval a step at a time towards the ceiling
+                self._idle_polls += 1
+                self.interval = min(self.ceiling, self.interval * self.backoff)
+
+            self._scheduled_at = now + self.interval
+            return self._scheduled_at
+
+    def defer(self, now: Optional[float] = None) -> float:
+        # A failed round (e.g. authentication) keeps the current interval without counting as idle
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._scheduled_at = now + self.interval
+            return self._scheduled_at
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "interval_seconds": round(self.interval, 1),
+                "floor_seconds": self.floor,
+                "ceiling_seconds": self.ceiling,
+                "polls": self._polls,
+                "idle_polls": self._idle_polls,
+                "last_found": self._last_found,
+                "avg_drift_seconds": round(self._drift_avg, 2),
+                "max_drift_seconds": round(self._drift_max, 2),
+                "avg_arrival_lag_seconds": round(self._lag_avg, 1) if self._lag_avg is not None else None
+            }
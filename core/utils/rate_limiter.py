@@ -0,0 +1,68 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+from core.utils.secret_manager import get_setting
+
+
+class RateLimiter:
+    def __init__(self, per_minute: Optional[float] = None, burst: Optional[float] = None):
+        self._lock = threading.Lock()
+        self.configure(per_minute, burst)
+
+    def configure(self, per_minute: Optional[float], burst: Optional[float] = None):
+        with self._lock:
+            # None or 0 disables the budget; callers never wait
+            self.per_minute = float(per_minute) if per_minute else None
+            self.rate = self.per_minute / 60.0 if self.per_minute else None
+            self.capacity = float(burst) if burst else max(1.0, (self.per_minute or 0) / 60.0)
+            self._tokens = self.capacity
+            self._updated = time.monotonic()
+
+    def _reserve(self, tokens: float) -> float:
+        # Takes the tokens now and returns how long the caller must wait before using them
+        with self._lock:
+            if self.rate is None:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def adjust(self, tokens: float):
+        # Corrects an earlier estimate without waiting: positive takes more tokens, negative gives some back
+        with self._lock:
+            if self.rate is not None:
+                self._tokens = min(self.capacity, self._tokens - tokens)
+
+    def acquire(self, tokens: float = 1):
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1):
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str) -> RateLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            # e.g. RATE_LIMIT_GRAPH_PER_MINUTE=600; unset means unlimited
+            limiter = RateLimiter(get_setting(f"Rate-Limit-{name}-Per-Minute"), get_setting(f"Rate-Limit-{name}-Burst"))
+            _limiters[name] = limiter
+        return limiter
+
+
+def set_rate_limit(name: str, per_minute: Optional[float], burst: Optional[float] = None):
+    get_rate_limiter(name).configure(per_minute, burst)
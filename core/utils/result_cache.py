@@ -0,0 +1,81 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from core.utils.secret_manager import get_setting
+from core.utils.email_store import get_email_result, message_key
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max(1, int(max_entries))
+        # email_id -> (serialized JSON response, internet message key), most recently used last
+        self._entries: "OrderedDict[str, Tuple[str, Optional[str]]]" = OrderedDict()
+        # internet message id (without <>) -> email_id, only for results still in _entries
+        self._id_index: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, email_result: Dict[str, Any]) -> str:
+        email_id = email_result['email_id']
+        serialized = json.dumps(email_result)
+        key = message_key(email_result.get('internet_message_id'))
+
+        with self._lock:
+            self._drop(email_id)
+            self._entries[email_id] = (serialized, key)
+            if key:
+                self._id_index[key] = email_id
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+        return serialized
+
+    def _drop(self, email_id: str):
+        # Called with the lock held; the index entry goes with its result so both stay bounded
+        entry = self._entries.pop(email_id, None)
+        if entry and entry[1] and self._id_index.get(entry[1]) == email_id:
+            del self._id_index[entry[1]]
+
+    def get(self, lookup_id: str) -> Optional[str]:
+        with self._lock:
+            email_id = lookup_id if lookup_id in self._entries else self._id_index.get(message_key(lookup_id))
+            entry = self._entries.get(email_id) if email_id else None
+            if entry is not None:
+                self._entries.move_to_end(email_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def invalidate(self, email_id: str):
+        with self._lock:
+            self._drop(email_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "indexed_ids": len(self._id_index),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+result_cache = ResultCache(int(get_setting("Result-Cache-Size", 1000)))
+
+
+def cache_email_result(email_result: Dict[str, Any]) -> str:
+    return result_cache.put(email_result)
+
+
+def get_email_result_json(lookup_id: str) -> Optional[str]:
+    serialized = result_cache.get(lookup_id)
+    if serialized is not None:
+        return serialized
+
+    email_result = get_email_result(lookup_id)
+    if email_result is None:
+        return None
+    return result_cache.put(email_result)
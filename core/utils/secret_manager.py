@@ -22,6 +22,20 @@ def get_secret(secret_name):
         raise ValueError(error_msg)
 
 
+def get_setting(setting_name, default=None):
+    try:
+        load_dotenv()
+    except Exception as e:
+        log_error("Failed to load environment variables from .env file", e)
+    
+    env_var_name = setting_name.replace("-", "_").upper()
+    secret_value = os.getenv(env_var_name)
+    
+    if secret_value is None or secret_value == "":
+        return default
+    return secret_value
+
+
 def get_cognito_secrets():
     try:
         cognito_key = get_secret("AWS-Cognito-Key")
@@ -90,12 +104,18 @@ def get_outlook_secrets():
         outlook_client_secret = get_secret("Outlook-Client-Secret")
         outlook_tenant_id = get_secret("Outlook-Tenant-ID")
         outlook_mailbox_id = get_secret("Outlook-Mailbox-ID")
+        # Extra mailboxes to monitor, comma separated; the primary mailbox is always included first
+        outlook_mailbox_ids = [outlook_mailbox_id] + [
+            mailbox.strip() for mailbox in (get_setting("Outlook-Mailbox-IDs") or "").split(",")
+            if mailbox.strip() and mailbox.strip().lower() != outlook_mailbox_id.lower()
+        ]
         
         return {
             'client_id': outlook_client_id,
             'client_secret': outlook_client_secret,
             'tenant_id': outlook_tenant_id,
-            'mailbox_id': outlook_mailbox_id
+            'mailbox_id': outlook_mailbox_id,
+            'mailbox_ids': list(dict.fromkeys(outlook_mailbox_ids))
         }
         
     except Exception as e:
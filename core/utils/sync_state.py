@@ -0,0 +1,51 @@
+import os
+import json
+import threading
+from datetime import datetime, timezone
+
+from core.utils.email_store import DATA_DIR, get_meta, set_meta, delete_meta
+from core.utils.log_manager.log_manager import log_error
+
+
+# Cursors live in the shared store, so a node that takes over the poller lease resumes where the last one stopped
+DELTA_META_PREFIX = "delta_link:"
+LEGACY_SYNC_STATE_PATH = os.path.join(DATA_DIR, 'sync_state.json')
+
+_lock = threading.Lock()
+_legacy_imported = False
+
+
+def _cursor_key(mailbox_id, folder):
+    return f"{DELTA_META_PREFIX}{mailbox_id}/{folder}"
+
+
+def _import_legacy_state():
+    # Cursors used to be kept in a local file; move them into the store once instead of re-running the lookback
+    global _legacy_imported
+    if _legacy_imported:
+        return
+    _legacy_imported = True
+    if get_meta('sync_state_migrated') is not None or not os.path.exists(LEGACY_SYNC_STATE_PATH):
+        return
+    try:
+        with open(LEGACY_SYNC_STATE_PATH, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        for key, delta_link in state.items():
+            if delta_link and get_meta(f"{DELTA_META_PREFIX}{key}") is None:
+                set_meta(f"{DELTA_META_PREFIX}{key}", delta_link)
+        set_meta('sync_state_migrated', datetime.now(timezone.utc).isoformat())
+    except Exception as e:
+        log_error(f"Failed to import sync state from {LEGACY_SYNC_STATE_PATH}", e)
+
+
+def load_delta_link(mailbox_id, folder="inbox"):
+    with _lock:
+        _import_legacy_state()
+    return get_meta(_cursor_key(mailbox_id, folder))
+
+
+def save_delta_link(mailbox_id, delta_link, folder="inbox"):
+    if delta_link:
+        set_meta(_cursor_key(mailbox_id, folder), delta_link)
+    else:
+        delete_meta(_cursor_key(mailbox_id, folder))
@@ -1,26 +1,40 @@
 import sys
 import os
+import asyncio
 from typing import List, Dict, Optional
 from fuzzywuzzy import fuzz
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.integrations.epicor.client import epicor_api_request
+from core.integrations.epicor.client import epicor_api_request, epicor_api_request_async
 
 
-def get_all_vendors(company='SAINC') -> Optional[List[Dict]]:
-    endpoint = 'Erp.BO.VendorSvc/Vendors'
-    
-    params = {
+VENDORS_ENDPOINT = 'Erp.BO.VendorSvc/Vendors'
+
+
+def _vendor_params(company):
+    return {
         '$filter': f"Company eq '{company}'",
         '$select': 'VendorID,Name,VendorNum',
         '$top': 10000
     }
-    
+
+
+def get_all_vendors(company='SAINC') -> Optional[List[Dict]]:
     print(f"\nFetching all vendors from Epicor for company: {company}")
     
-    response = epicor_api_request(endpoint, 'GET', company, params=params, instance_override='KineticLive')
+    response = epicor_api_request(VENDORS_ENDPOINT, 'GET', company, params=_vendor_params(company), instance_override='KineticLive')
+    return _parse_vendors_response(response)
+
+
+async def get_all_vendors_async(http_client, company='SAINC') -> Optional[List[Dict]]:
+    print(f"\nFetching all vendors from Epicor for company: {company}")
     
+    response = await epicor_api_request_async(http_client, VENDORS_ENDPOINT, 'GET', company, params=_vendor_params(company), instance_override='KineticLive')
+    return _parse_vendors_response(response)
+
+
+def _parse_vendors_response(response) -> Optional[List[Dict]]:
     if response and response.status_code == 200:
         data = response.json()
         vendors = data.get('value', [])
@@ -93,3 +107,12 @@ def match_vendor_from_invoice(extracted_name: str, company='SAINC') -> List[Dict
     
     return fuzzy_match_vendor(extracted_name, vendors)
 
+
+async def match_vendor_from_invoice_async(http_client, extracted_name: str, company='SAINC') -> List[Dict]:
+    vendors = await get_all_vendors_async(http_client, company)
+    
+    if not vendors:
+        return []
+    
+    # Scoring every vendor is CPU-bound and would stall the other emails on the event loop
+    return await asyncio.to_thread(fuzzy_match_vendor, extracted_name, vendors)
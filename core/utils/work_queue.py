@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.utils.secret_manager import get_setting
+from core.utils.email_store import get_connection, dedup_key
+from core.utils.leases import NODE_ID, LEASE_SECONDS
+
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+DEAD = "dead"
+
+MAX_ATTEMPTS = int(get_setting("Job-Max-Attempts", 5))
+BACKOFF_BASE_SECONDS = float(get_setting("Job-Backoff-Base-Seconds", 60))
+BACKOFF_MAX_SECONDS = float(get_setting("Job-Backoff-Max-Seconds", 3600))
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _row_to_job(row) -> Dict[str, Any]:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"]) if job.get("payload") else None
+    return job
+
+
+def backoff_seconds(attempts: int) -> float:
+    return min(BACKOFF_BASE_SECONDS * (2 ** max(0, attempts - 1)), BACKOFF_MAX_SECONDS)
+
+
+def job_key_for(email: Dict[str, Any]) -> str:
+    return dedup_key(email['id'], email.get('internet_message_id'))
+
+
+def enqueue_email_job(email: Dict[str, Any]) -> bool:
+    connection = get_connection()
+    now = _now()
+    with connection:
+        # A job that already exists keeps its state; re-discovering an email, or a copy of it
+        # in another mailbox, never resets its attempts or queues the message a second time
+        cursor = connection.execute(
+            """
+            INSERT OR IGNORE INTO email_jobs (job_key, email_id, payload, status, attempts, next_attempt_at, created_at, updated_at)
+            VALUES (?, ?, ?, ?, 0, ?, ?, ?)
+            """,
+            (job_key_for(email), email['id'], json.dumps(email), PENDING, time.time(), now, now)
+        )
+    return cursor.rowcount > 0
+
+
+def claim_due_jobs(limit: int) -> List[Dict[str, Any]]:
+    if limit <= 0:
+        return []
+    connection = get_connection()
+    current_time = time.time()
+    lease_expires_at = current_time + LEASE_SECONDS
+    with connection:
+        # BEGIN IMMEDIATE takes the write lock up front so two claimers (threads or nodes) cannot pick the same rows
+        connection.execute("BEGIN IMMEDIATE")
+        # An in-progress job whose lease lapsed belongs to a node that stopped heartbeating
+        rows = connection.execute(
+            """
+            SELECT * FROM email_jobs
+            WHERE (status IN (?, ?) AND next_attempt_at <= ?)
+               OR (status = ? AND lease_expires_at < ?)
+            ORDER BY next_attempt_at
+            LIMIT ?
+            """,
+            (PENDING, FAILED, current_time, IN_PROGRESS, current_time, limit)
+        ).fetchall()
+        now = _now()
+        for row in rows:
+            connection.execute(
+                """
+                UPDATE email_jobs
+                SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_expires_at = ?, updated_at = ?
+                WHERE job_key = ?
+                """,
+                (IN_PROGRESS, NODE_ID, lease_expires_at, now, row['job_key'])
+            )
+    jobs = [_row_to_job(row) for row in rows]
+    for job in jobs:
+        job["attempts"] += 1
+        job["status"] = IN_PROGRESS
+        job["lease_owner"] = NODE_ID
+        job["lease_expires_at"] = lease_expires_at
+    return jobs
+
+
+def renew_job_leases() -> int:
+    # Heartbeat for every job this node is still working on
+    connection = get_connection()
+    with connection:
+        cursor = connection.execute(
+            "UPDATE email_jobs SET lease_expires_at = ? WHERE status = ? AND lease_owner = ?",
+            (time.time() + LEASE_SECONDS, IN_PROGRESS, NODE_ID)
+        )
+    return cursor.rowcount
+
+
+def mark_job_succeeded(job_key: str) -> bool:
+    connection = get_connection()
+    with connection:
+        # A completion from a node whose lease lapsed is stale; the node that re-claimed the job settles it
+        cursor = connection.execute(
+            """
+            UPDATE email_jobs
+            SET status = ?, last_error = NULL, payload = NULL, lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE job_key = ? AND status = ? AND lease_owner = ?
+            """,
+            (SUCCEEDED, _now(), job_key, IN_PROGRESS, NODE_ID)
+        )
+    return cursor.rowcount > 0
+
+
+def mark_job_failed(job_key: str, error: str) -> Optional[str]:
+    connection = get_connection()
+    with connection:
+        # If the lease lapsed and another node re-claimed the job, that node's attempt decides its state
+        row = connection.execute(
+            "SELECT attempts FROM email_jobs WHERE job_key = ? AND status = ? AND lease_owner = ?",
+            (job_key, IN_PROGRESS, NODE_ID)
+        ).fetchone()
+        if row is None:
+            return None
+        attempts = row['attempts']
+        if attempts >= MAX_ATTEMPTS:
+            status = DEAD
+            next_attempt_at = time.time()
+        else:
+            status = FAILED
+            next_attempt_at = time.time() + backoff_seconds(attempts)
+        connection.execute(
+            """
+            UPDATE email_jobs
+            SET status = ?, next_attempt_at = ?, last_error = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE job_key = ?
+            """,
+            (status, next_attempt_at, error[:2000], _now(), job_key)
+        )
+    return status
+
+
+def release_job(job_key: str):
+    # Hand a claimed job back without counting the attempt, e.g. when the processor is shutting down
+    connection = get_connection()
+    with connection:
+        connection.execute(
+            """
+            UPDATE email_jobs
+            SET status = ?, attempts = MAX(attempts - 1, 0), lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE job_key = ? AND status = ? AND lease_owner = ?
+            """,
+            (PENDING, _now(), job_key, IN_PROGRESS, NODE_ID)
+        )
+
+
+def recover_in_progress_jobs() -> int:
+    # Jobs held under this node id (or claimed before leases existed) were interrupted by a crash.
+    # Other nodes' jobs are left alone; they become claimable once their leases expire.
+    connection = get_connection()
+    with connection:
+        cursor = connection.execute(
+            """
+            UPDATE email_jobs
+            SET status = ?, next_attempt_at = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE status = ? AND (lease_owner = ? OR lease_owner IS NULL)
+            """,
+            (PENDING, time.time(), _now(), IN_PROGRESS, NODE_ID)
+        )
+    return cursor.rowcount
+
+
+def requeue_dead_job(job_key: str) -> bool:
+    connection = get_connection()
+    with connection:
+        cursor = connection.execute(
+            "UPDATE email_jobs SET status = ?, attempts = 0, next_attempt_at = ?, updated_at = ? WHERE job_key = ? AND status = ?",
+            (PENDING, time.time(), _now(), job_key, DEAD)
+        )
+    return cursor.rowcount > 0
+
+
+def get_job_counts() -> Dict[str, int]:
+    rows = get_connection().execute("SELECT status, COUNT(*) AS count FROM email_jobs GROUP BY status").fetchall()
+    return {row['status']: row['count'] for row in rows}
+
+
+def get_dead_jobs(limit: int = 100) -> List[Dict[str, Any]]:
+    rows = get_connection().execute(
+        "SELECT job_key, email_id, attempts, last_error, updated_at FROM email_jobs WHERE status = ? ORDER BY updated_at DESC LIMIT ?",
+        (DEAD, limit)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def next_due_time() -> Optional[float]:
+    row = get_connection().execute(
+        """
+        SELECT MIN(CASE WHEN status = ? THEN lease_expires_at ELSE next_attempt_at END) AS due
+        FROM email_jobs WHERE status IN (?, ?, ?)
+        """,
+        (IN_PROGRESS, PENDING, FAILED, IN_PROGRESS)
+    ).fetchone()
+    return row['due'] if row else None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "requeue":
+        for job_key in sys.argv[2:]:
+            print(f"{job_key}: {'requeued' if requeue_dead_job(job_key) else 'not a dead job'}")
+    else:
+        print(f"Job counts: {get_job_counts()}")
+        for job in get_dead_jobs():
+            print(f"  {job['job_key']} ({job['attempts']} attempts, {job['updated_at']}): {job['last_error']}")
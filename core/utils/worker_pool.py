@@ -0,0 +1,119 @@
+import threading
+import queue
+from typing import Any, Callable, Optional, Set
+
+from core.utils.log_manager.log_manager import log_error
+
+
+_STOP = object()
+
+
+def report_failure(on_error, email_id, error):
+    if on_error is None:
+        return
+    try:
+        on_error(email_id, error)
+    except Exception as e:
+        log_error(f"Failed to record failure for email {email_id}", e)
+
+
+class EmailOwnership:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owned: Set[str] = set()
+
+    def claim(self, email_id: str) -> bool:
+        with self._lock:
+            if email_id in self._owned:
+                return False
+            self._owned.add(email_id)
+            return True
+
+    def release(self, email_id: str):
+        with self._lock:
+            self._owned.discard(email_id)
+
+    def is_owned(self, email_id: str) -> bool:
+        with self._lock:
+            return email_id in self._owned
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._owned)
+
+
+class EmailWorkerPool:
+    def __init__(self, handler: Callable[..., Any], workers: int = 4, queue_size: Optional[int] = None, name: str = "email-worker",
+                 on_error: Optional[Callable[[str, Exception], Any]] = None):
+        self.handler = handler
+        self.on_error = on_error
+        self.workers = max(1, int(workers))
+        self.name = name
+        # Bounded so a burst of emails blocks the producer instead of growing memory
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size if queue_size is not None else self.workers * 2)
+        self._ownership = EmailOwnership()
+        self._threads = []
+        self._accepting = False
+        self._state_lock = threading.Lock()
+
+    def start(self):
+        with self._state_lock:
+            if self._accepting:
+                return self
+            self._accepting = True
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{i + 1}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def submit(self, email_id: str, *args, timeout: Optional[float] = None) -> bool:
+        if not self._accepting:
+            return False
+        if not self._ownership.claim(email_id):
+            return False
+        try:
+            self._queue.put((email_id, args), timeout=timeout)
+        except queue.Full:
+            self._ownership.release(email_id)
+            return False
+        return True
+
+    def is_owned(self, email_id: str) -> bool:
+        return self._ownership.is_owned(email_id)
+
+    def in_flight(self) -> int:
+        return self._ownership.count()
+
+    def wait_idle(self):
+        self._queue.join()
+
+    def shutdown(self, wait: bool = True):
+        with self._state_lock:
+            if not self._accepting:
+                return
+            self._accepting = False
+        # Sentinels queue up behind any already-submitted work, so nothing in flight is dropped
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                email_id, args = item
+                try:
+                    self.handler(email_id, *args)
+                except Exception as e:
+                    log_error(f"{self.name}: failed to process email {email_id}", e)
+                    report_failure(self.on_error, email_id, e)
+                finally:
+                    self._ownership.release(email_id)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,177 @@
+import sys
+import os
+import time
+import argparse
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.integrations.outlook.client import get_graph_token, iter_email_pages_between
+from core.utils.secret_manager import get_outlook_secrets
+from core.utils.email_store import get_meta, set_meta, is_email_processed, get_email_result, record_email_copy
+from core.utils.email_processor import process_email
+from core.utils.monitor_system import persist_result, categorize_copies
+from core.utils.work_queue import job_key_for, enqueue_email_job
+from core.utils.worker_pool import EmailWorkerPool
+from core.utils.batch_email_processor import process_emails_in_batch, resume_pending_batches
+from core.utils.rate_limiter import set_rate_limit
+
+
+# Emails gathered across pages before a batch round; each holds its fetched attachments in memory until then
+DEFAULT_BATCH_EMAILS = 500
+
+
+def to_graph_datetime(value):
+    # Accepts a date or a full ISO timestamp and returns the UTC form Graph filters expect
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def checkpoint_key(mailbox_id, folder, start, end):
+    return f"backfill:{mailbox_id}/{folder or 'all'}:{start}:{end}"
+
+
+def backfill_email(job_key, token_data, email):
+    print(f"Processing: {email.get('subject', 'No Subject')} ({email.get('received_datetime')})")
+    result = process_email(token_data, email)
+    persist_result(token_data, result)
+
+
+def run_backfill(start, end, mailbox_id=None, folder=None, workers=4, page_size=50, restart=False, batch=False,
+                 batch_size=DEFAULT_BATCH_EMAILS):
+    mailbox_id = mailbox_id or get_outlook_secrets()['mailbox_id']
+    start = to_graph_datetime(start)
+    end = to_graph_datetime(end)
+    key = checkpoint_key(mailbox_id, folder, start, end)
+    
+    resume_from = None if restart else get_meta(key)
+    window_start = resume_from or start
+    
+    print(f"\n{'='*80}")
+    print(f"Backfilling {mailbox_id}/{folder or 'all folders'} from {start} to {end}")
+    if resume_from:
+        print(f"Resuming from checkpoint {resume_from}")
+    print(f"{'='*80}\n")
+    
+    token_data = get_graph_token()
+    if not token_data:
+        print("❌ Failed to authenticate with Graph API")
+        return
+    
+    page_emails = {}
+    batch_emails = []
+    last_page = None
+    failed = []
+    
+    def requeue_failure(job_key, error):
+        # Failures become monitor jobs so they are retried with backoff instead of being lost behind the checkpoint
+        email = page_emails.get(job_key)
+        if email:
+            enqueue_email_job(email)
+        failed.append(job_key)
+    
+    def requeue_batch_failure(email, error):
+        enqueue_email_job(email)
+        failed.append(job_key_for(email))
+    
+    pool = EmailWorkerPool(backfill_email, workers=workers, name="backfill-worker", on_error=requeue_failure).start()
+    if batch:
+        # Collect batches a previous run submitted but never read back
+        resume_pending_batches()
+    
+    submitted = skipped = 0
+    started = time.time()
+    
+    def checkpoint(received_datetime):
+        set_meta(key, received_datetime)
+        print(f"Checkpoint {received_datetime}: {submitted} processed, {skipped} skipped, "
+              f"{len(failed)} failed ({time.time() - started:.0f}s)")
+    
+    try:
+        for page in iter_email_pages_between(token_data, window_start, end, mailbox_id, folder, page_size):
+            page_emails.clear()
+            for email in page:
+                if is_email_processed(email['id']):
+                    skipped += 1
+                    continue
+                
+                record_email_copy(email)
+                # Already processed through another mailbox's copy; just link this one
+                result = get_email_result(email['id'])
+                if result:
+                    categorize_copies(token_data, result)
+                    skipped += 1
+                    continue
+                
+                job_key = job_key_for(email)
+                page_emails[job_key] = email
+                if batch:
+                    continue
+                if pool.submit(job_key, token_data, email):
+                    submitted += 1
+            
+            if batch:
+                # Pages pile up until a batch is full, so each wait on OpenAI covers as many emails as it can;
+                # the checkpoint only moves once the batch has been read back
+                batch_emails.extend(page_emails.values())
+                if len(batch_emails) < batch_size:
+                    last_page = page
+                    continue
+                submitted += process_emails_in_batch(token_data, batch_emails, persist_result, requeue_batch_failure)
+                batch_emails = []
+            
+            # Only checkpoint once every email on the page has been stored (or handed to the job queue)
+            pool.wait_idle()
+            last_page = None
+            if page:
+                checkpoint(page[-1]['received_datetime'])
+        
+        if batch_emails:
+            submitted += process_emails_in_batch(token_data, batch_emails, persist_result, requeue_batch_failure)
+        if last_page:
+            checkpoint(last_page[-1]['received_datetime'])
+    
+    except KeyboardInterrupt:
+        print("\nInterrupted, finishing in-flight emails; rerun the same command to resume")
+    
+    finally:
+        pool.shutdown(wait=True)
+    
+    print(f"\n✓ Backfill finished: {submitted} processed, {skipped} skipped, {len(failed)} queued for retry")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the classify/extract pipeline over historical mail")
+    parser.add_argument("--start", required=True, help="Start date (inclusive), e.g. 2024-05-01")
+    parser.add_argument("--end", default=datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                        help="End date (exclusive), defaults to now")
+    parser.add_argument("--mailbox", help="Mailbox to backfill, defaults to OUTLOOK_MAILBOX_ID")
+    parser.add_argument("--folder", help="Mail folder, e.g. inbox; defaults to all folders")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--graph-per-minute", type=float, help="Graph request budget")
+    parser.add_argument("--openai-per-minute", type=float, help="OpenAI request budget")
+    parser.add_argument("--epicor-per-minute", type=float, help="Epicor request budget")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint for this range")
+    parser.add_argument("--batch", action="store_true",
+                        help="Send classification/extraction through the OpenAI Batch API")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_EMAILS,
+                        help="Emails gathered across pages before a batch is submitted; lower it to bound memory")
+    args = parser.parse_args()
+    
+    # Budgets given here override RATE_LIMIT_*_PER_MINUTE from .env for this run
+    if args.graph_per_minute:
+        set_rate_limit("Graph", args.graph_per_minute)
+    if args.openai_per_minute:
+        set_rate_limit("OpenAI", args.openai_per_minute)
+    if args.epicor_per_minute:
+        set_rate_limit("Epicor", args.epicor_per_minute)
+    
+    run_backfill(args.start, args.end, args.mailbox, args.folder, args.workers, args.page_size, args.restart, args.batch,
+                 args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ from pathlib import Path
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.integrations.outlook.client import authenticate_graph_api, graph_api_request, get_email_attachments
+from core.integrations.outlook.client import get_graph_token, graph_api_request, get_email_attachments
 
 
 def extract_emails_from_mailbox(mailbox_email, limit=100):
@@ -14,7 +14,7 @@ def extract_emails_from_mailbox(mailbox_email, limit=100):
     print(f"Extracting up to {limit} emails from mailbox: {mailbox_email}")
     print(f"{'='*80}\n")
     
-    token_data = authenticate_graph_api()
+    token_data = get_graph_token()
     if not token_data:
         print("❌ Failed to authenticate with Graph API")
         return
@@ -0,0 +1,226 @@
+import re
+import sys
+import uuid
+import threading
+from datetime import datetime, timezone
+
+import requests
+from flask import Flask, jsonify, request
+
+# Local stand-in for the parts of Microsoft Graph the monitor uses.
+# Point the app at it with:
+#   GRAPH_BASE_URL=http://localhost:5001/v1.0
+#   GRAPH_LOGIN_URL=http://localhost:5001
+#   GRAPH_NOTIFICATION_URL=https://localhost:5000/api/graph/notifications
+# then inject mail with:  curl -X POST localhost:5001/dev/messages -H "Content-Type: application/json" -d '{"subject": "Invoice 123"}'
+
+app = Flask(__name__)
+
+_lock = threading.Lock()
+_messages = {}
+_order = []
+_subscriptions = {}
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _make_message(data):
+    message_id = data.get('id') or f"stub-{uuid.uuid4().hex}"
+    sender = {"emailAddress": {"address": data.get('sender_email', 'vendor@example.com'), "name": data.get('sender_name', 'Stub Vendor')}}
+    return {
+        "id": message_id,
+        "subject": data.get('subject', 'Stub message'),
+        "sender": sender,
+        "from": sender,
+        "toRecipients": [{"emailAddress": {"address": "ap@example.com", "name": "AP"}}],
+        "receivedDateTime": data.get('receivedDateTime', _now()),
+        "createdDateTime": _now(),
+        "body": {"contentType": "text", "content": data.get('body', 'Please find the invoice attached.')},
+        "bodyPreview": data.get('body', 'Please find the invoice attached.')[:255],
+        "isRead": data.get('isRead', False),
+        "importance": "normal",
+        "hasAttachments": bool(data.get('attachments')),
+        "internetMessageId": data.get('internetMessageId', f"<{uuid.uuid4().hex}@stub.local>"),
+        "conversationId": uuid.uuid4().hex,
+        "categories": [],
+        "_attachments": data.get('attachments', [])
+    }
+
+
+def _public(message, select=None):
+    fields = {k: v for k, v in message.items() if not k.startswith('_')}
+    if select:
+        wanted = set(select.split(',')) | {'id'}
+        fields = {k: v for k, v in fields.items() if k in wanted}
+    return fields
+
+
+def _notify(message):
+    for subscription in list(_subscriptions.values()):
+        payload = {
+            "value": [{
+                "subscriptionId": subscription['id'],
+                "clientState": subscription.get('clientState'),
+                "changeType": "created",
+                "resource": f"Users/{subscription['resource'].split('/')[1]}/Messages/{message['id']}",
+                "resourceData": {"@odata.type": "#Microsoft.Graph.Message", "id": message['id']}
+            }]
+        }
+        try:
+            requests.post(subscription['notificationUrl'], json=payload, timeout=10, verify=False)
+        except Exception as e:
+            print(f"Notification to {subscription['notificationUrl']} failed: {e}")
+
+
+@app.route('/<tenant_id>/oauth2/v2.0/token', methods=['POST'])
+def token(tenant_id):
+    return jsonify({"access_token": f"stub-token-{uuid.uuid4().hex}", "token_type": "Bearer", "expires_in": 3600, "scope": "https://graph.microsoft.com/.default"})
+
+
+@app.route('/v1.0/users/<mailbox_id>/mailFolders/<folder>/messages')
+@app.route('/v1.0/users/<mailbox_id>/messages')
+def list_messages(mailbox_id, folder=None):
+    top = int(request.args.get('$top', 10))
+    skip = int(request.args.get('$skip', 0))
+    query_filter = request.args.get('$filter', '')
+    unread_only = 'isRead eq false' in query_filter
+    received_from = re.search(r"receivedDateTime ge (\S+)", query_filter)
+    received_to = re.search(r"receivedDateTime lt (\S+)", query_filter)
+
+    with _lock:
+        messages = [_messages[i] for i in reversed(_order)]
+    if unread_only:
+        messages = [m for m in messages if not m['isRead']]
+    # ISO timestamps in the same format compare correctly as strings
+    if received_from:
+        messages = [m for m in messages if m['receivedDateTime'] >= received_from.group(1)]
+    if received_to:
+        messages = [m for m in messages if m['receivedDateTime'] < received_to.group(1)]
+    if request.args.get('$orderby') == 'receivedDateTime asc':
+        messages.sort(key=lambda m: m['receivedDateTime'])
+
+    page = messages[skip:skip + top]
+    result = {"value": [_public(m, request.args.get('$select')) for m in page]}
+    if skip + top < len(messages):
+        args = dict(request.args)
+        args['$skip'] = str(skip + top)
+        query = '&'.join(f"{k}={v}" for k, v in args.items())
+        result['@odata.nextLink'] = f"{request.base_url}?{query}"
+    return jsonify(result)
+
+
+@app.route('/v1.0/users/<mailbox_id>/mailFolders/<folder>/messages/delta')
+def delta_messages(mailbox_id, folder):
+    # The delta token is simply the position in the insertion log
+    position = int(request.args.get('$deltatoken', 0))
+    page_size = 50
+    prefer = request.headers.get('Prefer', '')
+    if 'odata.maxpagesize=' in prefer:
+        page_size = int(prefer.split('odata.maxpagesize=')[1].split(',')[0])
+    select = request.args.get('$select')
+
+    with _lock:
+        changed = [_public(_messages[i], select) for i in _order[position:position + page_size]]
+        end = min(position + page_size, len(_order))
+        more = end < len(_order)
+
+    result = {"value": changed}
+    if more:
+        result['@odata.nextLink'] = f"{request.base_url}?$deltatoken={end}"
+    else:
+        result['@odata.deltaLink'] = f"{request.base_url}?$deltatoken={end}"
+    return jsonify(result)
+
+
+@app.route('/v1.0/users/<mailbox_id>/messages/<message_id>', methods=['GET', 'PATCH'])
+def message(mailbox_id, message_id):
+    with _lock:
+        found = _messages.get(message_id)
+        if not found:
+            return jsonify({"error": {"code": "ErrorItemNotFound"}}), 404
+        if request.method == 'PATCH':
+            for key, value in (request.get_json(silent=True) or {}).items():
+                found[key] = value
+    return jsonify(_public(found, request.args.get('$select')))
+
+
+@app.route('/v1.0/users/<mailbox_id>/messages/<message_id>/attachments')
+def attachments(mailbox_id, message_id):
+    with _lock:
+        found = _messages.get(message_id)
+    if not found:
+        return jsonify({"error": {"code": "ErrorItemNotFound"}}), 404
+    return jsonify({"value": found['_attachments']})
+
+
+@app.route('/v1.0/subscriptions', methods=['GET', 'POST'])
+def subscriptions():
+    if request.method == 'GET':
+        return jsonify({"value": list(_subscriptions.values())})
+
+    data = request.get_json()
+    validation_token = uuid.uuid4().hex
+    # Same handshake Graph performs: the endpoint must echo the token as text/plain
+    try:
+        response = requests.post(data['notificationUrl'], params={'validationToken': validation_token}, timeout=10, verify=False)
+    except Exception as e:
+        return jsonify({"error": {"code": "ValidationError", "message": str(e)}}), 400
+    if response.status_code != 200 or response.text != validation_token:
+        return jsonify({"error": {"code": "ValidationError", "message": "Subscription validation request failed"}}), 400
+
+    subscription = dict(data, id=uuid.uuid4().hex)
+    _subscriptions[subscription['id']] = subscription
+    return jsonify(subscription), 201
+
+
+@app.route('/v1.0/subscriptions/<subscription_id>', methods=['PATCH', 'DELETE'])
+def subscription(subscription_id):
+    if subscription_id not in _subscriptions:
+        return jsonify({"error": {"code": "ResourceNotFound"}}), 404
+    if request.method == 'DELETE':
+        _subscriptions.pop(subscription_id)
+        return '', 204
+    _subscriptions[subscription_id].update(request.get_json() or {})
+    return jsonify(_subscriptions[subscription_id])
+
+
+@app.route('/v1.0/$batch', methods=['POST'])
+def batch():
+    requests_list = (request.get_json() or {}).get('requests', [])
+    if len(requests_list) > 20:
+        return jsonify({"error": {"code": "BadRequest", "message": "Number of batch requests exceeds 20"}}), 400
+
+    responses = []
+    client = app.test_client()
+    for sub_request in requests_list:
+        # Sub-request URLs are relative to the version root, same as real Graph
+        sub_response = client.open(
+            f"/v1.0{sub_request['url']}",
+            method=sub_request['method'],
+            json=sub_request.get('body'),
+            headers={'Authorization': request.headers.get('Authorization', '')}
+        )
+        responses.append({
+            "id": sub_request['id'],
+            "status": sub_response.status_code,
+            "body": sub_response.get_json(silent=True)
+        })
+    return jsonify({"responses": responses})
+
+
+@app.route('/dev/messages', methods=['POST'])
+def inject_message():
+    message = _make_message(request.get_json(silent=True) or {})
+    with _lock:
+        _messages[message['id']] = message
+        _order.append(message['id'])
+    threading.Thread(target=_notify, args=(message,), daemon=True).start()
+    return jsonify(_public(message)), 201
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5001
+    print(f"Graph stub listening on http://localhost:{port} (base URL http://localhost:{port}/v1.0)")
+    app.run(port=port, threaded=True)
@@ -0,0 +1,152 @@
+import sys
+import json
+import time
+import uuid
+import threading
+
+from flask import Flask, jsonify, request, Response
+
+# Local stand-in for the OpenAI Files and Batch endpoints used by the batch path.
+# Point the batch client at it with:
+#   OPENAI_BATCH_BASE_URL=http://localhost:5002/v1
+#   OPENAI_BATCH_POLL_SECONDS=1
+# Batches complete on the first status check; each answer is generated from the request's json_schema,
+# classifying anything that mentions "invoice" as new_invoice.
+
+app = Flask(__name__)
+
+_lock = threading.Lock()
+_files = {}
+_batches = {}
+
+
+def _request_text(body):
+    texts = []
+    for message in body.get('input', []):
+        content = message.get('content')
+        if message.get('role') == 'system':
+            continue
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content or []:
+            if part.get('type') == 'input_text':
+                texts.append(part.get('text', ''))
+    return "\n".join(texts)
+
+
+def _fake_value(schema, defs, is_invoice):
+    if '$ref' in schema:
+        return _fake_value(defs[schema['$ref'].split('/')[-1]], defs, is_invoice)
+    if 'anyOf' in schema:
+        options = [option for option in schema['anyOf'] if option.get('type') != 'null']
+        return _fake_value(options[0], defs, is_invoice) if options else None
+    if 'enum' in schema:
+        if is_invoice and 'new_invoice' in schema['enum']:
+            return 'new_invoice'
+        return 'other' if 'other' in schema['enum'] else schema['enum'][0]
+    
+    kind = schema.get('type')
+    if kind == 'object':
+        return {name: _fake_value(prop, defs, is_invoice) for name, prop in schema.get('properties', {}).items()}
+    if kind == 'array':
+        return []
+    if kind == 'boolean':
+        return is_invoice
+    if kind in ('number', 'integer'):
+        return 0
+    return "stub"
+
+
+def _answer(line):
+    body = line['body']
+    schema = body['text']['format']['schema']
+    is_invoice = 'invoice' in _request_text(body).lower()
+    text = json.dumps(_fake_value(schema, schema.get('$defs', {}), is_invoice))
+    return {
+        "id": f"batch_req_{uuid.uuid4().hex}",
+        "custom_id": line['custom_id'],
+        "response": {
+            "status_code": 200,
+            "request_id": uuid.uuid4().hex,
+            "body": {
+                "id": f"resp_{uuid.uuid4().hex}",
+                "object": "response",
+                "model": body.get('model'),
+                "output": [{"type": "message", "role": "assistant", "content": [{"type": "output_text", "text": text}]}]
+            }
+        },
+        "error": None
+    }
+
+
+def _file_object(file_id, filename, purpose, size):
+    return {"id": file_id, "object": "file", "bytes": size, "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed"}
+
+
+@app.route('/v1/files', methods=['POST'])
+def create_file():
+    upload = request.files['file']
+    content = upload.read()
+    file_id = f"file-{uuid.uuid4().hex}"
+    with _lock:
+        _files[file_id] = content
+    return jsonify(_file_object(file_id, upload.filename, request.form.get('purpose', 'batch'), len(content)))
+
+
+@app.route('/v1/files/<file_id>/content', methods=['GET'])
+def file_content(file_id):
+    with _lock:
+        content = _files.get(file_id)
+    if content is None:
+        return jsonify({"error": {"message": "No such file"}}), 404
+    return Response(content, mimetype='application/jsonl')
+
+
+@app.route('/v1/batches', methods=['POST'])
+def create_batch():
+    data = request.get_json()
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    batch = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": data['endpoint'],
+        "input_file_id": data['input_file_id'],
+        "completion_window": data.get('completion_window', '24h'),
+        "status": "validating",
+        "created_at": int(time.time()),
+        "output_file_id": None,
+        "error_file_id": None,
+        "request_counts": {"total": 0, "completed": 0, "failed": 0}
+    }
+    with _lock:
+        _batches[batch_id] = batch
+    return jsonify(batch)
+
+
+@app.route('/v1/batches/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    with _lock:
+        batch = _batches.get(batch_id)
+        if batch is None:
+            return jsonify({"error": {"message": "No such batch"}}), 404
+        
+        if batch['status'] == 'validating':
+            lines = [json.loads(line) for line in _files[batch['input_file_id']].decode('utf-8').splitlines() if line.strip()]
+            output = "\n".join(json.dumps(_answer(line)) for line in lines) + "\n"
+            output_file_id = f"file-{uuid.uuid4().hex}"
+            _files[output_file_id] = output.encode('utf-8')
+            batch.update({
+                "status": "completed",
+                "output_file_id": output_file_id,
+                "completed_at": int(time.time()),
+                "request_counts": {"total": len(lines), "completed": len(lines), "failed": 0}
+            })
+        return jsonify(batch)
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5002
+    print(f"OpenAI batch stub listening on http://localhost:{port} (base URL http://localhost:{port}/v1)")
+    app.run(port=port, threaded=True)
@@ -28,7 +28,7 @@ function loadEmailData() {
         .then(response => {
             if (!response.ok) {
                 if (response.status === 404) {
-                    throw new Error('Email not processed yet. Please wait up to 1 minute and refresh.');
+                    throw new Error('Email not processed yet. Please wait a few seconds and refresh.');
                 }
                 throw new Error('Unable to load email data');
             }